@@ -0,0 +1,81 @@
+"""
+Time the JSON decoding paths of the pipeline under each json_codec
+backend: decoding the COCO file of a split and loading it with
+load_coco. Streaming the raw labels and writing COCO use the stdlib
+under both backends and are not compared.
+
+Usage:
+    python scripts/benchmark_json_codec.py [--split train] [--repeat 3]
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+from autonomous_vision.config import Config
+from autonomous_vision.data_parser.bdd_to_coco import create_coco_dataset
+from autonomous_vision.object_detection.data_loader import load_coco
+from autonomous_vision.utils import json_codec
+from autonomous_vision.utils.helper import open_binary
+
+STAGES = ("decode", "load_coco")
+
+
+def best_of(repeat: int, fn) -> float:
+    """Fastest wall time of fn over repeat runs."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def decode(path: Path):
+    with open_binary(path) as f:
+        return json_codec.load(f)
+
+
+def benchmark(labels: Path, split: str, repeat: int, out_dir: Path):
+    backends = ["stdlib"]
+    if json_codec.orjson is not None:
+        backends.append("orjson")
+
+    coco_path = out_dir / f"{split}.json"
+    create_coco_dataset(labels, coco_path, split)
+    size = coco_path.stat().st_size / 2**20
+    print(f"{coco_path.name}: {size:.1f} MiB")
+
+    results = {}
+    for name in backends:
+        json_codec.set_backend(name)
+        results[name] = {
+            "decode": best_of(repeat, lambda: decode(coco_path)),
+            "load_coco": best_of(repeat, lambda: load_coco(coco_path)),
+        }
+
+    print(f"{'Stage':<10} " + " ".join(f"{b:>10}" for b in backends))
+    for stage in STAGES:
+        row = " ".join(f"{results[b][stage]:>9.3f}s" for b in backends)
+        if len(backends) > 1:
+            speedup = results["stdlib"][stage] / results["orjson"][stage]
+            row += f"  x{speedup:.2f}"
+        print(f"{stage:<10} {row}")
+    if len(backends) == 1:
+        print("orjson is not installed; only the stdlib was timed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--split", choices=["train", "val"], default="train")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    labels = {"train": Config.train_labels, "val": Config.val_labels}
+    with tempfile.TemporaryDirectory() as tmp:
+        benchmark(labels[args.split], args.split, args.repeat, Path(tmp))
+
+
+if __name__ == "__main__":
+    main()
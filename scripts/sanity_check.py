@@ -1,25 +1,27 @@
-import json
 import sys
 from collections import Counter
-from pathlib import Path
 
 import pandas as pd
 
+from autonomous_vision.config import Config
+from autonomous_vision.utils import json_codec
+from autonomous_vision.utils.helper import open_binary
+
 
 def sanity_check():
     """Perform sanity check across json, csv and parquet files after parsing"""
 
     # File paths for both train and val
     train_files = {
-        "COCO": Path("data/coco_data/bdd100k_train_coco.json"),
-        "CSV": Path("data/parsed_data/train_data.csv"),
-        "Parquet": Path("data/parsed_data/train_data.parquet"),
+        "COCO": Config.train_json,
+        "CSV": Config.parsed_data / "train_data.csv",
+        "Parquet": Config.parsed_data / "train_data.parquet",
     }
 
     val_files = {
-        "COCO": Path("data/coco_data/bdd100k_val_coco.json"),
-        "CSV": Path("data/parsed_data/val_data.csv"),
-        "Parquet": Path("data/parsed_data/val_data.parquet"),
+        "COCO": Config.val_json,
+        "CSV": Config.parsed_data / "val_data.csv",
+        "Parquet": Config.parsed_data / "val_data.parquet",
     }
 
     # Check if all files exist
@@ -52,15 +54,15 @@ def sanity_check():
 
     # Training data
     print("  Loading training data...")
-    with open(train_files["COCO"], "r", encoding="utf-8") as f:
-        train_coco = json.load(f)
+    with open_binary(train_files["COCO"]) as f:
+        train_coco = json_codec.load(f)
     train_csv = pd.read_csv(train_files["CSV"])
     train_parquet = pd.read_parquet(train_files["Parquet"])
 
     # Validation data
     print("  Loading validation data...")
-    with open(val_files["COCO"], "r", encoding="utf-8") as f:
-        val_coco = json.load(f)
+    with open_binary(val_files["COCO"]) as f:
+        val_coco = json_codec.load(f)
     val_csv = pd.read_csv(val_files["CSV"])
     val_parquet = pd.read_parquet(val_files["Parquet"])
 
@@ -1,5 +1,5 @@
 from pathlib import Path
-from typing import ClassVar
+from typing import ClassVar, Literal
 
 from pydantic_settings import BaseSettings
 
@@ -23,14 +23,56 @@ class Config(BaseSettings):
     val_images: Path = project_root / "data/yolo_data/images/val"
     train_labels_yolo: Path = project_root / "data/yolo_data/labels/train"
     val_labels_yolo: Path = project_root / "data/yolo_data/labels/val"
+    # Images without annotations, given empty label files
+    unlabeled_train_list: Path = (
+        project_root / "data/lists/unlabeled_train.txt"
+    )
+    # Packed single-file label archives (label_utils.LabelArchive)
+    train_labels_archive: Path = (
+        project_root / "data/yolo_data/labels_packed/train.yolopack"
+    )
+    val_labels_archive: Path = (
+        project_root / "data/yolo_data/labels_packed/val.yolopack"
+    )
+    # Threads writing changed label files
+    label_write_workers: int = 8
+    # Persistent image directory indexes (utils/image_index.py)
+    image_index_dir: Path = project_root / "data/image_index"
+    # Threads listing changed image directories
+    image_index_workers: int = 8
+    # Train from train images pre-resized for imgsz (val stays original;
+    # object_detection/image_cache)
+    use_image_cache: bool = False
+    image_cache_dir: Path = project_root / "data/yolo_data/image_cache"
+    image_cache_quality: int = 95
+    # Resize processes (0 = one per CPU core)
+    image_cache_workers: int = 0
     dataset_yaml: Path = project_root / "data/yolo_data/dataset.yaml"
 
     # Parsed data (CSV/Parquet)
     parsed_data: Path = project_root / "data/parsed_data"
+    # Hive-partitioned copy (split/timeofday/weather/scene) of the Parquet
+    parquet_dataset: Path = project_root / "data/parsed_data/bdd_dataset"
+    # Fingerprints of pipeline inputs/outputs used to skip fresh stages
+    manifest_path: Path = project_root / "data/parsed_data/manifest.json"
 
     # COCO format data
     coco_data: Path = project_root / "data/coco_data"
 
+    # Memory-mapped annotation store (one directory per split)
+    annotation_store: Path = project_root / "data/annotation_store"
+
+    # Parser processes per split (0 = one per CPU core, 1 = serial)
+    parse_workers: int = 1
+    # Also write CSV next to the Parquet files
+    write_csv: bool = True
+    # Also write the hive-partitioned dataset under parquet_dataset
+    partitioned_parquet: bool = False
+    # Record validation: per-record Pydantic ("strict") or chunked ("bulk")
+    validation_mode: Literal["strict", "bulk"] = "strict"
+    # JSON decoding: orjson when installed ("auto"), or forced
+    json_backend: Literal["auto", "orjson", "stdlib"] = "auto"
+
     detection_classes: list[str] = [
         "person",
         "rider",
@@ -48,9 +90,11 @@ class Config(BaseSettings):
     BDD100K_WIDTH: int = 1280
     BDD100K_HEIGHT: int = 720
 
-    # COCO JSON files
+    # COCO JSON files (a .json.gz suffix writes gzip-compressed files)
     train_json: Path = project_root / "data/coco_data/bdd100k_train_coco.json"
     val_json: Path = project_root / "data/coco_data/bdd100k_val_coco.json"
+    # Write COCO JSON without indentation
+    coco_compact: bool = False
 
     # Training output
     project: Path = project_root / "runs/train"
@@ -65,9 +109,38 @@ class Config(BaseSettings):
 
     # Data loading / geometry
     rect: bool = True
+    # Dataloader workers (0 = the loader_benchmark pick for this machine)
+    train_workers: int = 0
+    loader_benchmark_path: Path = (
+        project_root / "data/yolo_data/loader_benchmark.json"
+    )
 
     # Reproducibility
     seed: int = 42
 
+    # Raw prediction cache (object_detection/prediction_cache.py)
+    prediction_cache_dir: Path = project_root / "data/prediction_cache"
+    prediction_conf: float = 0.001
+    prediction_iou: float = 0.7
+    prediction_max_det: int = 300
+    # Candidates per image cached for threshold_sweep (NMS off)
+    sweep_max_candidates: int = 3000
+
+    # CPU deployment export (object_detection/export_benchmark.py)
+    export_dir: Path = project_root / "models/export"
+    # Val images used for the ONNX/PyTorch parity check
+    export_parity_images: int = 8
+
+    # INT8 post-training quantization (object_detection/quantize.py)
+    quant_calibration_images: int = 300
+    quant_calibrate_method: Literal["minmax", "entropy", "percentile"] = (
+        "minmax"
+    )
+
+    # Overlay rendering (object_detection/yolo_overlay.py)
+    overlay_batch_size: int = 16
+    # Reader and writer threads each
+    overlay_workers: int = 4
+
 
 Config = Config()
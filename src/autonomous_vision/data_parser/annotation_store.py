@@ -0,0 +1,421 @@
+"""
+Memory-mapped annotation store for BDD100K detection boxes.
+
+Built once from the raw BDD100K JSON, one directory per split:
+  - boxes.npy        (N, 4) float64 x1, y1, x2, y2, as in the JSON
+  - classes.npy      (N,) uint8 index into Config.detection_classes
+  - label_ids.npy    (N,) int64 BDD label id
+  - occluded.npy, truncated.npy, traffic_light.npy
+                     (N,) int8 attribute codes, -1 = missing
+  - offsets.npy      (M + 1,) int64 CSR offsets; image i owns boxes
+                     offsets[i]:offsets[i + 1]
+  - names.npy        (M,) image file names
+  - sorted_names.npy, name_order.npy
+                     names in sorted order for O(log M) name lookup
+  - scene.npy, weather.npy, timeofday.npy
+                     (M,) int8 image attribute codes, -1 = missing
+  - meta.json        vocabularies for the code arrays
+
+Every array is opened with mmap_mode="r", so opening is near-instant and
+per-image slices are zero-copy views. The COCO, YOLO and Parquet
+exporters below read from the store instead of re-parsing the JSON
+(parsing_logic --from-store), and coco_index() gives the evaluation
+tools their ground truth without decoding the COCO file.
+
+Coordinates keep the JSON's double precision, so the exports match
+create_coco_dataset, the YOLO converters and parser_core value for
+value. The one byte-level difference: coordinates written as integers
+in the raw JSON ("x1": 100) come out of export_coco as floats (100.0).
+"""
+
+import json
+from array import array
+from itertools import islice
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from autonomous_vision.config import Config
+from autonomous_vision.data_parser.bdd_to_coco import CocoWriter
+from autonomous_vision.data_parser.parser_core import SHARD_SIZE, SplitWriter
+from autonomous_vision.object_detection.data_loader import (
+    CocoIndex,
+    load_coco_index,
+)
+from autonomous_vision.object_detection.label_utils import (
+    LabelDirWriter,
+    yolo_label_texts,
+)
+from autonomous_vision.utils.helper import load_json_records
+from autonomous_vision.utils.schemas import validate_records
+
+STORE_VERSION = 2
+
+IMAGE_ATTRIBUTES = ("scene", "weather", "timeofday")
+
+
+def _encode(vocab: Dict[str, int], value: Optional[str]) -> int:
+    if value is None:
+        return -1
+    if value not in vocab and len(vocab) >= 127:
+        raise ValueError("Too many distinct values for an int8 code")
+    return vocab.setdefault(value, len(vocab))
+
+
+def _flag(value) -> int:
+    return -1 if value is None else int(bool(value))
+
+
+def _decode_list(vocab: List[str], codes: np.ndarray) -> list:
+    return [None if c < 0 else vocab[c] for c in codes.tolist()]
+
+
+def _flag_list(codes: np.ndarray) -> list:
+    return [None if c < 0 else bool(c) for c in codes.tolist()]
+
+
+def build_store(labels_path: Path, out_dir: Path) -> int:
+    """Build the store for one split from raw BDD100K labels.
+
+    Records are validated like the parser does (Config.validation_mode).
+
+    Returns:
+        Number of boxes stored
+    """
+    class_idx = {name: i for i, name in enumerate(Config.detection_classes)}
+    vocabs: Dict[str, Dict[str, int]] = {
+        name: {} for name in IMAGE_ATTRIBUTES + ("traffic_light",)
+    }
+
+    coords = array("d")
+    classes = array("B")
+    label_ids = array("q")
+    flags = {name: array("b") for name in ("occluded", "truncated")}
+    lights = array("b")
+    offsets = array("q", [0])
+    image_codes = {name: array("b") for name in IMAGE_ATTRIBUTES}
+    names: List[str] = []
+
+    records = iter(load_json_records(labels_path))
+    while chunk := list(islice(records, SHARD_SIZE)):
+        for record in validate_records(chunk, Config.validation_mode):
+            names.append(record.name)
+            attrs = record.attributes
+            for name in IMAGE_ATTRIBUTES:
+                value = getattr(attrs, name) if attrs else None
+                image_codes[name].append(_encode(vocabs[name], value))
+
+            for obj in record.labels:
+                if obj.category not in class_idx or obj.box2d is None:
+                    continue
+                box = obj.box2d
+                coords.extend((box.x1, box.y1, box.x2, box.y2))
+                classes.append(class_idx[obj.category])
+                label_ids.append(obj.id)
+                obj_attrs = obj.attributes or {}
+                for name, values in flags.items():
+                    values.append(_flag(obj_attrs.get(name)))
+                lights.append(
+                    _encode(
+                        vocabs["traffic_light"],
+                        obj_attrs.get("trafficLightColor"),
+                    )
+                )
+            offsets.append(len(classes))
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    np.save(
+        out_dir / "boxes.npy",
+        np.frombuffer(coords, dtype=np.float64).reshape(-1, 4),
+    )
+    np.save(out_dir / "classes.npy", np.frombuffer(classes, dtype=np.uint8))
+    np.save(
+        out_dir / "label_ids.npy", np.frombuffer(label_ids, dtype=np.int64)
+    )
+    for name, values in flags.items():
+        np.save(out_dir / f"{name}.npy", np.frombuffer(values, np.int8))
+    np.save(out_dir / "traffic_light.npy", np.frombuffer(lights, np.int8))
+    np.save(out_dir / "offsets.npy", np.frombuffer(offsets, np.int64))
+    for name, values in image_codes.items():
+        np.save(out_dir / f"{name}.npy", np.frombuffer(values, np.int8))
+
+    encoded = np.array([n.encode("utf-8") for n in names], dtype=bytes)
+    order = np.argsort(encoded, kind="stable")
+    np.save(out_dir / "names.npy", encoded)
+    np.save(out_dir / "sorted_names.npy", encoded[order])
+    np.save(out_dir / "name_order.npy", order.astype(np.int64))
+
+    meta = {
+        "version": STORE_VERSION,
+        "classes": list(Config.detection_classes),
+        "width": Config.BDD100K_WIDTH,
+        "height": Config.BDD100K_HEIGHT,
+        "vocabs": {name: list(vocab) for name, vocab in vocabs.items()},
+    }
+    (out_dir / "meta.json").write_text(json.dumps(meta, indent=1))
+    return len(classes)
+
+
+class AnnotationStore:
+    """Read-only, memory-mapped view of one split's store."""
+
+    def __init__(self, root: Path):
+        self.root = root
+        meta = json.loads((root / "meta.json").read_text())
+        if meta.get("version") != STORE_VERSION:
+            raise ValueError(f"Unsupported store version in {root}")
+
+        self.classes: List[str] = meta["classes"]
+        self.width: int = meta["width"]
+        self.height: int = meta["height"]
+        self.vocabs: Dict[str, List[str]] = meta["vocabs"]
+
+        def load(name: str) -> np.ndarray:
+            return np.load(root / f"{name}.npy", mmap_mode="r")
+
+        self.boxes = load("boxes")
+        self.classes_idx = load("classes")
+        self.label_ids = load("label_ids")
+        self.occluded = load("occluded")
+        self.truncated = load("truncated")
+        self.traffic_light = load("traffic_light")
+        self.offsets = load("offsets")
+        self.names = load("names")
+        self.image_attributes = {name: load(name) for name in IMAGE_ATTRIBUTES}
+        self._sorted_names = load("sorted_names")
+        self._name_order = load("name_order")
+
+    @property
+    def num_images(self) -> int:
+        return len(self.names)
+
+    @property
+    def num_boxes(self) -> int:
+        return len(self.classes_idx)
+
+    def image_slice(self, index: int) -> slice:
+        """Box range owned by image ``index``."""
+        return slice(int(self.offsets[index]), int(self.offsets[index + 1]))
+
+    def image_boxes(self, index: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Zero-copy (boxes, classes) views for one image."""
+        sl = self.image_slice(index)
+        return self.boxes[sl], self.classes_idx[sl]
+
+    def image_name(self, index: int) -> str:
+        return self.names[index].decode("utf-8")
+
+    def index_of(self, name: str) -> int:
+        """Image index for a file name, e.g. "b1c66a42-6f7d68ca.jpg"."""
+        key = name.encode("utf-8")
+        pos = int(np.searchsorted(self._sorted_names, key))
+        if pos == self.num_images or self._sorted_names[pos] != key:
+            raise KeyError(name)
+        return int(self._name_order[pos])
+
+    def image_of_box(self, start: int = 0, stop: Optional[int] = None):
+        """Image index of every box owned by images start:stop."""
+        stop = self.num_images if stop is None else stop
+        counts = np.diff(self.offsets[start : stop + 1])
+        return np.repeat(np.arange(start, stop), counts)
+
+    def _decode(self, vocab: str, codes: np.ndarray) -> pd.Categorical:
+        return pd.Categorical.from_codes(
+            np.asarray(codes, dtype=np.int64), categories=self.vocabs[vocab]
+        )
+
+    def to_frame(self, split: str) -> pd.DataFrame:
+        """One row per box with the same columns as the parsed Parquet."""
+        image_of_box = self.image_of_box()
+
+        def flag(codes: np.ndarray) -> pd.arrays.BooleanArray:
+            codes = np.asarray(codes)
+            return pd.arrays.BooleanArray(codes > 0, codes < 0)
+
+        return pd.DataFrame(
+            {
+                "image_name": self.names[image_of_box].astype(str),
+                "split": split,
+                "label_id": self.label_ids,
+                "category": pd.Categorical.from_codes(
+                    np.asarray(self.classes_idx, dtype=np.int64),
+                    categories=self.classes,
+                ),
+                **{
+                    name: self.boxes[:, col].astype(np.float32)
+                    for col, name in enumerate(("x1", "y1", "x2", "y2"))
+                },
+                "width": self.width,
+                "height": self.height,
+                **{
+                    name: self._decode(
+                        name, self.image_attributes[name][image_of_box]
+                    )
+                    for name in ("scene", "timeofday", "weather")
+                },
+                "traffic_light_color": self._decode(
+                    "traffic_light", self.traffic_light
+                ),
+                "occluded": flag(self.occluded),
+                "truncated": flag(self.truncated),
+            }
+        )
+
+    def coco_index(self) -> CocoIndex:
+        """Ground truth as load_coco_index reads it from export_coco output.
+
+        Image and annotation ids are 1-based in store order, as
+        CocoWriter assigns them.
+        """
+        x1, y1, x2, y2 = np.asarray(self.boxes).T
+        boxes = np.column_stack([x1, y1, x2 - x1, y2 - y1])
+        classes = np.asarray(self.classes_idx, dtype=np.int64)
+        return CocoIndex(
+            image_ids=np.arange(1, self.num_images + 1, dtype=np.int64),
+            file_names=np.char.decode(self.names, "utf-8"),
+            widths=np.full(self.num_images, self.width, dtype=np.int64),
+            heights=np.full(self.num_images, self.height, dtype=np.int64),
+            offsets=np.asarray(self.offsets),
+            ann_ids=np.arange(1, self.num_boxes + 1, dtype=np.int64),
+            category_ids=classes + 1,
+            classes=classes,
+            areas=boxes[:, 2] * boxes[:, 3],
+            boxes=boxes,
+            names=list(self.classes),
+        )
+
+
+def export_coco(
+    store: AnnotationStore,
+    output_path: Path,
+    split: str,
+    compact: bool = False,
+) -> None:
+    """Write a COCO JSON file for the split from the store."""
+    boxes = store.boxes
+    with CocoWriter(output_path, split, compact=compact) as writer:
+        for i in range(store.num_images):
+            sl = store.image_slice(i)
+            xyxy = boxes[sl].tolist()
+            cats = (store.classes_idx[sl] + 1).tolist()
+            writer.add_image(
+                store.image_name(i),
+                [
+                    (cat, [x1, y1, x2 - x1, y2 - y1])
+                    for cat, (x1, y1, x2, y2) in zip(cats, xyxy)
+                ],
+            )
+
+
+def export_yolo(
+    store: AnnotationStore, labels_dir: Path, keep: Sequence[str] = ()
+) -> Dict[str, int]:
+    """Write one YOLO label file per image from the store.
+
+    Unchanged files are skipped and stale ones (not in keep) deleted, as
+    in write_yolo_labels.
+    """
+    x1, y1, x2, y2 = np.asarray(store.boxes).T
+    texts = yolo_label_texts(
+        store.classes_idx,
+        np.column_stack([x1, y1, x2 - x1, y2 - y1]),
+        store.offsets,
+        store.width,
+        store.height,
+    )
+    writer = LabelDirWriter(labels_dir, keep=keep)
+    for i, text in enumerate(texts):
+        writer.write(Path(store.image_name(i)).stem, text)
+    return writer.close()
+
+
+def export_parquet(
+    store: AnnotationStore,
+    split: str,
+    write_csv: bool = True,
+    partitioned: bool = False,
+) -> int:
+    """Write the parsed Parquet (and CSV) for the split from the store."""
+    writer = SplitWriter(split, write_csv=write_csv, partitioned=partitioned)
+    for start in range(0, store.num_images, SHARD_SIZE):
+        stop = min(start + SHARD_SIZE, store.num_images)
+        sl = slice(int(store.offsets[start]), int(store.offsets[stop]))
+        image_of_box = store.image_of_box(start, stop)
+        names = [n.decode("utf-8") for n in store.names[image_of_box]]
+        n_boxes = len(names)
+
+        shard = {
+            "image_name": names,
+            "split": [split] * n_boxes,
+            "label_id": array("q", store.label_ids[sl]),
+            "category": [store.classes[c] for c in store.classes_idx[sl]],
+            "width": array("q", [store.width] * n_boxes),
+            "height": array("q", [store.height] * n_boxes),
+            "traffic_light_color": _decode_list(
+                store.vocabs["traffic_light"], store.traffic_light[sl]
+            ),
+            "occluded": _flag_list(store.occluded[sl]),
+            "truncated": _flag_list(store.truncated[sl]),
+        }
+        for col, name in enumerate(("x1", "y1", "x2", "y2")):
+            shard[name] = array("f", store.boxes[sl, col])
+        for name in IMAGE_ATTRIBUTES:
+            codes = store.image_attributes[name][image_of_box]
+            shard[name] = _decode_list(store.vocabs[name], codes)
+        writer.extend(shard)
+    return writer.close()
+
+
+def store_dir(split: str) -> Path:
+    return Config.annotation_store / split
+
+
+def load_index(coco_json: Path, store: Optional[Path] = None) -> CocoIndex:
+    """Ground truth from the annotation store at store, else coco_json."""
+    if store is not None:
+        return AnnotationStore(store).coco_index()
+    return load_coco_index(coco_json)
+
+
+def export_split(
+    split: str,
+    parse: bool = True,
+    coco_path: Optional[Path] = None,
+    yolo_labels_dir: Optional[Path] = None,
+    keep_labels: Sequence[str] = (),
+) -> None:
+    """Write the requested pipeline outputs of one split from its store.
+
+    The store counterpart of fused_pipeline.run_split: parsed
+    Parquet/CSV, COCO JSON and YOLO label files, with the same Config
+    options as the converters that read the raw JSON.
+    """
+    store = AnnotationStore(store_dir(split))
+    if parse:
+        n_rows = export_parquet(
+            store, split, Config.write_csv, Config.partitioned_parquet
+        )
+        print(f"Total {split} annotations: {n_rows}")
+    if coco_path is not None:
+        export_coco(store, coco_path, split, compact=Config.coco_compact)
+        print(f"COCO ({store.num_images} images) -> {coco_path}")
+    if yolo_labels_dir is not None:
+        stats = export_yolo(store, yolo_labels_dir, keep_labels)
+        print(
+            f"YOLO labels -> {yolo_labels_dir}: {stats['written']} written, "
+            f"{stats['skipped']} unchanged, {stats['deleted']} deleted"
+        )
+
+
+def main(splits: Sequence[str] = ("train", "val")):
+    """Build the annotation store for train and val."""
+    labels = {"train": Config.train_labels, "val": Config.val_labels}
+    for split in splits:
+        n_boxes = build_store(labels[split], store_dir(split))
+        print(f"Stored {n_boxes} {split} boxes -> {store_dir(split)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,111 +2,227 @@
 BDD100K to COCO converter for object detection.
 """
 
-import json
+import gzip
+import io
+import os
+import shutil
+import tempfile
 from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Sequence, Tuple
 
 from autonomous_vision.config import Config
+from autonomous_vision.utils import json_codec
 from autonomous_vision.utils.helper import load_json_records
 
 
-def create_coco_dataset(
-    bdd_labels_path: Path, output_path: Path, split_name: str
-) -> None:
-    """Convert BDD100K labels to COCO format.
+def category_map() -> Dict[str, int]:
+    """Map detection class names to 1-based COCO category IDs."""
+    return {name: i + 1 for i, name in enumerate(Config.detection_classes)}
 
-    Args:
-        bdd_labels_path: Path to BDD100K JSON labels file
-        output_path: Path to save the COCO JSON file
-        split_name: Name of the split (train/val)
-    """
-    # Initialize COCO structure
-    coco_data = {
+
+def coco_header(split_name: str) -> dict:
+    """COCO fields written before the images/annotations arrays."""
+    return {
         "info": {"description": f"BDD100K {split_name}"},
         "licenses": [{"id": 1, "name": "BDD100K"}],
         "categories": [
             {"id": i + 1, "name": class_name}
             for i, class_name in enumerate(Config.detection_classes)
         ],
-        "images": [],
-        "annotations": [],
     }
 
-    # Create category name to ID mapping
-    category_map = {
-        name: i + 1 for i, name in enumerate(Config.detection_classes)
-    }
 
-    # Process each image
-    annotation_id = 1
-    for record in load_json_records(bdd_labels_path):
-        image_name = record["name"]
+def record_boxes(record: dict) -> Iterator[Tuple[str, List[float]]]:
+    """Yield (category, [x, y, width, height]) for detection objects."""
+    for obj in record["labels"]:
+        # Skip lane and drivable area
+        if obj["category"] not in Config.detection_classes:
+            continue
+
+        # Skip labels without bbox
+        if obj.get("box2d") is None:
+            continue
+
+        # Get bbox coordinates from BDD
+        box2d = obj["box2d"]
+        x1, y1, x2, y2 = (
+            box2d["x1"],
+            box2d["y1"],
+            box2d["x2"],
+            box2d["y2"],
+        )
+
+        yield obj["category"], [x1, y1, x2 - x1, y2 - y1]
+
+
+class CocoWriter:
+    """Stream a COCO JSON file to disk while records are converted.
+
+    Images are written straight to a temporary file next to the output;
+    annotations are spooled to a second one and appended on close, so
+    memory stays flat regardless of split size. close() then moves the
+    finished file over output_path, so a failed conversion leaves the
+    previous file in place; used as a context manager, the writer is
+    closed on success and aborted on error. The default layout is
+    identical to json.dump(..., indent=1) under either json_codec
+    backend; compact drops the whitespace.
+    A ".gz" output path is gzip-compressed.
+    """
 
+    def __init__(
+        self, output_path: Path, split_name: str, compact: bool = False
+    ):
+        self.output_path = output_path
+        self.cat_map = category_map()
+        self.num_images = 0
+        self.num_annotations = 0
+
+        if compact:
+            self._indent, self._separators = None, (",", ":")
+        else:
+            self._indent, self._separators = 1, (",", ": ")
+
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        self._tmp_path = output_path.with_name(output_path.name + ".tmp")
+        if output_path.suffix == ".gz":
+            # mtime=0 keeps the archive bytes reproducible
+            self._file = io.TextIOWrapper(
+                gzip.GzipFile(self._tmp_path, "wb", mtime=0),
+                encoding="utf-8",
+            )
+        else:
+            self._file = open(self._tmp_path, "w", encoding="utf-8")
+        self._spool = tempfile.TemporaryFile(
+            "w+", encoding="utf-8", dir=output_path.parent
+        )
+
+        self._file.write("{")
+        for key, value in coco_header(split_name).items():
+            self._file.write(self._key(key) + self._dumps(value, 1) + ",")
+        self._file.write(self._key("images") + "[")
+
+    def __enter__(self) -> "CocoWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _newline(self, level: int) -> str:
+        if self._indent is None:
+            return ""
+        return "\n" + " " * (self._indent * level)
+
+    def _key(self, key: str) -> str:
+        return self._newline(1) + json_codec.dumps(key) + self._separators[1]
+
+    def _dumps(self, obj, level: int) -> str:
+        text = json_codec.dumps(
+            obj, indent=self._indent, separators=self._separators
+        )
+        if self._indent is None:
+            return text
+        return text.replace("\n", self._newline(level))
+
+    def _item(self, obj, index: int) -> str:
+        prefix = "," if index else ""
+        return prefix + self._newline(2) + self._dumps(obj, 2)
+
+    def add_record(self, record: dict) -> None:
+        """Convert one BDD100K image record and write its entries."""
+        self.add_image(
+            record["name"],
+            [
+                (self.cat_map[category], bbox)
+                for category, bbox in record_boxes(record)
+            ],
+        )
+
+    def add_image(
+        self, file_name: str, boxes: Iterable[Tuple[int, List[float]]]
+    ) -> None:
+        """Write one image and its (category_id, [x, y, w, h]) boxes."""
         width, height = Config.BDD100K_WIDTH, Config.BDD100K_HEIGHT
 
         # Add image info
         image_info = {
-            "id": len(coco_data["images"]) + 1,
-            "file_name": image_name,
+            "id": self.num_images + 1,
+            "file_name": file_name,
             "width": width,
             "height": height,
         }
-        coco_data["images"].append(image_info)
-
-        # Process labels
-        for obj in record["labels"]:
-            # Skip lane and drivable area
-            if obj["category"] not in Config.detection_classes:
-                continue
-
-            # Skip labels without bbox
-            if obj.get("box2d") is None:
-                continue
-
-            # Get bbox coordinates from BDD
-            box2d = obj["box2d"]
-            x1, y1, x2, y2 = (
-                box2d["x1"],
-                box2d["y1"],
-                box2d["x2"],
-                box2d["y2"],
-            )
+        self._file.write(self._item(image_info, self.num_images))
+        self.num_images += 1
 
-            bbox_width = x2 - x1
-            bbox_height = y2 - y1
-
-            # Add annotation for object detection
+        # Add annotations for object detection
+        for category_id, bbox in boxes:
             annotation = {
-                "id": annotation_id,
+                "id": self.num_annotations + 1,
                 "image_id": image_info["id"],
-                "category_id": category_map[obj["category"]],
-                "bbox": [x1, y1, bbox_width, bbox_height],
-                "area": bbox_width * bbox_height,
+                "category_id": category_id,
+                "bbox": bbox,
+                "area": bbox[2] * bbox[3],
                 "iscrowd": 0,
             }
-            coco_data["annotations"].append(annotation)
-            annotation_id += 1
-
-    # Save COCO json file
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(coco_data, f, indent=1)
-
-
-def main():
-    """Convert both train and val splits to COCO format."""
-    # Convert training split
-    create_coco_dataset(
-        bdd_labels_path=Config.train_labels,
-        output_path=Config.coco_data / "bdd100k_train_coco.json",
-        split_name="train",
-    )
-
-    # Convert validation split
-    create_coco_dataset(
-        bdd_labels_path=Config.val_labels,
-        output_path=Config.coco_data / "bdd100k_val_coco.json",
-        split_name="val",
-    )
+            self._spool.write(self._item(annotation, self.num_annotations))
+            self.num_annotations += 1
+
+    def _close_array(self, count: int) -> str:
+        return (self._newline(1) if count else "") + "]"
+
+    def close(self) -> None:
+        """Append the spooled annotations and finish the document."""
+        self._file.write(self._close_array(self.num_images) + ",")
+        self._file.write(self._key("annotations") + "[")
+        self._spool.seek(0)
+        shutil.copyfileobj(self._spool, self._file)
+        self._spool.close()
+        self._file.write(self._close_array(self.num_annotations))
+        self._file.write(self._newline(0) + "}")
+        self._file.close()
+        os.replace(self._tmp_path, self.output_path)
+
+    def abort(self) -> None:
+        """Drop the partial output, keeping any previous file."""
+        self._spool.close()
+        self._file.close()
+        self._tmp_path.unlink(missing_ok=True)
+
+
+def create_coco_dataset(
+    bdd_labels_path: Path,
+    output_path: Path,
+    split_name: str,
+    compact: bool = False,
+) -> None:
+    """Convert BDD100K labels to COCO format.
+
+    Args:
+        bdd_labels_path: Path to BDD100K JSON labels file
+        output_path: Path to save the COCO JSON file (.gz to compress)
+        split_name: Name of the split (train/val)
+        compact: Write without indentation
+    """
+    with CocoWriter(output_path, split_name, compact=compact) as writer:
+        # Process each image
+        for record in load_json_records(bdd_labels_path):
+            writer.add_record(record)
+
+
+def main(splits: Sequence[str] = ("train", "val")):
+    """Convert the train and val splits to COCO format."""
+    labels = {"train": Config.train_labels, "val": Config.val_labels}
+    outputs = {"train": Config.train_json, "val": Config.val_json}
+
+    for split in splits:
+        create_coco_dataset(
+            bdd_labels_path=labels[split],
+            output_path=outputs[split],
+            split_name=split,
+            compact=Config.coco_compact,
+        )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,197 @@
+"""
+BDD100K to YOLO label converter.
+
+Streams the raw BDD100K labels straight to one YOLO label file per
+image, without the COCO JSON round trip. Class indices, box conversion
+and clipping are those of the COCO route (category id - 1, then
+yolo_label_texts), so the files match write_yolo_labels output on the
+COCO file converted from the same labels.
+
+With --packed each split goes to a single label archive instead, and
+--unpack syncs the .txt trees from those archives.
+"""
+
+import argparse
+from array import array
+from pathlib import Path
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+from autonomous_vision.config import Config
+from autonomous_vision.data_parser.bdd_to_coco import (
+    category_map,
+    record_boxes,
+)
+from autonomous_vision.data_parser.parser_core import SHARD_SIZE
+from autonomous_vision.object_detection.label_utils import (
+    LabelArchive,
+    LabelDirWriter,
+    save_label_archive,
+    unlabeled_stems,
+    yolo_label_texts,
+)
+from autonomous_vision.utils.helper import load_json_records
+
+
+class YoloWriter:
+    """Convert BDD100K records to YOLO label files in batches.
+
+    Boxes of up to SHARD_SIZE images are buffered in flat arrays and
+    converted together; files are synced through LabelDirWriter.
+    """
+
+    def __init__(
+        self,
+        labels_dir: Path,
+        keep: Sequence[str] = (),
+        batch_size: int = SHARD_SIZE,
+    ):
+        self.labels_dir = labels_dir
+        self.batch_size = batch_size
+        self.cat_map = category_map()
+        self._writer = LabelDirWriter(labels_dir, keep=keep)
+        self._reset()
+
+    def _reset(self) -> None:
+        self._stems: List[str] = []
+        self._counts = array("q")
+        self._classes = array("q")
+        self._boxes = array("d")
+
+    def add_record(self, record: dict) -> None:
+        """Buffer one BDD100K image record."""
+        n_boxes = 0
+        for category, bbox in record_boxes(record):
+            self._classes.append(self.cat_map[category] - 1)
+            self._boxes.extend(bbox)
+            n_boxes += 1
+        self._stems.append(Path(record["name"]).stem)
+        self._counts.append(n_boxes)
+        if len(self._stems) >= self.batch_size:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._stems:
+            return
+        offsets = np.zeros(len(self._counts) + 1, dtype=np.int64)
+        np.cumsum(np.frombuffer(self._counts, dtype=np.int64), out=offsets[1:])
+        texts = yolo_label_texts(
+            np.frombuffer(self._classes, dtype=np.int64),
+            np.frombuffer(self._boxes, dtype=np.float64),
+            offsets,
+            Config.BDD100K_WIDTH,
+            Config.BDD100K_HEIGHT,
+        )
+        for stem, text in zip(self._stems, texts):
+            self._writer.write(stem, text)
+        self._reset()
+
+    def close(self) -> Dict[str, int]:
+        """Write the last batch, prune stale files and return counts."""
+        self._flush()
+        return self._writer.close()
+
+
+def create_yolo_labels(
+    bdd_labels_path: Path, labels_dir: Path, keep: Sequence[str] = ()
+) -> Dict[str, int]:
+    """Convert BDD100K labels to YOLO label files.
+
+    Args:
+        bdd_labels_path: Path to BDD100K JSON labels file
+        labels_dir: Directory receiving one <image stem>.txt per image
+        keep: Stems of extra label files not to prune
+
+    Returns:
+        Counts of written, skipped (unchanged) and deleted files
+    """
+    writer = YoloWriter(labels_dir, keep=keep)
+    for record in load_json_records(bdd_labels_path):
+        writer.add_record(record)
+    return writer.close()
+
+
+def create_yolo_archive(bdd_labels_path: Path, archive_path: Path) -> int:
+    """Convert BDD100K labels to one packed label archive.
+
+    Returns:
+        Number of images packed
+    """
+    cat_map = category_map()
+    stems: List[str] = []
+    counts = array("q")
+    classes = array("q")
+    boxes = array("d")
+    for record in load_json_records(bdd_labels_path):
+        n_boxes = 0
+        for category, bbox in record_boxes(record):
+            classes.append(cat_map[category] - 1)
+            boxes.extend(bbox)
+            n_boxes += 1
+        stems.append(Path(record["name"]).stem)
+        counts.append(n_boxes)
+
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(np.frombuffer(counts, dtype=np.int64), out=offsets[1:])
+    return save_label_archive(
+        archive_path,
+        stems,
+        np.frombuffer(classes, dtype=np.int64),
+        np.frombuffer(boxes, dtype=np.float64),
+        offsets,
+        Config.BDD100K_WIDTH,
+        Config.BDD100K_HEIGHT,
+    )
+
+
+def main(
+    splits: Sequence[str] = ("train", "val"),
+    packed: bool = False,
+    unpack: bool = False,
+):
+    """Write YOLO labels (or label archives) for train and val."""
+    labels = {"train": Config.train_labels, "val": Config.val_labels}
+    yolo = {"train": Config.train_labels_yolo, "val": Config.val_labels_yolo}
+    archives = {
+        "train": Config.train_labels_archive,
+        "val": Config.val_labels_archive,
+    }
+    # Empty labels of unannotated train images are not stale
+    keep = {"train": unlabeled_stems(Config.unlabeled_train_list), "val": []}
+
+    for split in splits:
+        if packed:
+            n_images = create_yolo_archive(labels[split], archives[split])
+            print(f"Packed {n_images} {split} label sets -> {archives[split]}")
+            continue
+        if unpack:
+            archive = LabelArchive(archives[split])
+            stats = archive.export(yolo[split], keep[split])
+        else:
+            stats = create_yolo_labels(labels[split], yolo[split], keep[split])
+        print(
+            f"YOLO labels -> {yolo[split]}: {stats['written']} written, "
+            f"{stats['skipped']} unchanged, {stats['deleted']} deleted"
+        )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="BDD100K to YOLO labels")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        "--packed",
+        action="store_true",
+        help="write one label archive per split instead of .txt files",
+    )
+    mode.add_argument(
+        "--unpack",
+        action="store_true",
+        help="sync the .txt label trees from the label archives",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(packed=args.packed, unpack=args.unpack)
@@ -0,0 +1,224 @@
+"""
+Single-pass BDD100K pipeline.
+Decodes every raw record once and fans it out to the Parquet/CSV parser,
+the COCO converter and optionally the YOLO label writer. Each sink runs
+in its own process behind a bounded queue.
+"""
+
+import multiprocessing as mp
+import pickle
+import queue
+from functools import partial
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+
+from autonomous_vision.config import Config
+from autonomous_vision.data_parser.bdd_to_coco import CocoWriter
+from autonomous_vision.data_parser.bdd_to_yolo import YoloWriter
+from autonomous_vision.data_parser.parser_core import (
+    SHARD_SIZE,
+    SplitWriter,
+    parse_shard,
+)
+from autonomous_vision.object_detection.label_utils import unlabeled_stems
+from autonomous_vision.utils.helper import load_json_records
+
+# Records per queue message and messages buffered per sink
+BATCH_SIZE = 256
+QUEUE_SIZE = 8
+
+
+class RowSink:
+    """Flatten records into columns streamed to Parquet/CSV."""
+
+    def __init__(self, split: str):
+        self.split = split
+        self.records: List[dict] = []
+        self.writer = SplitWriter(
+            split,
+            write_csv=Config.write_csv,
+            partitioned=Config.partitioned_parquet,
+        )
+
+    def consume(self, record: dict) -> None:
+        self.records.append(record)
+        if len(self.records) >= SHARD_SIZE:
+            self.writer.extend(parse_shard(self.records, self.split))
+            self.records = []
+
+    def close(self) -> None:
+        self.writer.extend(parse_shard(self.records, self.split))
+        n_rows = self.writer.close()
+        print(f"Total {self.split} annotations: {n_rows}")
+
+
+class CocoSink:
+    """Stream COCO images/annotations to disk."""
+
+    def __init__(self, split: str, output_path: Path):
+        self.writer = CocoWriter(
+            output_path, split, compact=Config.coco_compact
+        )
+
+    def consume(self, record: dict) -> None:
+        self.writer.add_record(record)
+
+    def close(self) -> None:
+        self.writer.close()
+
+    def abort(self) -> None:
+        self.writer.abort()
+
+
+class YoloSink:
+    """Write one YOLO label file per image record, skipping unchanged."""
+
+    def __init__(self, labels_dir: Path, keep: Sequence[str] = ()):
+        self.labels_dir = labels_dir
+        self.writer = YoloWriter(labels_dir, keep=keep)
+
+    def consume(self, record: dict) -> None:
+        self.writer.add_record(record)
+
+    def close(self) -> None:
+        stats = self.writer.close()
+        print(
+            f"YOLO labels -> {self.labels_dir}: {stats['written']} written, "
+            f"{stats['skipped']} unchanged, {stats['deleted']} deleted"
+        )
+
+
+def _run_sink(make_sink: Callable, inbox: mp.Queue) -> None:
+    """Drain pickled record batches into a sink until None arrives."""
+    sink = make_sink()
+    try:
+        while (payload := inbox.get()) is not None:
+            for record in pickle.loads(payload):
+                sink.consume(record)
+    except BaseException:
+        # Sinks writing a single file drop their partial output
+        if hasattr(sink, "abort"):
+            sink.abort()
+        raise
+    sink.close()
+
+
+def _put(inbox: mp.Queue, item, worker: mp.Process) -> None:
+    """Put without blocking forever on a queue whose sink has died."""
+    while True:
+        try:
+            inbox.put(item, timeout=1.0)
+            return
+        except queue.Full as e:
+            if not worker.is_alive():
+                msg = f"Sink {worker.name} exited early"
+                raise RuntimeError(msg) from e
+
+
+def _broadcast(workers: list, batch: List[dict]) -> None:
+    """Serialize a batch once and hand the same bytes to every sink."""
+    payload = pickle.dumps(batch, protocol=pickle.HIGHEST_PROTOCOL)
+    for inbox, worker in workers:
+        _put(inbox, payload, worker)
+
+
+def run_split(
+    labels_path: Path,
+    split: str,
+    coco_path: Optional[Path] = None,
+    yolo_labels_dir: Optional[Path] = None,
+    parse: bool = True,
+    keep_labels: Sequence[str] = (),
+) -> bool:
+    """Read one split once and feed every requested sink in parallel.
+
+    Label files in yolo_labels_dir for images outside the split are
+    deleted unless their stem is in keep_labels.
+
+    Returns:
+        True if all sinks finished successfully
+    """
+    sinks = {}
+    if parse:
+        sinks["Parser"] = partial(RowSink, split)
+    if coco_path is not None:
+        sinks["COCO-Converter"] = partial(CocoSink, split, coco_path)
+    if yolo_labels_dir is not None:
+        sinks["YOLO-Labels"] = partial(YoloSink, yolo_labels_dir, keep_labels)
+
+    workers = []
+    for name, make_sink in sinks.items():
+        inbox = mp.Queue(maxsize=QUEUE_SIZE)
+        worker = mp.Process(
+            target=_run_sink, args=(make_sink, inbox), name=name
+        )
+        worker.start()
+        workers.append((inbox, worker))
+
+    try:
+        batch: List[dict] = []
+        for record in load_json_records(labels_path):
+            batch.append(record)
+            if len(batch) >= BATCH_SIZE:
+                _broadcast(workers, batch)
+                batch = []
+
+        _broadcast(workers, batch)
+        for inbox, worker in workers:
+            _put(inbox, None, worker)
+    except BaseException:
+        # Sinks still waiting on their inbox would never see the sentinel
+        for _, worker in workers:
+            worker.terminate()
+        raise
+
+    ok = True
+    for inbox, worker in workers:
+        worker.join()
+        inbox.close()
+        if worker.exitcode != 0:
+            print(f"{worker.name} failed on {split} split")
+            ok = False
+    return ok
+
+
+def main(
+    write_yolo: bool = False,
+    parse_splits: Sequence[str] = ("train", "val"),
+    coco_splits: Sequence[str] = ("train", "val"),
+    yolo_splits: Sequence[str] = ("train", "val"),
+) -> Dict[str, bool]:
+    """Run the fused pipeline over train and val.
+
+    Only the sinks listed for a split are fed; a split with none is not
+    read at all.
+
+    Returns:
+        Split name to success flag for the splits that were run
+    """
+    labels = {"train": Config.train_labels, "val": Config.val_labels}
+    coco = {"train": Config.train_json, "val": Config.val_json}
+    yolo = {"train": Config.train_labels_yolo, "val": Config.val_labels_yolo}
+    # Empty labels of unannotated train images are not stale
+    keep = {"train": unlabeled_stems(Config.unlabeled_train_list), "val": []}
+
+    results = {}
+    for split in ("train", "val"):
+        write_split_yolo = write_yolo and split in yolo_splits
+        if not (
+            split in parse_splits or split in coco_splits or write_split_yolo
+        ):
+            continue
+        results[split] = run_split(
+            labels[split],
+            split,
+            coco[split] if split in coco_splits else None,
+            yolo[split] if write_split_yolo else None,
+            parse=split in parse_splits,
+            keep_labels=keep[split],
+        )
+    return results
+
+
+if __name__ == "__main__":
+    main()
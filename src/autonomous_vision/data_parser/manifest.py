@@ -0,0 +1,138 @@
+"""
+Build manifest for the parsing pipeline.
+Records, per output stage, fingerprints of its inputs, the Config fields
+it depends on and its outputs, so unchanged stages can be skipped.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+
+MANIFEST_VERSION = 1
+
+# Read size when hashing files
+HASH_CHUNK_SIZE = 1 << 20
+
+
+def file_digest(path: Path) -> str:
+    """SHA-256 of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _dir_digest(path: Path) -> str:
+    """Hash of the relative paths, sizes and mtimes of a directory's files.
+
+    Subdirectories (e.g. Parquet partitions) are walked too.
+    """
+    entries = []
+    for root, _, files in os.walk(path):
+        for name in files:
+            file = Path(root) / name
+            stat = file.stat()
+            relative = file.relative_to(path).as_posix()
+            entries.append((relative, stat.st_size, stat.st_mtime_ns))
+
+    digest = hashlib.sha256()
+    for entry in sorted(entries):
+        digest.update(repr(entry).encode())
+    return digest.hexdigest()
+
+
+def fingerprint(path: Path, previous: Optional[dict] = None) -> dict:
+    """Fingerprint a file or directory.
+
+    A file whose size and mtime match the previous fingerprint keeps
+    its recorded hash instead of being re-read.
+    """
+    if not path.exists():
+        return {"missing": True}
+
+    stat = path.stat()
+    entry = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if path.is_dir():
+        entry["sha256"] = _dir_digest(path)
+        return entry
+
+    if (
+        previous
+        and previous.get("size") == entry["size"]
+        and previous.get("mtime_ns") == entry["mtime_ns"]
+        and "sha256" in previous
+    ):
+        entry["sha256"] = previous["sha256"]
+    else:
+        entry["sha256"] = file_digest(path)
+    return entry
+
+
+def _same_content(old: dict, new: dict) -> bool:
+    return not new.get("missing") and old.get("sha256") == new.get("sha256")
+
+
+class Manifest:
+    """Stage fingerprints stored as JSON next to the outputs."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.stages: Dict[str, dict] = {}
+        if path.exists():
+            data = json.loads(path.read_text())
+            if data.get("version") == MANIFEST_VERSION:
+                self.stages = data.get("stages", {})
+
+    def _fingerprints(
+        self, stage: str, kind: str, paths: List[Path]
+    ) -> Dict[str, dict]:
+        previous = self.stages.get(stage, {}).get(kind, {})
+        return {str(p): fingerprint(p, previous.get(str(p))) for p in paths}
+
+    def is_fresh(
+        self,
+        stage: str,
+        inputs: List[Path],
+        config: dict,
+        outputs: List[Path],
+    ) -> bool:
+        """True if inputs, config and outputs all match the record."""
+        recorded = self.stages.get(stage)
+        if recorded is None or recorded.get("config") != config:
+            return False
+
+        refreshed = {}
+        for kind, paths in (("inputs", inputs), ("outputs", outputs)):
+            old = recorded.get(kind, {})
+            if sorted(old) != sorted(str(p) for p in paths):
+                return False
+            new = self._fingerprints(stage, kind, paths)
+            if not all(_same_content(old[p], new[p]) for p in new):
+                return False
+            refreshed[kind] = new
+
+        # Same content under a new mtime (e.g. touched): skip rehashing
+        recorded.update(refreshed)
+        return True
+
+    def record(
+        self,
+        stage: str,
+        inputs: List[Path],
+        config: dict,
+        outputs: List[Path],
+    ) -> None:
+        """Store fresh fingerprints for a stage that was just rebuilt."""
+        self.stages[stage] = {
+            "inputs": self._fingerprints(stage, "inputs", inputs),
+            "config": config,
+            "outputs": self._fingerprints(stage, "outputs", outputs),
+        }
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        data = {"version": MANIFEST_VERSION, "stages": self.stages}
+        self.path.write_text(json.dumps(data, indent=1, sort_keys=True))
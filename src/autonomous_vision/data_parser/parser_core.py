@@ -1,107 +1,384 @@
+import os
+import shutil
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 from pathlib import Path
-from typing import List
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Union
 
-import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
 
 from autonomous_vision.config import Config
 from autonomous_vision.utils.helper import ensure_dir, load_json_records
-from autonomous_vision.utils.schemas import ImageAnnotation
+from autonomous_vision.utils.schemas import (
+    ImageAnnotationFields,
+    validate_records,
+)
 
 ALLOWED_CLASSES = Config.detection_classes
 
+# Output columns, in order
+COLUMNS = (
+    "image_name",
+    "split",
+    "label_id",
+    "category",
+    "x1",
+    "y1",
+    "x2",
+    "y2",
+    "width",
+    "height",
+    "scene",
+    "timeofday",
+    "weather",
+    "traffic_light_color",
+    "occluded",
+    "truncated",
+)
 
-def parse_split(labels_path: Path, split: str) -> List[dict]:
-    """
-    Parse one split (train/val/test):
-      - Validate each image record with Pydantic
-      - one object per row
-    Returns:
-      flat_rows: List of flattened object annotations
+# Numeric columns are shipped as typed arrays to keep pickling cheap
+FLOAT_COLUMNS = {"x1", "y1", "x2", "y2"}
+INT_COLUMNS = {"label_id", "width", "height"}
+
+# Low-cardinality strings stored as dictionary codes
+DICT_COLUMNS = {"category", "scene", "timeofday", "weather"}
+BOOL_COLUMNS = {"occluded", "truncated"}
+
+SCHEMA = pa.schema(
+    [
+        ("image_name", pa.string()),
+        ("split", pa.string()),
+        ("label_id", pa.int64()),
+        ("category", pa.dictionary(pa.int32(), pa.string())),
+        ("x1", pa.float32()),
+        ("y1", pa.float32()),
+        ("x2", pa.float32()),
+        ("y2", pa.float32()),
+        ("width", pa.int64()),
+        ("height", pa.int64()),
+        ("scene", pa.dictionary(pa.int32(), pa.string())),
+        ("timeofday", pa.dictionary(pa.int32(), pa.string())),
+        ("weather", pa.dictionary(pa.int32(), pa.string())),
+        ("traffic_light_color", pa.string()),
+        ("occluded", pa.bool_()),
+        ("truncated", pa.bool_()),
+    ]
+)
+
+# Hive directory levels of the partitioned dataset, outermost first
+PARTITION_COLUMNS = ("split", "timeofday", "weather", "scene")
+
+# Image records per shard in sharded mode
+SHARD_SIZE = 1024
+
+# Rows per Parquet row group
+ROW_GROUP_SIZE = 128 * 1024
+
+Columns = Dict[str, Union[list, array]]
+
+
+def _record_rows(record: ImageAnnotationFields, split: str) -> Iterator[tuple]:
+    """Yield one tuple per object of a validated image record."""
+    w, h = Config.BDD100K_WIDTH, Config.BDD100K_HEIGHT
+
+    # Flatten all object labels in this image
+    scene = record.attributes.scene if record.attributes else None
+    tod = record.attributes.timeofday if record.attributes else None
+    weather = record.attributes.weather if record.attributes else None
+
+    for obj in record.labels:
+        if obj.category not in ALLOWED_CLASSES:
+            continue
+
+        # Skiping labels with no bbox
+        if obj.box2d is None:
+            continue
+
+        yield (
+            record.name,
+            split,
+            getattr(obj, "id", None),
+            obj.category,
+            obj.box2d.x1,
+            obj.box2d.y1,
+            obj.box2d.x2,
+            obj.box2d.y2,
+            w,
+            h,
+            scene,
+            tod,
+            weather,
+            obj.attributes.get("trafficLightColor"),
+            obj.attributes.get("occluded"),
+            obj.attributes.get("truncated"),
+        )
+
+
+def _empty_columns() -> Columns:
+    columns: Columns = {}
+    for name in COLUMNS:
+        if name in FLOAT_COLUMNS:
+            columns[name] = array("f")
+        elif name in INT_COLUMNS:
+            columns[name] = array("q")
+        else:
+            columns[name] = []
+    return columns
+
+
+def parse_shard(records: Sequence[dict], split: str) -> Columns:
+    """Validate and flatten a chunk of image records into columns.
+
+    Validation follows Config.validation_mode (strict or bulk).
     """
-    flat_rows: List[dict] = []
+    columns = _empty_columns()
+    buffers = [columns[name] for name in COLUMNS]
 
-    for raw in load_json_records(labels_path):
-        record = ImageAnnotation.model_validate(raw)
+    for record in validate_records(records, Config.validation_mode):
+        for row in _record_rows(record, split):
+            for buf, value in zip(buffers, row):
+                buf.append(value)
 
-        w, h = Config.BDD100K_WIDTH, Config.BDD100K_HEIGHT
+    return columns
 
-        # Flatten all object labels in this image
-        scene = record.attributes.scene if record.attributes else None
-        tod = record.attributes.timeofday if record.attributes else None
-        weather = record.attributes.weather if record.attributes else None
 
-        for obj in record.labels:
-            if obj.category not in ALLOWED_CLASSES:
-                continue
+def _shards(records: Iterable[dict], size: int) -> Iterator[List[dict]]:
+    it = iter(records)
+    while shard := list(islice(it, size)):
+        yield shard
 
-            # Skiping labels with no bbox
-            if obj.box2d is None:
-                continue
 
-            # extract bbox
-            x1, y1, x2, y2 = (
-                obj.box2d.x1,
-                obj.box2d.y1,
-                obj.box2d.x2,
-                obj.box2d.y2,
+def _parsed_shards(
+    labels_path: Path, split: str, workers: int
+) -> Iterator[Columns]:
+    """Parse shards of a split, yielding results in record order."""
+    shards = _shards(load_json_records(labels_path), SHARD_SIZE)
+
+    if workers == 1:
+        for shard in shards:
+            yield parse_shard(shard, split)
+        return
+
+    # Bound the shards in flight so the record stream stays lazy
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending: deque = deque()
+        for shard in shards:
+            pending.append(pool.submit(parse_shard, shard, split))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class SplitWriter:
+    """
+    Columnar writer for one split:
+      - shards are appended into typed column buffers
+      - strings in DICT_COLUMNS become dictionary codes, boxes float32,
+        occluded/truncated nullable booleans
+      - every ROW_GROUP_SIZE rows are flushed as one Arrow record batch,
+        i.e. one Parquet row group (plus CSV rows when enabled)
+      - when partitioned, the finished file is also rewritten as a
+        hive-partitioned dataset (see write_partitioned)
+    """
+
+    def __init__(
+        self,
+        split: str,
+        write_csv: bool = True,
+        row_group_size: int = ROW_GROUP_SIZE,
+        partitioned: bool = False,
+    ):
+        self.split = split
+        self.parquet_path = Config.parsed_data / f"{split}_data.parquet"
+        self.csv_path = (
+            Config.parsed_data / f"{split}_data.csv" if write_csv else None
+        )
+        self.row_group_size = row_group_size
+        self.partitioned = partitioned
+        self.num_rows = 0
+        self._writer: Optional[pq.ParquetWriter] = None
+        self._vocab: Dict[str, Dict[str, int]] = {
+            name: {} for name in DICT_COLUMNS
+        }
+        self._reset()
+
+    def _reset(self) -> None:
+        self._buffers: Columns = {}
+        for name in COLUMNS:
+            if name in FLOAT_COLUMNS:
+                self._buffers[name] = array("f")
+            elif name in INT_COLUMNS:
+                self._buffers[name] = array("q")
+            elif name in DICT_COLUMNS:
+                self._buffers[name] = array("i")
+            elif name in BOOL_COLUMNS:
+                self._buffers[name] = array("b")
+            else:
+                self._buffers[name] = []
+        self._pending = 0
+
+    def extend(self, shard: Columns) -> None:
+        """Append a shard of columns (as returned by parse_shard)."""
+        for name in COLUMNS:
+            values = shard[name]
+            buf = self._buffers[name]
+            if name in DICT_COLUMNS:
+                vocab = self._vocab[name]
+                # None is stored as -1 and becomes a null code
+                buf.extend(
+                    -1 if v is None else vocab.setdefault(v, len(vocab))
+                    for v in values
+                )
+            elif name in BOOL_COLUMNS:
+                buf.extend(-1 if v is None else int(bool(v)) for v in values)
+            else:
+                buf.extend(values)
+
+        self._pending += len(shard["image_name"])
+        if self._pending >= self.row_group_size:
+            self.flush()
+
+    def _column(self, name: str) -> pa.Array:
+        buf = self._buffers[name]
+        if name in DICT_COLUMNS:
+            codes = np.frombuffer(buf, dtype=np.int32)
+            dictionary = pa.array(list(self._vocab[name]), pa.string())
+            return pa.DictionaryArray.from_arrays(
+                pa.array(codes, mask=codes < 0), dictionary
             )
+        if name in BOOL_COLUMNS:
+            flags = np.frombuffer(buf, dtype=np.int8)
+            return pa.array(flags > 0, mask=flags < 0)
+        if name in FLOAT_COLUMNS:
+            return pa.array(np.frombuffer(buf, dtype=np.float32))
+        if name in INT_COLUMNS:
+            return pa.array(np.frombuffer(buf, dtype=np.int64))
+        return pa.array(buf, pa.string())
 
-            flat_rows.append(
-                {
-                    "image_name": record.name,
-                    "split": split,
-                    "label_id": getattr(obj, "id", None),
-                    "category": obj.category,
-                    "x1": x1,
-                    "y1": y1,
-                    "x2": x2,
-                    "y2": y2,
-                    "width": w,
-                    "height": h,
-                    "scene": scene,
-                    "timeofday": tod,
-                    "weather": weather,
-                    "traffic_light_color": obj.attributes.get(
-                        "trafficLightColor"
-                    ),
-                    "occluded": obj.attributes.get("occluded"),
-                    "truncated": obj.attributes.get("truncated"),
-                }
+    def flush(self) -> None:
+        """Write buffered rows as one record batch / row group."""
+        if not self._pending:
+            return
+
+        batch = pa.RecordBatch.from_arrays(
+            [self._column(name) for name in COLUMNS], schema=SCHEMA
+        )
+        if self._writer is None:
+            ensure_dir(self.parquet_path.parent)
+            self._writer = pq.ParquetWriter(self.parquet_path, SCHEMA)
+        self._writer.write_table(pa.Table.from_batches([batch]))
+
+        if self.csv_path is not None:
+            batch.to_pandas().to_csv(
+                self.csv_path,
+                mode="w" if self.num_rows == 0 else "a",
+                header=self.num_rows == 0,
+                index=False,
             )
 
-    return flat_rows
+        self.num_rows += self._pending
+        self._reset()
 
+    def close(self) -> int:
+        """Flush the remaining rows and return the total row count."""
+        self.flush()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            if self.partitioned:
+                write_partitioned(
+                    self.parquet_path, self.split, self.row_group_size
+                )
+        return self.num_rows
 
-def main():
-    ensure_dir(Config.parsed_data)
 
-    # Parse training split
-    train_rows = parse_split(Config.train_labels, "train")
+def write_partitioned(
+    parquet_path: Path,
+    split: str,
+    row_group_size: int = ROW_GROUP_SIZE,
+) -> Path:
+    """Rewrite a split's Parquet file into the partitioned dataset.
 
-    # Parse val split
-    val_rows = parse_split(Config.val_labels, "val")
+    Rows land under Config.parquet_dataset in
+    split=<split>/timeofday=<..>/weather=<..>/scene=<..>/ directories
+    (missing attributes go to __HIVE_DEFAULT_PARTITION__), with
+    dictionary encoding and row-group statistics so readers can skip
+    directories and row groups that cannot match a filter. The source
+    is scanned batch by batch, and the split's previous partitions are
+    replaced.
 
-    if not train_rows and not val_rows:
-        return
+    Returns:
+        The split's partition directory
+    """
+    split_dir = Config.parquet_dataset / f"split={split}"
+    shutil.rmtree(split_dir, ignore_errors=True)
+
+    partitioning = ds.partitioning(
+        pa.schema([SCHEMA.field(name) for name in PARTITION_COLUMNS]),
+        flavor="hive",
+    )
+    file_options = ds.ParquetFileFormat().make_write_options(
+        use_dictionary=True, write_statistics=True
+    )
+    ds.write_dataset(
+        ds.dataset(parquet_path, format="parquet"),
+        Config.parquet_dataset,
+        format="parquet",
+        partitioning=partitioning,
+        file_options=file_options,
+        basename_template=f"{split}-{{i}}.parquet",
+        max_rows_per_group=row_group_size,
+        existing_data_behavior="overwrite_or_ignore",
+    )
+    return split_dir
+
+
+def write_split(
+    labels_path: Path,
+    split: str,
+    workers: int = 1,
+    write_csv: bool = True,
+    partitioned: bool = False,
+) -> int:
+    """Parse one split and stream it to Parquet (and optionally CSV,
+    and the hive-partitioned dataset).
+
+    Returns:
+        Number of rows written
+    """
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+
+    writer = SplitWriter(split, write_csv=write_csv, partitioned=partitioned)
+    for shard in _parsed_shards(labels_path, split, workers):
+        writer.extend(shard)
+    return writer.close()
+
+
+def main(splits: Sequence[str] = ("train", "val")):
+    ensure_dir(Config.parsed_data)
+
+    labels = {"train": Config.train_labels, "val": Config.val_labels}
+    workers = Config.parse_workers
+    write_csv = Config.write_csv
+    partitioned = Config.partitioned_parquet
+
+    # Parse and write each split
+    total = 0
+    for split in splits:
+        n_rows = write_split(
+            labels[split], split, workers, write_csv, partitioned
+        )
+        print(f"Total {split} annotations: {n_rows}")
+        total += n_rows
 
-    # separate files for train and val
-    if train_rows:
-        train_df = pd.DataFrame(train_rows)
-        train_csv = Config.parsed_data / "train_data.csv"
-        train_parquet = Config.parsed_data / "train_data.parquet"
-        train_df.to_csv(train_csv, index=False)
-        train_df.to_parquet(train_parquet)
-
-    if val_rows:
-        val_df = pd.DataFrame(val_rows)
-        val_csv = Config.parsed_data / "val_data.csv"
-        val_parquet = Config.parsed_data / "val_data.parquet"
-        val_df.to_csv(val_csv, index=False)
-        val_df.to_parquet(val_parquet)
-
-    print(f"Total train annotations: {len(train_rows)}")
-    print(f"Total val annotations: {len(val_rows)}")
-    print(f"Total annotations: {len(train_rows) + len(val_rows)}")
+    print(f"Total annotations: {total}")
 
 
 if __name__ == "__main__":
@@ -1,43 +1,192 @@
 """
 BDD100K data processing pipeline.
-Runs parser and COCO converter in parallel with basic error handling.
+Runs parser and COCO converter (and with --yolo the YOLO label
+converter) in parallel with basic error handling. With --fused, all are
+fed from a single read of the raw JSON; with --from-store, the raw JSON
+is read once into the annotation store and all are exported from it.
+Stages whose inputs, config and outputs match the manifest are skipped
+unless --force is given.
 """
 
+import argparse
 import multiprocessing as mp
+import sys
 import time
+from typing import Dict, List, Sequence
 
 from autonomous_vision.config import Config
+from autonomous_vision.data_parser.annotation_store import (
+    STORE_VERSION,
+    build_store,
+    export_split,
+    store_dir,
+)
 from autonomous_vision.data_parser.bdd_to_coco import main as coco_main
+from autonomous_vision.data_parser.bdd_to_yolo import main as yolo_main
+from autonomous_vision.data_parser.fused_pipeline import main as fused_main
+from autonomous_vision.data_parser.manifest import Manifest
 from autonomous_vision.data_parser.parser_core import main as parser_main
+from autonomous_vision.object_detection.label_utils import unlabeled_stems
 
+SPLITS = ("train", "val")
 
-def run_parser():
+
+def run_parser(splits: Sequence[str] = SPLITS):
     """Run the parser script."""
     try:
         print("Starting parser...")
 
-        parser_main()
+        parser_main(splits)
         print("Parser completed successfully")
         return True
     except (FileNotFoundError, PermissionError, OSError) as e:
         print(f"Parser failed: {e}")
-        return False
+        # Report the failure through the process exit code
+        sys.exit(1)
 
 
-def run_coco_converter():
+def run_coco_converter(splits: Sequence[str] = SPLITS):
     """Run the COCO converter script."""
     try:
         print("Starting COCO converter...")
-        coco_main()
+        coco_main(splits)
         print("COCO converter completed successfully")
         return True
     except (FileNotFoundError, PermissionError, OSError) as e:
         print(f"COCO converter failed: {e}")
-        return False
+        sys.exit(1)
+
+
+def run_yolo_converter(splits: Sequence[str] = SPLITS):
+    """Run the YOLO label converter script."""
+    try:
+        print("Starting YOLO label converter...")
+        yolo_main(splits)
+        print("YOLO label converter completed successfully")
+        return True
+    except (FileNotFoundError, PermissionError, OSError) as e:
+        print(f"YOLO label converter failed: {e}")
+        sys.exit(1)
+
+
+def run_fused(
+    write_yolo: bool,
+    parse_splits: Sequence[str],
+    coco_splits: Sequence[str],
+    yolo_splits: Sequence[str],
+) -> Dict[str, bool]:
+    """Run the single-pass pipeline feeding parser and COCO sinks."""
+    try:
+        print("Starting fused parser + COCO converter...")
+        results = fused_main(
+            write_yolo=write_yolo,
+            parse_splits=parse_splits,
+            coco_splits=coco_splits,
+            yolo_splits=yolo_splits,
+        )
+        if all(results.values()):
+            print("Fused pipeline completed successfully")
+        return results
+    except (FileNotFoundError, PermissionError, OSError, ValueError) as e:
+        print(f"Fused pipeline failed: {e}")
+        return {split: False for split in SPLITS}
+
+
+def run_from_store(
+    store_splits: Sequence[str],
+    parse_splits: Sequence[str],
+    coco_splits: Sequence[str],
+    yolo_splits: Sequence[str],
+) -> Dict[str, bool]:
+    """Rebuild stale annotation stores, then export outputs from them."""
+    labels = {"train": Config.train_labels, "val": Config.val_labels}
+    coco = {"train": Config.train_json, "val": Config.val_json}
+    yolo = {"train": Config.train_labels_yolo, "val": Config.val_labels_yolo}
+    # Empty labels of unannotated train images are not stale
+    keep = {"train": unlabeled_stems(Config.unlabeled_train_list), "val": []}
+
+    results = {}
+    for split in SPLITS:
+        stages = (store_splits, parse_splits, coco_splits, yolo_splits)
+        if not any(split in splits for splits in stages):
+            continue
+        try:
+            print(f"Exporting {split} outputs from the annotation store...")
+            if split in store_splits:
+                n_boxes = build_store(labels[split], store_dir(split))
+                print(f"Stored {n_boxes} {split} boxes -> {store_dir(split)}")
+            export_split(
+                split,
+                parse=split in parse_splits,
+                coco_path=coco[split] if split in coco_splits else None,
+                yolo_labels_dir=yolo[split] if split in yolo_splits else None,
+                keep_labels=keep[split],
+            )
+            results[split] = True
+        except (FileNotFoundError, PermissionError, OSError, ValueError) as e:
+            print(f"Store pipeline failed on {split} split: {e}")
+            results[split] = False
+    return results
+
+
+def stage_specs(
+    write_yolo: bool = False, from_store: bool = False
+) -> Dict[str, dict]:
+    """Inputs, Config fields and outputs of every pipeline stage."""
+    labels = {"train": Config.train_labels, "val": Config.val_labels}
+    coco = {"train": Config.train_json, "val": Config.val_json}
+    yolo = {"train": Config.train_labels_yolo, "val": Config.val_labels_yolo}
+    shared = ["detection_classes", "BDD100K_WIDTH", "BDD100K_HEIGHT"]
+
+    def config(*extra: str) -> dict:
+        # Config is the settings instance, not the class pylint infers
+        # pylint: disable-next=no-value-for-parameter
+        return Config.model_dump(mode="json", include={*shared, *extra})
 
+    specs = {}
+    for split in SPLITS:
+        parsed = [Config.parsed_data / f"{split}_data.parquet"]
+        if Config.write_csv:
+            parsed.append(Config.parsed_data / f"{split}_data.csv")
+        if Config.partitioned_parquet:
+            parsed.append(Config.parquet_dataset / f"split={split}")
 
-def main():
-    """Run both processes in parallel."""
+        specs[f"parser:{split}"] = {
+            "inputs": [labels[split]],
+            "config": config("write_csv", "partitioned_parquet"),
+            "outputs": parsed,
+        }
+        specs[f"coco:{split}"] = {
+            "inputs": [labels[split]],
+            "config": config("coco_compact"),
+            "outputs": [coco[split]],
+        }
+        if write_yolo:
+            specs[f"yolo:{split}"] = {
+                "inputs": [labels[split]],
+                "config": config(),
+                "outputs": [yolo[split]],
+            }
+        if from_store:
+            specs[f"store:{split}"] = {
+                "inputs": [labels[split]],
+                "config": {**config(), "store_version": STORE_VERSION},
+                "outputs": [store_dir(split)],
+            }
+    return specs
+
+
+def _stale_splits(stale: List[str], kind: str) -> List[str]:
+    return [split for split in SPLITS if f"{kind}:{split}" in stale]
+
+
+def main(
+    fused: bool = False,
+    write_yolo: bool = False,
+    force: bool = False,
+    from_store: bool = False,
+):
+    """Run both processes in parallel, skipping up-to-date stages."""
     print("Starting BDD100K data parsing pipeline...")
 
     # make sure output directories exist
@@ -46,20 +195,75 @@ def main():
 
     start_time = time.time()
 
-    # Create and start parallel processes
-    parser_process = mp.Process(target=run_parser, name="Parser")
-    coco_process = mp.Process(target=run_coco_converter, name="COCO-Converter")
+    manifest = Manifest(Config.manifest_path)
+    specs = stage_specs(write_yolo=write_yolo, from_store=from_store)
+    stale = [
+        name
+        for name, spec in specs.items()
+        if force or not manifest.is_fresh(name, **spec)
+    ]
+    fresh = [name for name in specs if name not in stale]
+    if fresh:
+        print(f"Up to date, skipping: {', '.join(fresh)}")
+
+    parse_splits = _stale_splits(stale, "parser")
+    coco_splits = _stale_splits(stale, "coco")
+    yolo_splits = _stale_splits(stale, "yolo")
+    store_splits = _stale_splits(stale, "store")
+    done: List[str] = []
+
+    if not stale:
+        print("All outputs are up to date (use --force to rebuild)")
+        parser_success = coco_success = yolo_success = True
+    elif fused:
+        # One read per split; sinks report their own failures
+        results = run_fused(write_yolo, parse_splits, coco_splits, yolo_splits)
+        done = [name for name in stale if results.get(name.split(":")[1])]
+        parser_success = coco_success = yolo_success = all(results.values())
+    elif from_store:
+        results = run_from_store(
+            store_splits, parse_splits, coco_splits, yolo_splits
+        )
+        done = [name for name in stale if results.get(name.split(":")[1])]
+        parser_success = coco_success = yolo_success = all(results.values())
+    else:
+        # Create and start parallel processes for the stale stages
+        processes = {}
+        if parse_splits:
+            processes["parser"] = mp.Process(
+                target=run_parser, args=(parse_splits,), name="Parser"
+            )
+        if coco_splits:
+            processes["coco"] = mp.Process(
+                target=run_coco_converter,
+                args=(coco_splits,),
+                name="COCO-Converter",
+            )
+        if yolo_splits:
+            processes["yolo"] = mp.Process(
+                target=run_yolo_converter,
+                args=(yolo_splits,),
+                name="YOLO-Converter",
+            )
+
+        for process in processes.values():
+            process.start()
 
-    parser_process.start()
-    coco_process.start()
+        if processes:
+            print("Waiting for the processes to complete...")
+        for process in processes.values():
+            process.join()
 
-    print("Waiting for both processes to complete...")
-    parser_process.join()
-    coco_process.join()
+        # Check results
+        succeeded = {kind for kind, p in processes.items() if p.exitcode == 0}
+        done = [name for name in stale if name.split(":")[0] in succeeded]
+        parser_success = not parse_splits or "parser" in succeeded
+        coco_success = not coco_splits or "coco" in succeeded
+        yolo_success = not yolo_splits or "yolo" in succeeded
 
-    # Check results
-    parser_success = parser_process.exitcode == 0
-    coco_success = coco_process.exitcode == 0
+    for name in done:
+        manifest.record(name, **specs[name])
+    manifest.save()
 
     duration = time.time() - start_time
     print(f"\nPipeline completed in {duration:.2f} seconds")
@@ -73,6 +277,8 @@ def main():
         print("COCO converter completed, but Parser failed")
     else:
         print("Both processes failed!")
+    if not yolo_success:
+        print("YOLO label converter failed")
 
     print("=" * 50)
     print("Output directories:")
@@ -80,7 +286,7 @@ def main():
     print(f"  COCO data: {Config.coco_data}")
 
     # if failed, run manually
-    if not parser_success or not coco_success:
+    if not (parser_success and coco_success and yolo_success):
         print("\nRestart manually:")
 
         if not parser_success:
@@ -93,6 +299,11 @@ def main():
                 "Run COCO: uv run python -m "
                 "autonomous_vision.data_parser.bdd_to_coco"
             )
+        if not yolo_success:
+            print(
+                "Run YOLO: uv run python -m "
+                "autonomous_vision.data_parser.bdd_to_yolo"
+            )
 
         print(
             "Run both: uv run python -m "
@@ -100,8 +311,42 @@ def main():
         )
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="BDD100K data processing pipeline"
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="rebuild every output even if the manifest says it is fresh",
+    )
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument(
+        "--fused",
+        action="store_true",
+        help="decode the raw JSON once and feed all outputs from it",
+    )
+    source.add_argument(
+        "--from-store",
+        action="store_true",
+        help="build the annotation store and export all outputs from it",
+    )
+    parser.add_argument(
+        "--yolo",
+        action="store_true",
+        help="also write YOLO label files",
+    )
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    main(
+        fused=args.fused,
+        write_yolo=args.yolo,
+        force=args.force,
+        from_store=args.from_store,
+    )
 
 # After parser and coco converter, run sanity check
 # to make sure parsing and coco conversion went well
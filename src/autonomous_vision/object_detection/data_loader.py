@@ -1,18 +1,33 @@
-import json
+from itertools import chain
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Sequence, Tuple
 
+import numpy as np
+
+from autonomous_vision.utils import json_codec
+from autonomous_vision.utils.helper import open_binary
 
-def load_coco(
-    coco_json: Path,
-) -> Tuple[Dict[int, dict], Dict[int, list], List[str]]:
-    """Load COCO format annotations and convert to internal format."""
-    data = json.loads(coco_json.read_text())
+
+def _read_coco(coco_json: Path) -> Tuple[dict, Dict[int, int], List[str]]:
+    """Decoded COCO document, category id to class index, class names."""
+    with open_binary(coco_json) as f:
+        data = json_codec.load(f)
 
     # Preserves 1..10 order
     cats = sorted(data["categories"], key=lambda c: c["id"])
     cat_id_to_idx = {c["id"]: i for i, c in enumerate(cats)}
     names = [c["name"] for c in cats]
+    return data, cat_id_to_idx, names
+
+
+def load_coco(
+    coco_json: Path,
+) -> Tuple[Dict[int, dict], Dict[int, list], List[str]]:
+    """Load COCO format annotations and convert to internal format.
+
+    Plain and gzip-compressed (.gz) COCO JSON files are both accepted.
+    """
+    data, cat_id_to_idx, names = _read_coco(coco_json)
 
     images = {
         im["id"]: {
@@ -35,3 +50,186 @@ def load_coco(
         anns_by_image[ann["image_id"]].append(ann)
 
     return images, anns_by_image, names
+
+
+class CocoIndex:
+    """Array-backed COCO annotations, the CSR form of load_coco output.
+
+    Image i (in file order) has id image_ids[i], file name file_names[i]
+    and size widths[i] x heights[i], and owns the annotation rows
+    offsets[i]:offsets[i + 1] of ann_ids, category_ids, classes (the
+    0-based "_cls"), areas and boxes ((N, 4) COCO x, y, w, h). Rows keep
+    their file order within an image; crowd annotations and those of
+    unknown images are dropped as in load_coco.
+    """
+
+    def __init__(
+        self,
+        image_ids: np.ndarray,
+        file_names: np.ndarray,
+        widths: np.ndarray,
+        heights: np.ndarray,
+        offsets: np.ndarray,
+        ann_ids: np.ndarray,
+        category_ids: np.ndarray,
+        classes: np.ndarray,
+        areas: np.ndarray,
+        boxes: np.ndarray,
+        names: List[str],
+    ):
+        self.image_ids = image_ids
+        self.file_names = file_names
+        self.widths = widths
+        self.heights = heights
+        self.offsets = offsets
+        self.ann_ids = ann_ids
+        self.category_ids = category_ids
+        self.classes = classes
+        self.areas = areas
+        self.boxes = boxes
+        self.names = names
+        self._by_id: Optional[Dict[int, int]] = None
+        self._by_stem: Optional[Dict[str, int]] = None
+
+    @property
+    def num_images(self) -> int:
+        return len(self.image_ids)
+
+    @property
+    def num_annotations(self) -> int:
+        return len(self.ann_ids)
+
+    @property
+    def stems(self) -> List[str]:
+        return [Path(name).stem for name in self.file_names.tolist()]
+
+    def image_slice(self, index: int) -> slice:
+        """Annotation range owned by image ``index``."""
+        return slice(int(self.offsets[index]), int(self.offsets[index + 1]))
+
+    def image_boxes(self, index: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Zero-copy (boxes, classes) views for one image."""
+        sl = self.image_slice(index)
+        return self.boxes[sl], self.classes[sl]
+
+    def index_of_id(self, image_id: int) -> int:
+        """Image index for a COCO image id."""
+        if self._by_id is None:
+            self._by_id = {
+                i: pos for pos, i in enumerate(self.image_ids.tolist())
+            }
+        return self._by_id[image_id]
+
+    def index_of_stem(self, stem: str) -> int:
+        """Image index for a file stem, e.g. "b1c66a42-6f7d68ca"."""
+        if self._by_stem is None:
+            self._by_stem = {s: pos for pos, s in enumerate(self.stems)}
+        return self._by_stem[stem]
+
+    def as_dicts(self) -> Tuple[Dict[int, dict], Dict[int, list]]:
+        """The (images, anns_by_image) pair load_coco returns.
+
+        Annotations are rebuilt with the fields the arrays hold (id,
+        image_id, category_id, bbox, area, iscrowd and _cls); bbox and
+        area values come back as floats.
+        """
+        images: Dict[int, dict] = {}
+        anns_by_image: Dict[int, List[dict]] = {}
+        ann_ids = self.ann_ids.tolist()
+        category_ids = self.category_ids.tolist()
+        classes = self.classes.tolist()
+        areas = self.areas.tolist()
+        boxes = self.boxes.tolist()
+        bounds = self.offsets.tolist()
+        file_names = self.file_names.tolist()
+        widths, heights = self.widths.tolist(), self.heights.tolist()
+        for i, image_id in enumerate(self.image_ids.tolist()):
+            images[image_id] = {
+                "file_name": file_names[i],
+                "width": widths[i],
+                "height": heights[i],
+            }
+            anns_by_image[image_id] = [
+                {
+                    "id": ann_ids[j],
+                    "image_id": image_id,
+                    "category_id": category_ids[j],
+                    "bbox": boxes[j],
+                    "area": areas[j],
+                    "iscrowd": 0,
+                    "_cls": classes[j],
+                }
+                for j in range(bounds[i], bounds[i + 1])
+            ]
+        return images, anns_by_image
+
+
+def _column(rows: Sequence[dict], key: str, dtype) -> np.ndarray:
+    """One field of every row as an array."""
+    values = (row[key] for row in rows)
+    return np.fromiter(values, dtype=dtype, count=len(rows))
+
+
+def load_coco_index(coco_json: Path) -> CocoIndex:
+    """Load COCO annotations into a CocoIndex.
+
+    Same filtering and class mapping as load_coco, but the result is a
+    handful of arrays instead of one dict per image and annotation; the
+    decoded document is released once they are built. Only the retained
+    memory shrinks: the whole document is decoded first, so peak memory
+    while loading is that of load_coco. AnnotationStore.coco_index()
+    builds the same index from memory-mapped arrays without decoding
+    any JSON.
+    """
+    data, cat_id_to_idx, names = _read_coco(coco_json)
+
+    # Keyed like load_coco's dict: a repeated image id keeps its first
+    # position and its last entry
+    images = list({im["id"]: im for im in data["images"]}.values())
+    image_ids = _column(images, "id", np.int64)
+    position = {image_id: i for i, image_id in enumerate(image_ids.tolist())}
+
+    anns = [
+        ann
+        for ann in data["annotations"]
+        if ann.get("iscrowd", 0) != 1 and ann["image_id"] in position
+    ]
+    image_of_ann = np.fromiter(
+        (position[ann["image_id"]] for ann in anns),
+        dtype=np.int64,
+        count=len(anns),
+    )
+    order = np.argsort(image_of_ann, kind="stable")
+    classes = np.fromiter(
+        (cat_id_to_idx[ann["category_id"]] for ann in anns),
+        dtype=np.int64,
+        count=len(anns),
+    )
+    areas = np.fromiter(
+        (ann.get("area", 0.0) for ann in anns),
+        dtype=np.float64,
+        count=len(anns),
+    )
+    boxes = np.fromiter(
+        chain.from_iterable(ann["bbox"] for ann in anns),
+        dtype=np.float64,
+        count=4 * len(anns),
+    )
+
+    offsets = np.zeros(len(images) + 1, dtype=np.int64)
+    np.cumsum(
+        np.bincount(image_of_ann, minlength=len(images)), out=offsets[1:]
+    )
+    return CocoIndex(
+        image_ids=image_ids,
+        file_names=np.array([im["file_name"] for im in images], dtype=str),
+        widths=_column(images, "width", np.int64),
+        heights=_column(images, "height", np.int64),
+        offsets=offsets,
+        ann_ids=_column(anns, "id", np.int64)[order],
+        category_ids=_column(anns, "category_id", np.int64)[order],
+        classes=classes[order],
+        areas=areas[order],
+        boxes=boxes.reshape(-1, 4)[order],
+        names=names,
+    )
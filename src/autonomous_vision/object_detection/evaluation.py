@@ -0,0 +1,515 @@
+"""
+COCO-style box mAP computed with NumPy, with attribute slices.
+
+Follows pycocotools' bbox evaluation for area "all": the 100 best
+detections per image and class are matched greedily in score order to
+the unmatched ground truth box of their class with the highest IoU, at
+every threshold of .50:.05:.95, and precision is sampled at 101 recall
+points. AP is averaged over thresholds and classes with ground truth;
+AP50 and AP75 use one threshold.
+
+Slices join the parser_core metadata on image name:
+  - image attributes (scene, weather, timeofday) evaluate only the
+    images with that value (images without boxes have no metadata row
+    and only count towards "all")
+  - box attributes (occluded, truncated) keep every image but ignore
+    ground truth outside the slice, as pycocotools ignores boxes outside
+    an area range: detections matched to an ignored box do not count,
+    unmatched ones stay false positives
+
+Predictions are added in batches of whole images; each batch is matched
+on arrival and metrics can be computed at any point from what has been
+added so far.
+
+Usage:
+    python -m autonomous_vision.object_detection.evaluation
+        (--predictions predictions.json | --model weights.pt)
+"""
+
+import argparse
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from autonomous_vision.config import Config
+from autonomous_vision.data_parser.annotation_store import (
+    AnnotationStore,
+    load_index,
+)
+from autonomous_vision.object_detection.data_loader import CocoIndex
+from autonomous_vision.object_detection.matching import (
+    gt_columns,
+    pair_iou,
+    xywh_to_xyxy,
+)
+from autonomous_vision.object_detection.prediction_cache import (
+    PredictionCache,
+    result_columns,
+)
+from autonomous_vision.utils import json_codec
+from autonomous_vision.utils.helper import load_val_parquet, scan_images
+
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+RECALL_THRESHOLDS = np.linspace(0.0, 1.0, 101)
+MAX_DETS = 100
+
+IMAGE_ATTRIBUTES = ("scene", "weather", "timeofday")
+BOX_ATTRIBUTES = ("occluded", "truncated")
+
+
+def _group_ranks(groups: np.ndarray, scores: np.ndarray) -> np.ndarray:
+    """Rank of every row within its group, best score first.
+
+    Ties keep input order, like pycocotools' mergesort.
+    """
+    order = np.lexsort((-scores, groups))
+    sorted_groups = groups[order]
+    starts = np.flatnonzero(
+        np.r_[True, sorted_groups[1:] != sorted_groups[:-1]]
+    )
+    lengths = np.diff(np.r_[starts, len(order)])
+    ranks = np.empty(len(order), dtype=np.int64)
+    ranks[order] = np.arange(len(order)) - np.repeat(starts, lengths)
+    return ranks
+
+
+def _coco_match(
+    dt_group: np.ndarray,
+    dt_rank: np.ndarray,
+    dt_boxes: np.ndarray,
+    gt_group: np.ndarray,
+    gt_boxes: np.ndarray,
+    gt_ignored: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """pycocotools' greedy matching at every IoU threshold.
+
+    Rows of one group (image and class) are matched together; gt rows
+    must be sorted by group and in file order within it.
+
+    Returns:
+        (T, D) matched and ignored flags of every detection
+    """
+    n_thr, n_dt = len(IOU_THRESHOLDS), len(dt_group)
+    matched = np.zeros((n_thr, n_dt), dtype=bool)
+    ignored = np.zeros((n_thr, n_dt), dtype=bool)
+    gt_taken = np.zeros((n_thr, len(gt_group)), dtype=bool)
+
+    # Every detection paired with every box of its group
+    bounds = np.searchsorted(gt_group, dt_group, side="left")
+    per_dt = np.searchsorted(gt_group, dt_group, side="right") - bounds
+    total = int(per_dt.sum())
+    if total == 0:
+        return matched, ignored
+    pair_dt = np.repeat(np.arange(n_dt), per_dt)
+    first = np.cumsum(per_dt) - per_dt
+    pair_gt = np.repeat(bounds - first, per_dt) + np.arange(total)
+    iou = pair_iou(dt_boxes[pair_dt], gt_boxes[pair_gt])
+
+    # One entry per (threshold, pair) reaching the threshold
+    thr, pair = np.nonzero(iou[None, :] >= IOU_THRESHOLDS[:, None])
+    ent_dt, ent_gt, ent_iou = pair_dt[pair], pair_gt[pair], iou[pair]
+    ent_rank = dt_rank[ent_dt]
+
+    # Per detection: kept boxes first, then highest IoU, ties to the
+    # last box; one round per detection rank, whose detections belong
+    # to different groups and never compete for a box
+    order = np.lexsort(
+        (-ent_gt, -ent_iou, gt_ignored[ent_gt], ent_dt, thr, ent_rank)
+    )
+    thr, ent_dt, ent_gt = thr[order], ent_dt[order], ent_gt[order]
+    ent_rank = ent_rank[order]
+    rounds = np.flatnonzero(np.diff(ent_rank)) + 1
+    for lo, hi in zip(np.r_[0, rounds], np.r_[rounds, len(order)]):
+        free = np.flatnonzero(~gt_taken[thr[lo:hi], ent_gt[lo:hi]]) + lo
+        key = thr[free] * n_dt + ent_dt[free]
+        _, best = np.unique(key, return_index=True)
+        chosen = free[best]
+        t, d, g = thr[chosen], ent_dt[chosen], ent_gt[chosen]
+        gt_taken[t, g] = True
+        matched[t, d] = True
+        ignored[t, d] = gt_ignored[g]
+    return matched, ignored
+
+
+def _class_ap(
+    tp: np.ndarray, fp: np.ndarray, n_gt: int
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Interpolated (T, R) precision, final (T,) recall and precision."""
+    n_thr = len(IOU_THRESHOLDS)
+    precision = np.zeros((n_thr, len(RECALL_THRESHOLDS)))
+    if tp.shape[1] == 0:
+        return precision, np.zeros(n_thr), np.zeros(n_thr)
+    tp_sum = np.cumsum(tp, axis=1, dtype=np.float64)
+    fp_sum = np.cumsum(fp, axis=1, dtype=np.float64)
+    rc = tp_sum / n_gt
+    pr = tp_sum / (fp_sum + tp_sum + np.spacing(1))
+    final_pr = pr[:, -1].copy()
+    pr = np.maximum.accumulate(pr[:, ::-1], axis=1)[:, ::-1]
+    for t in range(n_thr):
+        inds = np.searchsorted(rc[t], RECALL_THRESHOLDS, side="left")
+        valid = inds < len(rc[t])
+        precision[t, valid] = pr[t, inds[valid]]
+    return precision, rc[:, -1], final_pr
+
+
+def load_metadata(
+    parquet_path: Optional[Path] = None,
+    attributes: Sequence[str] = IMAGE_ATTRIBUTES + BOX_ATTRIBUTES,
+    store: Optional[Path] = None,
+) -> pd.DataFrame:
+    """Val metadata rows (one per box) with the slicing columns.
+
+    Read from the annotation store at store when given, else from the
+    parsed Parquet.
+    """
+    columns = ["image_name", *attributes]
+    if store is None:
+        parquet_path = parquet_path or Config.parsed_data / "val_data.parquet"
+        return load_val_parquet(parquet_path, columns=columns)
+
+    frame = AnnotationStore(store).to_frame("val")[columns]
+    for attr in BOX_ATTRIBUTES:
+        if attr in frame:
+            # Missing flags as None, as the Parquet reader returns them
+            flags = frame[attr].astype(object)
+            frame[attr] = flags.where(frame[attr].notna(), None)
+    return frame
+
+
+class Evaluator:
+    """Incremental COCO-style mAP over a CocoIndex, optionally sliced.
+
+    Args:
+        index: Ground truth (load_coco_index of the COCO JSON)
+        metadata: parser_core rows of the split (see load_metadata);
+            its IMAGE_ATTRIBUTES / BOX_ATTRIBUTES columns become slices
+        max_dets: Detections kept per image and class
+    """
+
+    def __init__(
+        self,
+        index: CocoIndex,
+        metadata: Optional[pd.DataFrame] = None,
+        max_dets: int = MAX_DETS,
+    ):
+        self.index = index
+        self.names = index.names
+        self.max_dets = max_dets
+        self.n_classes = len(index.names)
+        self.gt_image, self.gt_boxes, self.gt_classes = gt_columns(index)
+        # COCO rows are grouped by image already, stable within it
+        self.gt_group = self.gt_image * self.n_classes + self.gt_classes
+        self.gt_order = np.argsort(self.gt_group, kind="stable")
+
+        # slice name -> images in the slice / ground truth ignored
+        self.image_slices: Dict[str, np.ndarray] = {}
+        self.box_slices: Dict[str, np.ndarray] = {}
+        if metadata is not None:
+            self._add_slices(metadata)
+
+        self.seen = np.zeros(index.num_images, dtype=bool)
+        self._batches: List[Dict[str, np.ndarray]] = []
+        self._cols: Optional[Dict[str, np.ndarray]] = None
+
+    def _add_slices(self, metadata: pd.DataFrame) -> None:
+        stems = metadata["image_name"].map(lambda name: Path(name).stem)
+        position = pd.Series(
+            np.arange(self.index.num_images), index=self.index.stems
+        )
+        rows = position.reindex(stems.to_numpy()).to_numpy()
+        known = ~np.isnan(rows)
+        metadata = metadata[known]
+        rows = rows[known].astype(np.int64)
+
+        for attr in IMAGE_ATTRIBUTES:
+            if attr not in metadata:
+                continue
+            values = metadata[attr].to_numpy()
+            for value in pd.unique(values[pd.notna(values)]):
+                in_slice = np.zeros(self.index.num_images, dtype=bool)
+                in_slice[rows[values == value]] = True
+                self.image_slices[f"{attr}={value}"] = in_slice
+
+        box_attrs = [attr for attr in BOX_ATTRIBUTES if attr in metadata]
+        if not box_attrs:
+            return
+        # The k-th metadata row of an image is its k-th COCO annotation
+        counts = np.bincount(rows, minlength=self.index.num_images)
+        if (counts != np.diff(self.index.offsets)).any():
+            raise ValueError(
+                "metadata boxes do not line up with the COCO annotations"
+            )
+        order = np.argsort(rows, kind="stable")
+        for attr in box_attrs:
+            values = metadata[attr].to_numpy()[order]
+            for value in (True, False):
+                self.box_slices[f"{attr}={value}"] = values != value
+
+    def add(
+        self,
+        pred_image,
+        pred_boxes,
+        pred_classes,
+        pred_scores,
+        images=None,
+    ) -> None:
+        """Match the detections of a batch of whole images.
+
+        Args:
+            pred_image: CocoIndex position of each detection's image
+            pred_boxes: (N, 4) xyxy pixel boxes
+            pred_classes, pred_scores: Class index and confidence
+            images: Images the batch covers, including those without
+                detections (default: the images of pred_image)
+        """
+        pred_image = np.asarray(pred_image, dtype=np.int64)
+        pred_boxes = np.asarray(pred_boxes, dtype=np.float64).reshape(-1, 4)
+        pred_classes = np.asarray(pred_classes, dtype=np.int64)
+        pred_scores = np.asarray(pred_scores, dtype=np.float64)
+        images = np.unique(pred_image if images is None else images)
+        if self.seen[images].any():
+            raise ValueError("images were already added")
+        if not np.isin(pred_image, images).all():
+            raise ValueError("detections outside the batch's images")
+        self.seen[images] = True
+
+        group = pred_image * self.n_classes + pred_classes
+        rank = _group_ranks(group, pred_scores)
+        keep = rank < self.max_dets
+        group, rank = group[keep], rank[keep]
+        batch = {
+            "image": pred_image[keep],
+            "classes": pred_classes[keep],
+            "scores": pred_scores[keep],
+            "rank": rank,
+        }
+
+        in_batch = np.zeros(self.index.num_images, dtype=bool)
+        in_batch[images] = True
+        gt_rows = self.gt_order[in_batch[self.gt_image[self.gt_order]]]
+        ignore_sets = {"all": np.zeros(len(self.gt_image), dtype=bool)}
+        ignore_sets.update(self.box_slices)
+        for name, gt_ignored in ignore_sets.items():
+            matched, ignored = _coco_match(
+                group,
+                rank,
+                pred_boxes[keep],
+                self.gt_group[gt_rows],
+                self.gt_boxes[gt_rows],
+                gt_ignored[gt_rows],
+            )
+            batch[f"matched:{name}"] = matched
+            batch[f"ignored:{name}"] = ignored
+        self._batches.append(batch)
+        self._cols = None
+
+    def add_image_results(self, results, stems: Sequence[str]) -> None:
+        """Add ultralytics Results of the images named by stems."""
+        images = [self.index.index_of_stem(stem) for stem in stems]
+        found = result_columns(results)
+        self.add(
+            np.repeat(images, [len(boxes) for boxes, _, _ in found]),
+            np.concatenate([boxes for boxes, _, _ in found]),
+            np.concatenate([classes for _, classes, _ in found]),
+            np.concatenate([scores for _, _, scores in found]),
+            images=images,
+        )
+
+    def slice_names(self) -> List[str]:
+        return ["all", *self.image_slices, *self.box_slices]
+
+    def _columns(self) -> Dict[str, np.ndarray]:
+        if self._cols is None and self._batches:
+            self._cols = {
+                key: np.concatenate(
+                    [batch[key] for batch in self._batches], axis=-1
+                )
+                for key in self._batches[0]
+            }
+        return self._cols or {}
+
+    def class_ap(
+        self, slice_name: str = "all", min_score: float = 0.0
+    ) -> pd.DataFrame:
+        """AP, AP50, AP75, recall and ground truth count per class.
+
+        P50 / R50 are precision and recall at IoU .50 of all kept
+        detections. min_score drops detections below a confidence;
+        matching never depends on lower scored detections, so this
+        equals evaluating only the detections >= min_score.
+        """
+        images = self.seen.copy()
+        if slice_name in self.image_slices:
+            images &= self.image_slices[slice_name]
+        match_set = slice_name if slice_name in self.box_slices else "all"
+        gt_ignored = self.box_slices.get(match_set)
+
+        cols = self._columns()
+        in_slice = np.zeros(0, dtype=bool)
+        if cols:
+            in_slice = images[cols["image"]] & (cols["scores"] >= min_score)
+        gt_kept = images[self.gt_image]
+        if gt_ignored is not None:
+            gt_kept &= ~gt_ignored
+        n_gt = np.bincount(self.gt_classes[gt_kept], minlength=self.n_classes)
+
+        rows = []
+        for k, name in enumerate(self.names):
+            ap = ap50 = ap75 = recall = p50 = r50 = np.nan
+            if n_gt[k]:
+                sel = np.zeros(0, dtype=np.int64)
+                if cols:
+                    sel = np.flatnonzero(in_slice & (cols["classes"] == k))
+                    # pycocotools' order: score, then image id, then
+                    # the image's own order
+                    sel = sel[
+                        np.lexsort(
+                            (
+                                cols["rank"][sel],
+                                self.index.image_ids[cols["image"][sel]],
+                                -cols["scores"][sel],
+                            )
+                        )
+                    ]
+                    matched = cols[f"matched:{match_set}"][:, sel]
+                    ignored = cols[f"ignored:{match_set}"][:, sel]
+                else:
+                    matched = ignored = np.zeros(
+                        (len(IOU_THRESHOLDS), 0), dtype=bool
+                    )
+                precision, rc, pr = _class_ap(
+                    matched & ~ignored, ~matched & ~ignored, n_gt[k]
+                )
+                ap = precision.mean()
+                ap50, ap75 = precision[0].mean(), precision[5].mean()
+                recall = rc.mean()
+                p50, r50 = pr[0], rc[0]
+            rows.append(
+                {
+                    "class": name,
+                    "AP": ap,
+                    "AP50": ap50,
+                    "AP75": ap75,
+                    "recall": recall,
+                    "P50": p50,
+                    "R50": r50,
+                    "gt": int(n_gt[k]),
+                }
+            )
+        return pd.DataFrame(rows).set_index("class")
+
+    def summary(
+        self, min_score: float = 0.0, slices: Optional[Sequence[str]] = None
+    ) -> pd.DataFrame:
+        """Class means of class_ap for every slice (default: all)."""
+        rows = []
+        for name in slices or self.slice_names():
+            per_class = self.class_ap(name, min_score)
+            rows.append(
+                {
+                    "slice": name,
+                    "AP": per_class["AP"].mean(),
+                    "AP50": per_class["AP50"].mean(),
+                    "AP75": per_class["AP75"].mean(),
+                    "P50": per_class["P50"].mean(),
+                    "R50": per_class["R50"].mean(),
+                    "gt": int(per_class["gt"].sum()),
+                }
+            )
+        return pd.DataFrame(rows).set_index("slice")
+
+
+def load_coco_results(
+    path: Path, index: CocoIndex
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """(image, xyxy boxes, classes, scores) of a COCO results file.
+
+    Entries of images or categories absent from the index are dropped;
+    image_id may be the COCO id or the file stem (ultralytics).
+    """
+    with open(path, "rb") as f:
+        results = json_codec.load(f)
+    cat_to_class = dict(
+        zip(index.category_ids.tolist(), index.classes.tolist())
+    )
+    by_id = {i: pos for pos, i in enumerate(index.image_ids.tolist())}
+    by_stem = {stem: pos for pos, stem in enumerate(index.stems)}
+
+    rows = []
+    for r in results:
+        image = by_stem.get(str(r["image_id"]), by_id.get(r["image_id"]))
+        cls = cat_to_class.get(r["category_id"])
+        if image is None or cls is None:
+            continue
+        rows.append((image, cls, r["score"], *r["bbox"]))
+    table = np.array(rows, dtype=np.float64).reshape(-1, 7)
+    return (
+        table[:, 0].astype(np.int64),
+        xywh_to_xyxy(table[:, 3:]),
+        table[:, 1].astype(np.int64),
+        table[:, 2],
+    )
+
+
+def cached_predictions(
+    model_path: Path, images_dir: Path, index: CocoIndex, **params
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """(image, xyxy boxes, classes, scores, images) from the cache.
+
+    Runs the model on the index images missing from the prediction
+    cache (params go to PredictionCache); images holds the positions
+    of every image found on disk.
+    """
+    position = {stem: pos for pos, stem in enumerate(index.stems)}
+    paths = sorted(
+        path
+        for path in scan_images(images_dir).values()
+        if path.stem in position
+    )
+    frame = PredictionCache(model_path, **params).predict(paths)
+    return (
+        frame["image"].map(position).to_numpy(dtype=np.int64),
+        frame[["x1", "y1", "x2", "y2"]].to_numpy(dtype=np.float64),
+        frame["cls"].to_numpy(dtype=np.int64),
+        frame["score"].to_numpy(dtype=np.float64),
+        np.array([position[path.stem] for path in paths], dtype=np.int64),
+    )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--predictions", type=Path, help="COCO results")
+    source.add_argument(
+        "--model", type=Path, help="Weights, predicted through the cache"
+    )
+    parser.add_argument("--images", type=Path, default=Config.val_images)
+    parser.add_argument("--coco", type=Path, default=Config.val_json)
+    parser.add_argument("--parquet", type=Path)
+    parser.add_argument(
+        "--store", type=Path, help="Annotation store instead of COCO/Parquet"
+    )
+    parser.add_argument("--per-class", default="all", metavar="SLICE")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    index = load_index(args.coco, args.store)
+    evaluator = Evaluator(index, load_metadata(args.parquet, store=args.store))
+    if args.model:
+        *columns, images = cached_predictions(args.model, args.images, index)
+    else:
+        columns = load_coco_results(args.predictions, index)
+        images = np.arange(index.num_images)
+    evaluator.add(*columns, images=images)
+    pd.set_option("display.width", 120)
+    print(evaluator.summary().round(4).to_string())
+    print(f"\nPer class ({args.per_class}):")
+    print(evaluator.class_ap(args.per_class).round(4).to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+"""
+CPU export and latency/throughput benchmark of a trained YOLO checkpoint.
+
+Exports the checkpoint to ONNX (dynamic batch, imgsz square input) with
+ultralytics, checks that ONNX Runtime reproduces the PyTorch outputs on
+sample val images, then times both runtimes on CPU for every batch size
+and thread count of the sweep. Timings cover the network forward pass
+on letterboxed val images; decoding, letterboxing and NMS are the same
+for both runtimes and left out. Each point reports p50/p95/p99 batch
+latency and images/sec; the report is written as JSON next to the
+exported model. On a parity mismatch only PyTorch is timed, and the
+run exits with status 1 once the report is written.
+
+ONNX Runtime is not a project dependency: `uv pip install onnxruntime`.
+
+Usage:
+    python -m autonomous_vision.object_detection.export_benchmark
+        --model models/yolo11s_bdd.pt [--onnx models/export/x.onnx]
+        [--batch-sizes 1 4 8 16] [--threads 1 2 4] [--iterations 50]
+"""
+
+import argparse
+import os
+import platform
+import shutil
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Sequence
+
+import cv2
+import numpy as np
+import torch
+
+from autonomous_vision.config import Config
+from autonomous_vision.data_parser.manifest import file_digest
+from autonomous_vision.object_detection.loader_benchmark import default_sweep
+from autonomous_vision.utils import json_codec
+from autonomous_vision.utils.helper import scan_images
+
+BATCH_SIZES = (1, 4, 8, 16)
+
+# Untimed runs per sweep point, for allocator and thread pool warm-up
+WARMUP_RUNS = 3
+
+# Largest raw output differences accepted between ONNX and PyTorch:
+# boxes in input pixels, class scores in [0, 1]
+PARITY_BOX_ATOL = 0.05
+PARITY_SCORE_ATOL = 1e-3
+
+# Network forward pass: (B, 3, imgsz, imgsz) float32 -> raw outputs
+Forward = Callable[[np.ndarray], np.ndarray]
+
+
+class TorchRuntime:
+    """The PyTorch checkpoint, fused as for export, on CPU."""
+
+    name = "torch"
+
+    def __init__(self, model_path: Path):
+        from ultralytics import YOLO
+
+        self.model = YOLO(str(model_path)).model.fuse(verbose=False)
+        self.model = self.model.float().cpu().eval()
+
+    def session(self, threads: int) -> Forward:
+        torch.set_num_threads(threads)
+
+        def forward(batch: np.ndarray) -> np.ndarray:
+            with torch.inference_mode():
+                out = self.model(torch.from_numpy(batch))
+            return (out[0] if isinstance(out, (list, tuple)) else out).numpy()
+
+        return forward
+
+
+class OnnxRuntime:
+    """An ONNX model on ONNX Runtime's CPU execution provider."""
+
+    def __init__(self, onnx_path: Path, name: str = "onnx"):
+        import onnxruntime
+
+        self.ort = onnxruntime
+        self.path = Path(onnx_path)
+        self.name = name
+
+    def session(self, threads: int) -> Forward:
+        options = self.ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        session = self.ort.InferenceSession(
+            str(self.path), options, providers=["CPUExecutionProvider"]
+        )
+        input_name = session.get_inputs()[0].name
+
+        def forward(batch: np.ndarray) -> np.ndarray:
+            return session.run(None, {input_name: batch})[0]
+
+        return forward
+
+
+def export_onnx(model_path: Path, imgsz: int, output_dir: Path) -> Path:
+    """Export the checkpoint to ONNX with a dynamic batch axis."""
+    from ultralytics import YOLO
+
+    exported = YOLO(str(model_path)).export(
+        format="onnx", imgsz=imgsz, dynamic=True, simplify=True, device="cpu"
+    )
+    output_dir.mkdir(parents=True, exist_ok=True)
+    target = output_dir / Path(exported).name
+    shutil.move(exported, target)
+    return target
+
+
+def letterbox(img: np.ndarray, imgsz: int) -> np.ndarray:
+    """Fit the longer side to imgsz and pad to a square canvas."""
+    height, width = img.shape[:2]
+    r = imgsz / max(height, width)
+    if r != 1:
+        size = (round(width * r), round(height * r))
+        img = cv2.resize(img, size, interpolation=cv2.INTER_LINEAR)
+        height, width = img.shape[:2]
+    top = (imgsz - height) // 2
+    left = (imgsz - width) // 2
+    return cv2.copyMakeBorder(
+        img,
+        top,
+        imgsz - height - top,
+        left,
+        imgsz - width - left,
+        cv2.BORDER_CONSTANT,
+        value=(114, 114, 114),
+    )
+
+
+def model_input(paths: Sequence[Path], imgsz: int) -> np.ndarray:
+    """Images letterboxed to imgsz as one float32 model input batch."""
+    images = [
+        letterbox(cv2.imread(str(p), cv2.IMREAD_COLOR), imgsz) for p in paths
+    ]
+    # BGR HWC uint8 -> RGB CHW float in [0, 1], as ultralytics feeds it
+    batch = np.stack(images)[..., ::-1].transpose(0, 3, 1, 2)
+    return np.ascontiguousarray(batch, dtype=np.float32) / 255
+
+
+def load_inputs(images_dir: Path, n_images: int, imgsz: int) -> np.ndarray:
+    """The first n_images images of images_dir as model input."""
+    paths = sorted(scan_images(images_dir).values())[:n_images]
+    if not paths:
+        raise FileNotFoundError(f"No images in {images_dir}")
+    return model_input(paths, imgsz)
+
+
+def check_parity(
+    reference: Forward, candidate: Forward, inputs: np.ndarray
+) -> Dict[str, object]:
+    """Largest box and class score differences, image by image."""
+    box_diff = score_diff = 0.0
+    for i in range(len(inputs)):
+        expected = reference(inputs[i : i + 1])
+        actual = candidate(inputs[i : i + 1])
+        diff = np.abs(expected - actual)
+        box_diff = max(box_diff, float(diff[:, :4].max()))
+        score_diff = max(score_diff, float(diff[:, 4:].max()))
+    return {
+        "images": len(inputs),
+        "max_box_diff": box_diff,
+        "max_score_diff": score_diff,
+        "ok": box_diff <= PARITY_BOX_ATOL and score_diff <= PARITY_SCORE_ATOL,
+    }
+
+
+def time_forward(
+    forward: Forward, inputs: np.ndarray, batch_size: int, iterations: int
+) -> Dict[str, float]:
+    """Latency percentiles and throughput of repeated batches."""
+    batch = np.ascontiguousarray(
+        np.take(inputs, np.arange(batch_size), axis=0, mode="wrap")
+    )
+    for _ in range(WARMUP_RUNS):
+        forward(batch)
+    latencies = np.empty(iterations)
+    for i in range(iterations):
+        start = time.perf_counter()
+        forward(batch)
+        latencies[i] = time.perf_counter() - start
+    p50, p95, p99 = 1000 * np.percentile(latencies, (50, 95, 99))
+    return {
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "images_per_sec": float(batch_size * iterations / latencies.sum()),
+    }
+
+
+def benchmark(
+    runtimes: Sequence,
+    inputs: np.ndarray,
+    batch_sizes: Sequence[int],
+    threads: Sequence[int],
+    iterations: int,
+) -> List[Dict[str, object]]:
+    """Time every runtime at every thread count and batch size."""
+    print(
+        f"{'runtime':>10} {'threads':>7} {'batch':>5} {'p50_ms':>9} "
+        f"{'p95_ms':>9} {'p99_ms':>9} {'img/s':>8}"
+    )
+    results = []
+    for runtime in runtimes:
+        for n_threads in threads:
+            forward = runtime.session(n_threads)
+            for batch_size in batch_sizes:
+                result = {
+                    "runtime": runtime.name,
+                    "threads": n_threads,
+                    "batch": batch_size,
+                    **time_forward(forward, inputs, batch_size, iterations),
+                }
+                results.append(result)
+                print(
+                    f"{runtime.name:>10} {n_threads:>7} {batch_size:>5} "
+                    f"{result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} "
+                    f"{result['p99_ms']:>9.2f} "
+                    f"{result['images_per_sec']:>8.1f}"
+                )
+    return results
+
+
+def best_by_runtime(
+    results: Sequence[Dict[str, object]],
+) -> Dict[str, Dict[str, object]]:
+    """Highest throughput point of each runtime."""
+    best: Dict[str, Dict[str, object]] = {}
+    for result in results:
+        name = result["runtime"]
+        if name not in best or (
+            result["images_per_sec"] > best[name]["images_per_sec"]
+        ):
+            best[name] = result
+    return best
+
+
+def system_info() -> Dict[str, object]:
+    """Machine and library versions the timings depend on."""
+    import onnxruntime
+
+    return {
+        "cpu_count": os.cpu_count(),
+        "processor": platform.processor() or platform.machine(),
+        "torch": torch.__version__,
+        "onnxruntime": onnxruntime.__version__,
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--model", type=Path, required=True)
+    parser.add_argument(
+        "--onnx", type=Path, help="Benchmark this export instead"
+    )
+    parser.add_argument("--images", type=Path, default=Config.val_images)
+    parser.add_argument("--imgsz", type=int, default=Config.imgsz)
+    parser.add_argument(
+        "--batch-sizes", type=int, nargs="+", default=BATCH_SIZES
+    )
+    parser.add_argument("--threads", type=int, nargs="+")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--report", type=Path, help="JSON report path")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    onnx_path = args.onnx or export_onnx(
+        args.model, args.imgsz, Config.export_dir
+    )
+    print(f"ONNX model: {onnx_path}")
+
+    inputs = load_inputs(
+        args.images, max(Config.export_parity_images, 1), args.imgsz
+    )
+    runtimes = [TorchRuntime(args.model), OnnxRuntime(onnx_path)]
+    parity = check_parity(
+        runtimes[0].session(1), runtimes[1].session(1), inputs
+    )
+    print(
+        f"Parity on {parity['images']} images: boxes "
+        f"{parity['max_box_diff']:.2e} px, scores "
+        f"{parity['max_score_diff']:.2e} "
+        f"({'ok' if parity['ok'] else 'MISMATCH'})"
+    )
+    if not parity["ok"]:
+        # Timings of a model that computes something else mean nothing
+        print("Skipping ONNX Runtime timings")
+        runtimes = runtimes[:1]
+
+    threads = args.threads or default_sweep()[1:]
+    results = benchmark(
+        runtimes, inputs, args.batch_sizes, threads, args.iterations
+    )
+    best = best_by_runtime(results)
+    for name, result in best.items():
+        print(
+            f"Best {name}: {result['images_per_sec']:.1f} img/s "
+            f"(batch {result['batch']}, {result['threads']} threads)"
+        )
+
+    report = {
+        **system_info(),
+        "model": str(args.model),
+        "weights": file_digest(args.model),
+        "onnx": str(onnx_path),
+        "imgsz": args.imgsz,
+        "iterations": args.iterations,
+        "parity": parity,
+        "results": results,
+        "best": best,
+    }
+    path = args.report or onnx_path.with_name(
+        f"{onnx_path.stem}_cpu_benchmark.json"
+    )
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json_codec.dumps(report, indent=1))
+    print(f"Report -> {path}")
+    if not parity["ok"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+Pre-resized training image cache.
+
+Writes the train images resized the way ultralytics' training loader
+would resize them for Config.imgsz (long side to imgsz with
+INTER_LINEAR, aspect ratio kept as rect training expects), re-encoded as
+JPEG, to <image_cache_dir>/imgsz_<imgsz>/images/train. Val stays on the
+original images, so validation and its predictions.json keep the pixel
+frame of Config.val_json. The matching
+labels/<split> entry links to the real label directory, since labels are
+normalized and size independent. The loader then finds images already
+at size and skips the full-resolution decode + resize every epoch.
+
+The cache is keyed by imgsz (its directory) and JPEG quality (its
+manifest); images are only re-encoded when their source size/mtime
+changed, and cached copies of removed sources are deleted.
+"""
+
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional, Sequence, Tuple
+
+import cv2
+
+from autonomous_vision.config import Config
+from autonomous_vision.utils import json_codec
+from autonomous_vision.utils.image_index import open_index
+
+CACHE_VERSION = 1
+
+# Images per task sent to a worker process
+CACHE_CHUNK_SIZE = 64
+
+
+def cache_root(imgsz: Optional[int] = None) -> Path:
+    """Cache directory for one image size."""
+    return Config.image_cache_dir / f"imgsz_{imgsz or Config.imgsz}"
+
+
+def cached_size(width: int, height: int, imgsz: int) -> Tuple[int, int]:
+    """Size ultralytics resizes a width x height image to for imgsz."""
+    r = imgsz / max(width, height)
+    return (
+        min(math.ceil(width * r), imgsz),
+        min(math.ceil(height * r), imgsz),
+    )
+
+
+def _resize_image(src: str, dst: str, imgsz: int, quality: int) -> bool:
+    """Write src resized for imgsz to dst; False if it cannot be read."""
+    img = cv2.imread(src)
+    if img is None:
+        return False
+    height, width = img.shape[:2]
+    size = cached_size(width, height, imgsz)
+    if size != (width, height):
+        # Training (augment=True) resizes with INTER_LINEAR either way
+        img = cv2.resize(img, size, interpolation=cv2.INTER_LINEAR)
+
+    # Keep the .jpg suffix so cv2 picks the encoder
+    tmp = dst[: -len(".jpg")] + ".tmp.jpg"
+    if not cv2.imwrite(tmp, img, [cv2.IMWRITE_JPEG_QUALITY, quality]):
+        return False
+    os.replace(tmp, dst)
+    return True
+
+
+def _resize_chunk(
+    jobs: Sequence[Tuple[str, str]], imgsz: int, quality: int
+) -> list:
+    return [_resize_image(src, dst, imgsz, quality) for src, dst in jobs]
+
+
+def _link_labels(link: Path, labels_dir: Path) -> None:
+    """Point link at labels_dir, replacing a link to elsewhere."""
+    target = labels_dir.resolve()
+    if link.is_symlink():
+        if link.resolve() == target:
+            return
+        link.unlink()
+    link.parent.mkdir(parents=True, exist_ok=True)
+    link.symlink_to(target, target_is_directory=True)
+
+
+def build_image_cache(
+    images_dir: Path,
+    labels_dir: Path,
+    split: str,
+    imgsz: Optional[int] = None,
+    workers: Optional[int] = None,
+) -> Path:
+    """Bring the resized cache of one split up to date.
+
+    Returns:
+        The cached images directory to train from
+    """
+    imgsz = imgsz or Config.imgsz
+    quality = Config.image_cache_quality
+    root = cache_root(imgsz)
+    out_dir = root / "images" / split
+    out_dir.mkdir(parents=True, exist_ok=True)
+    _link_labels(root / "labels" / split, labels_dir)
+
+    manifest_path = root / f"{split}_manifest.json"
+    recorded: Dict[str, list] = {}
+    if manifest_path.exists():
+        data = json_codec.loads(manifest_path.read_bytes())
+        if (
+            data.get("version") == CACHE_VERSION
+            and data.get("quality") == quality
+        ):
+            recorded = data["images"]
+
+    # Cached copies are always .jpg, named after the source stem
+    index = open_index(images_dir)
+    sources: Dict[str, str] = {}
+    for name in index.paths():
+        cached = Path(name).stem + ".jpg"
+        if cached in sources:
+            raise ValueError(
+                f"{images_dir}: {sources[cached]} and {name} share a stem"
+            )
+        sources[cached] = name
+    # Sources are stat'ed directly: the index only re-lists directories
+    # whose mtime changed, so it misses a file rewritten in place
+    current: Dict[str, list] = {}
+    for cached, name in sources.items():
+        stat = index.lookup(name).stat()
+        current[cached] = [stat.st_size, stat.st_mtime_ns]
+    stale = [
+        cached
+        for cached, stat in current.items()
+        if recorded.get(cached) != stat or not (out_dir / cached).exists()
+    ]
+
+    jobs = [
+        (str(index.lookup(sources[cached])), str(out_dir / cached))
+        for cached in stale
+    ]
+    chunks = [
+        jobs[i : i + CACHE_CHUNK_SIZE]
+        for i in range(0, len(jobs), CACHE_CHUNK_SIZE)
+    ]
+    failed = 0
+    with ProcessPoolExecutor(
+        max_workers=workers or Config.image_cache_workers or None
+    ) as pool:
+        results = pool.map(
+            _resize_chunk,
+            chunks,
+            [imgsz] * len(chunks),
+            [quality] * len(chunks),
+        )
+        for chunk, ok in zip(chunks, results):
+            for (src, dst), done in zip(chunk, ok):
+                if not done:
+                    failed += 1
+                    current.pop(Path(dst).name)
+                    print(f"Could not cache {src}")
+
+    deleted = 0
+    for entry in os.scandir(out_dir):
+        if entry.name not in current and entry.is_file():
+            os.unlink(entry.path)
+            deleted += 1
+
+    data = {"version": CACHE_VERSION, "quality": quality}
+    data["images"] = current
+    manifest_path.write_text(json_codec.dumps(data, separators=(",", ":")))
+    print(
+        f"Image cache {out_dir}: {len(stale) - failed} resized, "
+        f"{len(current) - len(stale) + failed} unchanged, "
+        f"{deleted} deleted, {failed} failed"
+    )
+    return out_dir
+
+
+def main():
+    """Build the resized cache for the train images."""
+    build_image_cache(
+        Path(Config.train_images), Path(Config.train_labels_yolo), "train"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,68 +1,561 @@
+import json
+import os
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import chain
 from pathlib import Path
-from typing import Dict, List
+from typing import (
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
 
+import numpy as np
 import yaml
 
+from autonomous_vision.config import Config
+from autonomous_vision.object_detection.data_loader import CocoIndex
 from autonomous_vision.utils.helper import coco_bbox_to_yolo_norm
 
 
+def yolo_label_line(
+    cls_idx: int, bbox: Sequence[float], img_width: int, img_height: int
+) -> Optional[str]:
+    """Format one COCO bbox as a clipped YOLO label line.
+
+    Returns None for degenerate boxes.
+    """
+    x, y, w, h = bbox
+    if w <= 0 or h <= 0:
+        return None
+
+    cxn, cyn, wn, hn = coco_bbox_to_yolo_norm(
+        x, y, w, h, img_width, img_height
+    )
+    cxn = min(max(cxn, 0.0), 1.0)
+    cyn = min(max(cyn, 0.0), 1.0)
+    wn = min(max(wn, 0.0), 1.0)
+    hn = min(max(hn, 0.0), 1.0)
+
+    return f"{cls_idx} {cxn:.6f} {cyn:.6f} {wn:.6f} {hn:.6f}"
+
+
+# printf form of yolo_label_line's output
+YOLO_LINE_FORMAT = "%d %.6f %.6f %.6f %.6f"
+
+# Fixed-width line "c x.xxxxxx y.yyyyyy w.wwwwww h.hhhhhh\n" as records:
+# each value is its "0."/"1." prefix plus two groups of three decimals
+_LINE = np.dtype(
+    [("cls", "S1")]
+    + [
+        field
+        for j in range(4)
+        for field in (
+            (f"sep{j}", "S1"),
+            (f"whole{j}", "S2"),
+            (f"high{j}", "S3"),
+            (f"low{j}", "S3"),
+        )
+    ]
+    + [("newline", "S1")]
+)
+_DIGIT = np.array([str(i).encode() for i in range(10)], dtype="S1")
+_THREE_DIGITS = np.array(
+    [f"{i:03d}".encode() for i in range(1000)], dtype="S3"
+)
+
+
+def _fixed_width_lines(cls_idx: np.ndarray, micros: np.ndarray) -> bytes:
+    """Render single-digit classes and (N, 4) values given in millionths.
+
+    Every value lies in [0, 1e6], so each line has the same layout and
+    is filled field by field with lookups instead of formatting.
+    """
+    lines = np.empty(len(cls_idx), dtype=_LINE)
+    lines["cls"] = np.take(_DIGIT, cls_idx)
+    for j in range(4):
+        whole, frac = np.divmod(micros[:, j], 1_000_000)
+        high, low = np.divmod(frac, 1000)
+        lines[f"sep{j}"] = b" "
+        lines[f"whole{j}"] = np.where(whole == 1, b"1.", b"0.")
+        lines[f"high{j}"] = np.take(_THREE_DIGITS, high)
+        lines[f"low{j}"] = np.take(_THREE_DIGITS, low)
+    lines["newline"] = b"\n"
+    return lines.tobytes()
+
+
+def _yolo_values(
+    cls_idx: np.ndarray,
+    bboxes: np.ndarray,
+    offsets: np.ndarray,
+    img_width: Union[int, np.ndarray],
+    img_height: Union[int, np.ndarray],
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Convert and clip a batch of boxes as yolo_label_line does.
+
+    Returns the classes and clipped (K, 4) values of the kept boxes, the
+    per-image offsets into them and the values in millionths, rounded
+    as printf rounds them (0 for NaN).
+    """
+    bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    counts = np.diff(offsets)
+    n_images = len(counts)
+    widths = np.repeat(np.broadcast_to(img_width, n_images), counts)
+    heights = np.repeat(np.broadcast_to(img_height, n_images), counts)
+
+    x, y, w, h = bboxes.T
+    # Same test as yolo_label_line (NaN sizes are kept)
+    keep = ~((w <= 0) | (h <= 0))
+    cls_idx = np.asarray(cls_idx, dtype=np.int64)[keep]
+    widths, heights = widths[keep], heights[keep]
+    norm = np.column_stack(
+        [
+            (x + w / 2.0)[keep] / widths,
+            (y + h / 2.0)[keep] / heights,
+            w[keep] / widths,
+            h[keep] / heights,
+        ]
+    )
+    np.clip(norm, 0.0, 1.0, out=norm)
+
+    image_of_box = np.repeat(np.arange(n_images), counts)[keep]
+    kept = np.zeros(n_images + 1, dtype=np.int64)
+    np.cumsum(np.bincount(image_of_box, minlength=n_images), out=kept[1:])
+
+    # Float error in norm * 1e6 is far below 1e-6, so only values this
+    # close to a .5 tie could round differently from printf
+    micros = norm * 1e6
+    rounded = np.floor(micros + 0.5)
+    tie = ~(np.abs(micros - rounded) < 0.5 - 1e-6)
+    for i, j in zip(*np.nonzero(tie)):
+        value = norm[i, j]
+        digits = f"{value:.6f}" if np.isfinite(value) else "0"
+        rounded[i, j] = int(digits.replace(".", ""))
+    return cls_idx, norm, kept, rounded.astype(np.int32)
+
+
+def _label_texts(
+    cls_idx: np.ndarray,
+    values: np.ndarray,
+    micros: np.ndarray,
+    kept: np.ndarray,
+    plain: np.ndarray,
+) -> Iterator[str]:
+    """Per-image texts for kept boxes grouped by the offsets in kept.
+
+    Rows flagged plain are rendered fixed-width from micros; an image
+    holding any other row is printf-formatted from values.
+    """
+    text = _fixed_width_lines(
+        np.where(plain, cls_idx, 0), np.where(plain[:, None], micros, 0)
+    )
+    image_of_box = np.repeat(np.arange(len(kept) - 1), np.diff(kept))
+    other = np.bincount(image_of_box[~plain], minlength=len(kept) - 1)
+
+    bounds = kept.tolist()
+    for i, n_other in enumerate(other.tolist()):
+        start, stop = bounds[i], bounds[i + 1]
+        if start == stop:
+            yield ""
+        elif n_other:
+            yield "\n".join(
+                YOLO_LINE_FORMAT % (cls, *row)
+                for cls, row in zip(
+                    cls_idx[start:stop].tolist(),
+                    values[start:stop].tolist(),
+                )
+            )
+        else:
+            yield text[
+                start * _LINE.itemsize : stop * _LINE.itemsize - 1
+            ].decode("ascii")
+
+
+def _single_digit(cls_idx: np.ndarray) -> np.ndarray:
+    return (cls_idx >= 0) & (cls_idx <= 9)
+
+
+def yolo_label_texts(
+    cls_idx: np.ndarray,
+    bboxes: np.ndarray,
+    offsets: np.ndarray,
+    img_width: Union[int, np.ndarray],
+    img_height: Union[int, np.ndarray],
+) -> Iterator[str]:
+    """Label file contents for a batch of images.
+
+    Boxes are COCO [x, y, w, h] rows grouped by image: image i owns rows
+    offsets[i]:offsets[i + 1]. Image sizes are scalars or per-image
+    arrays. Conversion and clipping run as float64 array math in the
+    same operation order as yolo_label_line. Lines are then rendered as
+    fixed-width bytes from the values rounded to millionths; images
+    holding a value the layout cannot show (NaN, -0.0) or a class above
+    9 are printf-formatted instead. Either way every text equals joining
+    the image's yolo_label_line output.
+    """
+    cls_idx, norm, kept, micros = _yolo_values(
+        cls_idx, bboxes, offsets, img_width, img_height
+    )
+    plain = _single_digit(cls_idx)
+    plain &= (np.isfinite(norm) & ~np.signbit(norm)).all(axis=1)
+    return _label_texts(cls_idx, norm, micros, kept, plain)
+
+
+def _write_if_changed(path: Path, data: bytes) -> bool:
+    """Write data unless the file already holds exactly these bytes."""
+    try:
+        if path.stat().st_size == len(data) and path.read_bytes() == data:
+            return False
+    except FileNotFoundError:
+        pass
+    path.write_bytes(data)
+    return True
+
+
+class LabelDirWriter:
+    """
+    Incremental writer for a directory of YOLO label files:
+      - a file is only rewritten when its content differs from disk
+        (size first, then bytes), so unchanged labels keep their mtime
+      - writes run on a thread pool with a bounded number in flight
+      - on close, when prune is set, .txt files that were not written
+        in this pass (and are not in keep) are deleted
+    """
+
+    def __init__(
+        self,
+        labels_dir: Path,
+        prune: bool = True,
+        keep: Iterable[str] = (),
+        workers: Optional[int] = None,
+    ):
+        self.labels_dir = labels_dir
+        self.prune = prune
+        self.stats = {"written": 0, "skipped": 0, "deleted": 0}
+        self._stems: Set[str] = set(keep)
+        workers = workers or Config.label_write_workers
+        self._max_pending = 4 * workers
+        self._pending: Deque[Future] = deque()
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+        labels_dir.mkdir(parents=True, exist_ok=True)
+
+    def _collect(self, future: Future) -> None:
+        key = "written" if future.result() else "skipped"
+        self.stats[key] += 1
+
+    def _drain(self, limit: int) -> None:
+        while len(self._pending) > limit:
+            self._collect(self._pending.popleft())
+
+    def write(self, stem: str, text: str) -> None:
+        """Queue the label file <stem>.txt with the given content."""
+        if stem in self._stems:
+            # Let an earlier write of the same file land first
+            self._drain(0)
+        self._stems.add(stem)
+        path = self.labels_dir / (stem + ".txt")
+        self._pending.append(
+            self._pool.submit(_write_if_changed, path, text.encode())
+        )
+        self._drain(self._max_pending)
+
+    def close(self) -> Dict[str, int]:
+        """Finish pending writes, prune stale files and return counts."""
+        self._drain(0)
+        self._pool.shutdown()
+        if self.prune:
+            for entry in os.scandir(self.labels_dir):
+                stem, ext = os.path.splitext(entry.name)
+                if (
+                    ext == ".txt"
+                    and stem not in self._stems
+                    and entry.is_file()
+                ):
+                    os.unlink(entry.path)
+                    self.stats["deleted"] += 1
+        return self.stats
+
+
+def _coco_arrays(
+    images: Dict[int, dict], anns_by_image: Dict[int, List[dict]]
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Classes, flat bboxes, offsets, widths and heights from load_coco."""
+    groups = [anns_by_image.get(img_id, []) for img_id in images]
+    offsets = np.zeros(len(groups) + 1, dtype=np.int64)
+    np.cumsum([len(group) for group in groups], out=offsets[1:])
+    n_boxes = int(offsets[-1])
+
+    anns = chain.from_iterable(groups)
+    cls_idx = np.fromiter(
+        (ann["_cls"] for ann in anns), dtype=np.int64, count=n_boxes
+    )
+    anns = chain.from_iterable(groups)
+    bboxes = np.fromiter(
+        chain.from_iterable(ann["bbox"] for ann in anns),
+        dtype=np.float64,
+        count=4 * n_boxes,
+    )
+    widths = np.fromiter(
+        (im["width"] for im in images.values()), dtype=np.float64
+    )
+    heights = np.fromiter(
+        (im["height"] for im in images.values()), dtype=np.float64
+    )
+    return cls_idx, bboxes, offsets, widths, heights
+
+
 def write_yolo_labels(
     images: Dict[int, dict],
     anns_by_image: Dict[int, List[dict]],
     labels_dir: Path,
+    keep: Iterable[str] = (),
+) -> Dict[str, int]:
+    """Write YOLO format labels to files.
+
+    A whole split is converted at once by yolo_label_texts; the files
+    match the per-annotation yolo_label_line output. Only files whose
+    content changed are rewritten, and label files of images no longer
+    in the split are deleted unless their stem is in keep.
+
+    Returns:
+        Counts of written, skipped (unchanged) and deleted files
+    """
+    texts = yolo_label_texts(*_coco_arrays(images, anns_by_image))
+    writer = LabelDirWriter(labels_dir, keep=keep)
+    for im, text in zip(images.values(), texts):
+        writer.write(Path(im["file_name"]).stem, text)
+    return writer.close()
+
+
+def write_index_labels(
+    index: CocoIndex, labels_dir: Path, keep: Iterable[str] = ()
+) -> Dict[str, int]:
+    """write_yolo_labels for a CocoIndex, reading its arrays directly."""
+    texts = yolo_label_texts(
+        index.classes, index.boxes, index.offsets, index.widths, index.heights
+    )
+    writer = LabelDirWriter(labels_dir, keep=keep)
+    for stem, text in zip(index.stems, texts):
+        writer.write(stem, text)
+    return writer.close()
+
+
+# Packed archive layout: magic, little-endian uint64 header size, JSON
+# header, then each array's raw bytes at an aligned offset
+ARCHIVE_MAGIC = b"YOLOPACK"
+ARCHIVE_VERSION = 1
+_ARCHIVE_ALIGN = 64
+
+
+def save_label_archive(
+    archive_path: Path,
+    stems: Sequence[str],
+    cls_idx: np.ndarray,
+    bboxes: np.ndarray,
+    offsets: np.ndarray,
+    img_width: Union[int, np.ndarray],
+    img_height: Union[int, np.ndarray],
 ) -> int:
-    """Write YOLO format labels to files."""
-    labels_dir.mkdir(parents=True, exist_ok=True)
-    n_files = 0
+    """Pack the YOLO labels of a batch of images into one file.
 
-    for img_id, im in images.items():
-        width, height = im["width"], im["height"]
-        lines: List[str] = []
+    Takes the same box arrays as yolo_label_texts plus one stem per
+    image. Values are stored in millionths exactly as the .txt files
+    print them, so LabelArchive.text reproduces every file byte for
+    byte (a printed "-0.000000" comes back as "0.000000").
 
-        for ann in anns_by_image.get(img_id, []):
-            x, y, w, h = ann["bbox"]
-            if w <= 0 or h <= 0:
-                continue
+    Returns:
+        Number of images packed
+    """
+    cls_idx, norm, kept, micros = _yolo_values(
+        cls_idx, bboxes, offsets, img_width, img_height
+    )
+    if not np.isfinite(norm).all():
+        raise ValueError("Cannot pack non-finite label values")
+
+    arrays = {
+        "stems": np.array([s.encode("utf-8") for s in stems], dtype=bytes),
+        "offsets": kept,
+        "classes": cls_idx.astype(np.int32),
+        "values": micros,
+    }
+    if len(arrays["stems"]) != len(kept) - 1:
+        raise ValueError("Expected one stem per image")
+
+    header = {"version": ARCHIVE_VERSION, "arrays": {}}
+    pos = 0
+    for name, arr in arrays.items():
+        header["arrays"][name] = {
+            "dtype": arr.dtype.str,
+            "shape": list(arr.shape),
+            "offset": pos,
+        }
+        pos += -(-arr.nbytes // _ARCHIVE_ALIGN) * _ARCHIVE_ALIGN
+    raw_header = json.dumps(header).encode("utf-8")
+    start = len(ARCHIVE_MAGIC) + 8 + len(raw_header)
+    start = -(-start // _ARCHIVE_ALIGN) * _ARCHIVE_ALIGN
+
+    # Written next to the target and renamed, so readers never see a
+    # partial archive
+    archive_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = archive_path.with_name(archive_path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(ARCHIVE_MAGIC + len(raw_header).to_bytes(8, "little"))
+        f.write(raw_header)
+        for name, arr in arrays.items():
+            f.seek(start + header["arrays"][name]["offset"])
+            f.write(np.ascontiguousarray(arr).tobytes())
+        f.truncate(start + pos)
+    os.replace(tmp_path, archive_path)
+    return len(stems)
+
+
+def pack_yolo_labels(
+    images: Dict[int, dict],
+    anns_by_image: Dict[int, List[dict]],
+    archive_path: Path,
+) -> int:
+    """Write the labels write_yolo_labels would write as one archive."""
+    stems = [Path(im["file_name"]).stem for im in images.values()]
+    return save_label_archive(
+        archive_path, stems, *_coco_arrays(images, anns_by_image)
+    )
+
+
+def pack_index_labels(index: CocoIndex, archive_path: Path) -> int:
+    """pack_yolo_labels for a CocoIndex."""
+    return save_label_archive(
+        archive_path,
+        index.stems,
+        index.classes,
+        index.boxes,
+        index.offsets,
+        index.widths,
+        index.heights,
+    )
 
-            cxn, cyn, wn, hn = coco_bbox_to_yolo_norm(
-                x, y, w, h, width, height
-            )
-            cxn = min(max(cxn, 0.0), 1.0)
-            cyn = min(max(cyn, 0.0), 1.0)
-            wn = min(max(wn, 0.0), 1.0)
-            hn = min(max(hn, 0.0), 1.0)
 
-            lines.append(
-                f"{ann['_cls']} {cxn:.6f} {cyn:.6f} {wn:.6f} {hn:.6f}"
+class LabelArchive:
+    """Read-only, memory-mapped view of a packed label archive.
+
+    Image i owns the boxes offsets[i]:offsets[i + 1]; classes and
+    values (cx, cy, w, h in millionths) are (N,) and (N, 4) arrays.
+    Stem lookups go through a dict built on first use.
+    """
+
+    def __init__(self, archive_path: Path):
+        self.path = archive_path
+        with open(archive_path, "rb") as f:
+            if f.read(len(ARCHIVE_MAGIC)) != ARCHIVE_MAGIC:
+                raise ValueError(f"Not a label archive: {archive_path}")
+            size = int.from_bytes(f.read(8), "little")
+            header = json.loads(f.read(size))
+        if header.get("version") != ARCHIVE_VERSION:
+            raise ValueError(f"Unsupported archive version in {archive_path}")
+        start = len(ARCHIVE_MAGIC) + 8 + size
+        start = -(-start // _ARCHIVE_ALIGN) * _ARCHIVE_ALIGN
+
+        def load(name: str) -> np.ndarray:
+            spec = header["arrays"][name]
+            shape = tuple(spec["shape"])
+            if not np.prod(shape):
+                return np.empty(shape, dtype=spec["dtype"])
+            return np.memmap(
+                archive_path,
+                dtype=spec["dtype"],
+                mode="r",
+                offset=start + spec["offset"],
+                shape=shape,
             )
 
-        out = labels_dir / (Path(im["file_name"]).stem + ".txt")
-        out.write_text("\n".join(lines))
-        n_files += 1
+        self.stems = load("stems")
+        self.offsets = load("offsets")
+        self.classes = load("classes")
+        self.values = load("values")
+        self._index: Optional[Dict[bytes, int]] = None
 
-    return n_files
+    def __len__(self) -> int:
+        return len(self.stems)
 
+    def __contains__(self, stem: str) -> bool:
+        try:
+            self.index_of(stem)
+        except KeyError:
+            return False
+        return True
 
-def create_empty_labels_for_unlabeled_images(
-    unlabeled_list_path: Path, labels_dir: Path
-) -> int:
-    """Create empty label files for images in unlabeled list."""
-    labels_dir.mkdir(parents=True, exist_ok=True)
+    def stem(self, index: int) -> str:
+        return self.stems[index].decode("utf-8")
+
+    def index_of(self, stem: str) -> int:
+        """Image index for a stem, e.g. "b1c66a42-6f7d68ca"."""
+        if self._index is None:
+            # Later duplicates win, as with label files on disk
+            self._index = {s: i for i, s in enumerate(self.stems.tolist())}
+        return self._index[stem.encode("utf-8")]
+
+    def labels(self, stem: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Classes and (K, 4) normalized cx, cy, w, h of one image."""
+        i = self.index_of(stem)
+        sl = slice(int(self.offsets[i]), int(self.offsets[i + 1]))
+        return np.asarray(self.classes[sl]), self.values[sl] / 1e6
+
+    def texts(self, start: int = 0, stop: Optional[int] = None):
+        """Label file contents of images start:stop, in archive order."""
+        stop = len(self) if stop is None else stop
+        offsets = np.asarray(self.offsets[start : stop + 1])
+        sl = slice(int(offsets[0]), int(offsets[-1]))
+        cls_idx = np.asarray(self.classes[sl], dtype=np.int64)
+        micros = np.asarray(self.values[sl])
+        return _label_texts(
+            cls_idx,
+            micros / 1e6,
+            micros,
+            offsets - offsets[0],
+            _single_digit(cls_idx),
+        )
 
-    with open(unlabeled_list_path, "r", encoding="utf-8") as f:
-        unlabeled_images = [line.strip() for line in f if line.strip()]
+    def text(self, stem: str) -> str:
+        """Content of the label file for one image."""
+        i = self.index_of(stem)
+        return next(self.texts(i, i + 1))
 
-    created_count = 0
-    for image_name in unlabeled_images:
-        base_name = Path(image_name).stem
-        label_path = labels_dir / (base_name + ".txt")
+    def export(
+        self, labels_dir: Path, keep: Iterable[str] = ()
+    ) -> Dict[str, int]:
+        """Sync the .txt label tree ultralytics reads from the archive."""
+        writer = LabelDirWriter(labels_dir, keep=keep)
+        for i, text in enumerate(self.texts()):
+            writer.write(self.stem(i), text)
+        return writer.close()
 
-        with open(label_path, "w", encoding="utf-8") as f:
-            pass  # Creates empty file
 
-        created_count += 1
+def unlabeled_stems(list_path: Path) -> List[str]:
+    """Stems of the images named one per line in list_path, if it exists."""
+    if not list_path.exists():
+        return []
+    with open(list_path, "r", encoding="utf-8") as f:
+        return [Path(line.strip()).stem for line in f if line.strip()]
+
+
+def create_empty_labels_for_unlabeled_images(
+    unlabeled_list_path: Path, labels_dir: Path
+) -> Dict[str, int]:
+    """Create empty label files for images in unlabeled list.
 
-    return created_count
+    Existing empty files are left untouched; nothing is deleted.
+    """
+    writer = LabelDirWriter(labels_dir, prune=False)
+    for stem in unlabeled_stems(unlabeled_list_path):
+        writer.write(stem, "")
+    return writer.close()
 
 
 def make_yolo_yaml(
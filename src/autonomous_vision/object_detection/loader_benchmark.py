@@ -0,0 +1,276 @@
+"""
+CPU throughput benchmark of the YOLO training data pipeline.
+
+Runs only the data side of training, no model: the ultralytics
+YOLODataset and InfiniteDataLoader that DetectionTrainer builds, with
+the hyperparameters of train_yolo (imgsz, rect, TRAIN_ARGS and the
+ultralytics defaults for everything else, mosaic and random_perspective
+included), over the prepared YOLO train set (the resized image cache
+when enabled). Per image it times read (the file bytes) and decode
+(JPEG decode and resize) of every image the sample touches, mosaic
+partners included, and augment (the rest of the transforms); per
+batch, collate. For each worker count
+in the sweep it reports images/sec and mean per-image stage times, then
+records the fastest count. train_yolo uses that count when
+Config.train_workers is 0, or apply it explicitly with TRAIN_WORKERS=<n>.
+
+Usage:
+    python -m autonomous_vision.object_detection.loader_benchmark
+        [--workers 0 2 4 8] [--batches 20] [--batch-size 16]
+"""
+
+import argparse
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import cv2
+import numpy as np
+from ultralytics.cfg import get_cfg
+from ultralytics.data import (
+    YOLODataset,
+    base,
+    build_dataloader,
+    build_yolo_dataset,
+)
+from ultralytics.utils import DEFAULT_CFG
+from ultralytics.utils.patches import imread
+
+from autonomous_vision.config import Config
+from autonomous_vision.object_detection.image_cache import cache_root
+from autonomous_vision.utils import json_codec
+
+STAGES = ("read", "decode", "augment", "collate")
+
+# Recorded in the report; reports of other versions are not trusted
+BENCHMARK_VERSION = 3
+
+# Batches run before timing starts, while workers spin up
+WARMUP_BATCHES = 2
+
+# A smaller worker count within this fraction of the best one is kept
+WORKERS_TOLERANCE = 0.05
+
+
+class TimedYOLODataset(YOLODataset):
+    """YOLODataset that times image reading, decoding and augmentation.
+
+    ultralytics reads and decodes in one imread call inside load_image,
+    so while load_image runs, the module's imread is swapped for one that
+    times the file read on its own.
+    """
+
+    # Seconds spent in load_image and reading files for the current
+    # sample (the dataset is built by ultralytics, not by __init__)
+    load_time = 0.0
+    read_time = 0.0
+
+    def _timed_imread(self, filename: str, flags: int = cv2.IMREAD_COLOR):
+        if filename.endswith((".tiff", ".tif")):
+            return imread(filename, flags)
+        start = time.perf_counter()
+        file_bytes = np.fromfile(filename, np.uint8)
+        self.read_time += time.perf_counter() - start
+        im = cv2.imdecode(file_bytes, flags)
+        return im[..., None] if im is not None and im.ndim == 2 else im
+
+    def load_image(self, i: int, rect_mode: bool = True):
+        start = time.perf_counter()
+        base.imread = self._timed_imread
+        try:
+            loaded = super().load_image(i, rect_mode)
+        finally:
+            base.imread = imread
+        self.load_time += time.perf_counter() - start
+        return loaded
+
+    def __getitem__(self, index: int) -> Dict:
+        self.load_time = self.read_time = 0.0
+        start = time.perf_counter()
+        label = super().__getitem__(index)
+        total = time.perf_counter() - start
+        label["timings"] = (
+            self.read_time,
+            self.load_time - self.read_time,
+            total - self.load_time,
+        )
+        return label
+
+    @staticmethod
+    def collate_fn(batch: List[Dict]) -> Dict:
+        start = time.perf_counter()
+        timings = np.array([label.pop("timings") for label in batch])
+        collated = YOLODataset.collate_fn(batch)
+        collated["timings"] = (
+            *timings.sum(axis=0),
+            time.perf_counter() - start,
+        )
+        return collated
+
+
+def train_images_dir() -> Path:
+    """Images directory train_yolo will train from."""
+    images_dir = Path(Config.train_images)
+    if Config.use_image_cache:
+        cached = cache_root() / "images" / "train"
+        if cached.exists():
+            images_dir = cached
+    return images_dir
+
+
+def training_dataset(images_dir: Path, batch_size: int) -> YOLODataset:
+    """The train dataset DetectionTrainer builds, with stage timing."""
+    # Imported here: train_yolo imports this module for train_workers
+    from autonomous_vision.object_detection.train_yolo import TRAIN_ARGS
+
+    cfg = get_cfg(
+        DEFAULT_CFG, {**TRAIN_ARGS, "imgsz": Config.imgsz, "rect": Config.rect}
+    )
+    names = Config.detection_classes
+    data = {
+        "names": dict(enumerate(names)),
+        "nc": len(names),
+        "channels": 3,
+    }
+    dataset = build_yolo_dataset(
+        cfg, str(images_dir), batch_size, data, mode="train"
+    )
+    dataset.__class__ = TimedYOLODataset
+    return dataset
+
+
+def run(
+    dataset: YOLODataset, workers: int, batch_size: int, batches: int
+) -> Dict[str, float]:
+    """Time `batches` batches after warm-up with the given workers."""
+    # As DetectionTrainer.get_dataloader: rect batches are not shuffled
+    loader = build_dataloader(
+        dataset, batch_size, workers, shuffle=not dataset.rect
+    )
+    totals = np.zeros(len(STAGES))
+    n_images = 0
+    it = iter(loader)
+    for _ in range(WARMUP_BATCHES):
+        next(it)
+    start = time.perf_counter()
+    for _ in range(batches):
+        batch = next(it)
+        totals += batch["timings"]
+        n_images += len(batch["img"])
+    elapsed = time.perf_counter() - start
+    del it, loader
+
+    result = {"workers": workers, "images_per_sec": n_images / elapsed}
+    for stage, total in zip(STAGES, totals):
+        result[f"{stage}_ms"] = 1000 * total / n_images
+    return result
+
+
+def default_sweep() -> List[int]:
+    """0, 1 and powers of two up to the CPU count."""
+    cpus = os.cpu_count() or 1
+    sweep = [0, 1]
+    while sweep[-1] * 2 <= cpus:
+        sweep.append(sweep[-1] * 2)
+    if sweep[-1] != cpus:
+        sweep.append(cpus)
+    return sweep
+
+
+def pick_workers(results: Sequence[Dict[str, float]]) -> int:
+    """Fewest workers within WORKERS_TOLERANCE of the best throughput."""
+    best = max(r["images_per_sec"] for r in results)
+    return min(
+        r["workers"]
+        for r in results
+        if r["images_per_sec"] >= (1 - WORKERS_TOLERANCE) * best
+    )
+
+
+def tuned_workers() -> Optional[int]:
+    """Worker count recorded by the last benchmark on this machine."""
+    path = Config.loader_benchmark_path
+    if not path.exists():
+        return None
+    report = json_codec.loads(path.read_bytes())
+    if report.get("version") != BENCHMARK_VERSION:
+        return None
+    if report.get("cpu_count") != os.cpu_count():
+        return None
+    if (report.get("imgsz"), report.get("rect")) != (
+        Config.imgsz,
+        Config.rect,
+    ):
+        return None
+    return report.get("best_workers")
+
+
+def train_workers() -> int:
+    """Dataloader workers for training (Config.train_workers, 0 = tuned)."""
+    if Config.train_workers > 0:
+        return Config.train_workers
+    tuned = tuned_workers()
+    if tuned is not None:
+        return tuned
+    return min(8, os.cpu_count() or 1)
+
+
+def benchmark(
+    sweep: Sequence[int], batch_size: int, batches: int
+) -> Dict[str, object]:
+    """Run the sweep over the training images and build the report."""
+    images_dir = train_images_dir()
+    dataset = training_dataset(images_dir, batch_size)
+    needed = (batches + WARMUP_BATCHES) * batch_size
+    if len(dataset) < needed:
+        raise ValueError(
+            f"{images_dir} holds {len(dataset)} images, {needed} needed"
+        )
+    print(f"Data pipeline benchmark on {images_dir} (imgsz={Config.imgsz})")
+
+    header = f"{'workers':>7} {'img/s':>8} " + " ".join(
+        f"{stage + '_ms':>10}" for stage in STAGES
+    )
+    print(header)
+    results = []
+    for workers in sweep:
+        result = run(dataset, workers, batch_size, batches)
+        results.append(result)
+        print(
+            f"{workers:>7} {result['images_per_sec']:>8.1f} "
+            + " ".join(f"{result[s + '_ms']:>10.2f}" for s in STAGES)
+        )
+
+    best = pick_workers(results)
+    print(f"Best: {best} workers (set TRAIN_WORKERS={best} to pin it)")
+    return {
+        "version": BENCHMARK_VERSION,
+        "cpu_count": os.cpu_count(),
+        "imgsz": Config.imgsz,
+        "rect": Config.rect,
+        "batch_size": batch_size,
+        "images_dir": str(images_dir),
+        "results": results,
+        "best_workers": best,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, nargs="+")
+    parser.add_argument("--batches", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=16)
+    args = parser.parse_args()
+
+    report = benchmark(
+        args.workers or default_sweep(), args.batch_size, args.batches
+    )
+    path = Config.loader_benchmark_path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json_codec.dumps(report, indent=1))
+    print(f"Report -> {path}")
+
+
+if __name__ == "__main__":
+    main()
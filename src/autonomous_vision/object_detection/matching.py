@@ -0,0 +1,316 @@
+"""
+Vectorized detection matching and error taxonomy.
+
+Predictions and ground truth come in columnar form, one row per box:
+the index of its image, an xyxy pixel box and a class (predictions also
+a score). Within every image, predictions are matched greedily in score
+order, each to the unmatched same-class ground truth box with the
+highest IoU >= iou_threshold (ties to the last box), as in COCO
+evaluation. The greedy pass runs over all images at once: round r
+matches the r-th best prediction of every image.
+
+Each prediction then gets the first label that applies:
+    tp               matched
+    duplicate        IoU >= iou_threshold with a same-class box that a
+                     higher scored prediction matched
+    class_confusion  IoU >= iou_threshold with a box of another class
+    localization     background_iou <= IoU < iou_threshold with a
+                     same-class box
+    background       anything else, poor overlap with another class too
+and every ground truth box is tp (matched) or missed.
+"""
+
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from autonomous_vision.object_detection.data_loader import CocoIndex
+
+PRED_LABELS = (
+    "tp",
+    "duplicate",
+    "class_confusion",
+    "localization",
+    "background",
+)
+GT_LABELS = ("tp", "missed")
+TP, DUPLICATE, CLASS_CONFUSION, LOCALIZATION, BACKGROUND = range(5)
+MISSED = 1
+
+IOU_THRESHOLD = 0.5
+BACKGROUND_IOU = 0.1
+
+# Prediction/ground truth pairs whose IoU is held in memory at once
+MAX_PAIRS = 2_000_000
+
+
+def xywh_to_xyxy(boxes) -> np.ndarray:
+    """COCO x, y, w, h rows to x1, y1, x2, y2."""
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    return np.hstack([boxes[:, :2], boxes[:, :2] + boxes[:, 2:]])
+
+
+def _areas(boxes: np.ndarray) -> np.ndarray:
+    sizes = np.clip(boxes[..., 2:] - boxes[..., :2], 0, None)
+    return sizes[..., 0] * sizes[..., 1]
+
+
+def _ratio(inter: np.ndarray, union: np.ndarray) -> np.ndarray:
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+
+def pairwise_iou(a, b) -> np.ndarray:
+    """(N, M) IoU matrix of xyxy boxes a (N, 4) and b (M, 4)."""
+    a = np.asarray(a, dtype=np.float64).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float64).reshape(-1, 4)
+    lt = np.maximum(a[:, None, :2], b[None, :, :2])
+    rb = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = _areas(np.concatenate([lt, rb], axis=2))
+    return _ratio(inter, _areas(a)[:, None] + _areas(b)[None, :] - inter)
+
+
+def pair_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """IoU of row i of a with row i of b, both (N, 4) xyxy."""
+    lt = np.maximum(a[:, :2], b[:, :2])
+    rb = np.minimum(a[:, 2:], b[:, 2:])
+    inter = _areas(np.hstack([lt, rb]))
+    return _ratio(inter, _areas(a) + _areas(b) - inter)
+
+
+def gt_columns(
+    index: CocoIndex,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Image index, xyxy box and class of every CocoIndex annotation."""
+    image = np.repeat(np.arange(index.num_images), np.diff(index.offsets))
+    return image, xywh_to_xyxy(index.boxes), index.classes
+
+
+class MatchResult:
+    """Columnar matching output, rows in the order of the inputs.
+
+    pred_label / gt_label index PRED_LABELS / GT_LABELS. pred_gt is the
+    ground truth row a prediction matched (tp) or its error refers to
+    (duplicate, class_confusion, localization), else -1, and pred_iou
+    the IoU with that row. gt_pred is the prediction matched to each
+    ground truth row, else -1.
+    """
+
+    def __init__(
+        self,
+        pred_label: np.ndarray,
+        pred_gt: np.ndarray,
+        pred_iou: np.ndarray,
+        gt_label: np.ndarray,
+        gt_pred: np.ndarray,
+        pred_classes: np.ndarray,
+        gt_classes: np.ndarray,
+    ):
+        self.pred_label = pred_label
+        self.pred_gt = pred_gt
+        self.pred_iou = pred_iou
+        self.gt_label = gt_label
+        self.gt_pred = gt_pred
+        self.pred_classes = pred_classes
+        self.gt_classes = gt_classes
+
+    def pred_frame(self) -> pd.DataFrame:
+        """One row per prediction: class, label, gt and iou."""
+        return pd.DataFrame(
+            {
+                "class": self.pred_classes,
+                "label": pd.Categorical.from_codes(
+                    self.pred_label, PRED_LABELS
+                ),
+                "gt": self.pred_gt,
+                "iou": self.pred_iou,
+            }
+        )
+
+    def gt_frame(self) -> pd.DataFrame:
+        """One row per ground truth box: class, label and pred."""
+        return pd.DataFrame(
+            {
+                "class": self.gt_classes,
+                "label": pd.Categorical.from_codes(self.gt_label, GT_LABELS),
+                "pred": self.gt_pred,
+            }
+        )
+
+    def counts(self, names: Optional[List[str]] = None) -> pd.DataFrame:
+        """Predictions per label, missed and total boxes per class."""
+        n = len(names) if names else 0
+        for classes in (self.pred_classes, self.gt_classes):
+            n = max(n, int(classes.max(initial=-1)) + 1)
+        table = {
+            label: np.bincount(
+                self.pred_classes[self.pred_label == code], minlength=n
+            )
+            for code, label in enumerate(PRED_LABELS)
+        }
+        table["missed"] = np.bincount(
+            self.gt_classes[self.gt_label == MISSED], minlength=n
+        )
+        table["gt"] = np.bincount(self.gt_classes, minlength=n)
+        index = list(names) + list(range(len(names), n)) if names else None
+        return pd.DataFrame(table, index=index).rename_axis("class")
+
+
+def _offsets(image: np.ndarray, n_images: int) -> np.ndarray:
+    offsets = np.zeros(n_images + 1, dtype=np.int64)
+    np.cumsum(np.bincount(image, minlength=n_images), out=offsets[1:])
+    return offsets
+
+
+def image_chunks(
+    pair_counts: np.ndarray, max_pairs: int
+) -> Iterator[Tuple[int, int]]:
+    """Image ranges holding up to max_pairs pairs (or one image)."""
+    ends = np.cumsum(pair_counts)
+    start = 0
+    while start < len(pair_counts):
+        base = ends[start - 1] if start else 0
+        stop = int(np.searchsorted(ends, base + max_pairs, side="right"))
+        stop = max(stop, start + 1)
+        yield start, stop
+        start = stop
+
+
+def _best_per_pred(
+    pair_pred: np.ndarray,
+    pair_gt: np.ndarray,
+    iou: np.ndarray,
+    mask: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Each prediction's highest IoU pair among the masked pairs.
+
+    IoU ties go to the last box, as in the greedy matching.
+    """
+    idx = np.flatnonzero(mask)
+    idx = idx[np.lexsort((-pair_gt[idx], -iou[idx], pair_pred[idx]))]
+    preds, first = np.unique(pair_pred[idx], return_index=True)
+    return preds, pair_gt[idx[first]], iou[idx[first]]
+
+
+def _restore(values: np.ndarray, order: np.ndarray) -> np.ndarray:
+    """Undo values = original[order]."""
+    out = np.empty_like(values)
+    out[order] = values
+    return out
+
+
+def _renumber(rows: np.ndarray, order: np.ndarray) -> np.ndarray:
+    """Sorted row numbers (-1 = none) to original ones."""
+    out = rows.copy()
+    hit = rows >= 0
+    out[hit] = order[rows[hit]]
+    return out
+
+
+def match_detections(
+    pred_image,
+    pred_boxes,
+    pred_classes,
+    pred_scores,
+    gt_image,
+    gt_boxes,
+    gt_classes,
+    iou_threshold: float = IOU_THRESHOLD,
+    background_iou: float = BACKGROUND_IOU,
+) -> MatchResult:
+    """Match predictions to ground truth over a batch of images.
+
+    Args:
+        pred_image, gt_image: Image index of every row (any integers
+            >= 0 shared by both sides, e.g. CocoIndex positions)
+        pred_boxes, gt_boxes: (N, 4) xyxy pixel boxes
+        pred_classes, gt_classes: Class index of every row
+        pred_scores: Prediction confidences; ties keep input order
+
+    Returns:
+        Labels and matches of every prediction and ground truth box
+    """
+    pred_image = np.asarray(pred_image, dtype=np.int64)
+    pred_classes = np.asarray(pred_classes, dtype=np.int64)
+    pred_scores = np.asarray(pred_scores, dtype=np.float64)
+    gt_image = np.asarray(gt_image, dtype=np.int64)
+    gt_classes = np.asarray(gt_classes, dtype=np.int64)
+    n_images = 1 + int(
+        max(pred_image.max(initial=-1), gt_image.max(initial=-1))
+    )
+
+    # Predictions by image, best score first; ground truth by image
+    p_order = np.lexsort((-pred_scores, pred_image))
+    g_order = np.argsort(gt_image, kind="stable")
+    p_img = pred_image[p_order]
+    p_boxes = np.asarray(pred_boxes, dtype=np.float64).reshape(-1, 4)
+    p_boxes = p_boxes[p_order]
+    p_cls = pred_classes[p_order]
+    g_boxes = np.asarray(gt_boxes, dtype=np.float64).reshape(-1, 4)
+    g_boxes = g_boxes[g_order]
+    g_cls = gt_classes[g_order]
+    p_off = _offsets(p_img, n_images)
+    g_off = _offsets(gt_image[g_order], n_images)
+    g_counts = np.diff(g_off)
+
+    pred_label = np.full(len(p_order), BACKGROUND, dtype=np.int8)
+    pred_gt = np.full(len(p_order), -1, dtype=np.int64)
+    pred_iou = np.zeros(len(p_order))
+    gt_pred = np.full(len(g_order), -1, dtype=np.int64)
+
+    pair_counts = np.diff(p_off) * g_counts
+    for lo, hi in image_chunks(pair_counts, MAX_PAIRS):
+        # Every prediction paired with every box of its image
+        preds = np.arange(p_off[lo], p_off[hi])
+        per_pred = g_counts[p_img[preds]]
+        total = int(per_pred.sum())
+        if total == 0:
+            continue
+        pair_pred = np.repeat(preds, per_pred)
+        first = np.cumsum(per_pred) - per_pred
+        pair_gt = np.repeat(g_off[p_img[preds]] - first, per_pred)
+        pair_gt += np.arange(total)
+        iou = pair_iou(p_boxes[pair_pred], g_boxes[pair_gt])
+        same = p_cls[pair_pred] == g_cls[pair_gt]
+
+        # Greedy rounds by rank within the image; candidates of a round
+        # belong to different images, so they never compete for a box.
+        # IoU ties go to the last box, as in pycocotools
+        cand = np.flatnonzero(same & (iou >= iou_threshold))
+        rank = pair_pred[cand] - p_off[p_img[pair_pred[cand]]]
+        order = np.lexsort((-pair_gt[cand], -iou[cand], pair_pred[cand], rank))
+        cand, rank = cand[order], rank[order]
+        for round_pairs in np.split(cand, np.flatnonzero(np.diff(rank)) + 1):
+            round_pairs = round_pairs[gt_pred[pair_gt[round_pairs]] < 0]
+            won, best = np.unique(pair_pred[round_pairs], return_index=True)
+            chosen = round_pairs[best]
+            gt_pred[pair_gt[chosen]] = won
+            pred_label[won] = TP
+            pred_gt[won] = pair_gt[chosen]
+            pred_iou[won] = iou[chosen]
+
+        # Errors in increasing priority, each overriding the previous
+        same_best = _best_per_pred(pair_pred, pair_gt, iou, same)
+        other_best = _best_per_pred(pair_pred, pair_gt, iou, ~same)
+        for (won, gts, ious), threshold, label in (
+            (same_best, background_iou, LOCALIZATION),
+            (other_best, iou_threshold, CLASS_CONFUSION),
+            (same_best, iou_threshold, DUPLICATE),
+        ):
+            keep = (ious >= threshold) & (pred_label[won] != TP)
+            pred_label[won[keep]] = label
+            pred_gt[won[keep]] = gts[keep]
+            pred_iou[won[keep]] = ious[keep]
+
+    # Back to input order and input row numbers
+    return MatchResult(
+        pred_label=_restore(pred_label, p_order),
+        pred_gt=_restore(_renumber(pred_gt, g_order), p_order),
+        pred_iou=_restore(pred_iou, p_order),
+        gt_label=_restore(
+            np.where(gt_pred >= 0, TP, MISSED).astype(np.int8), g_order
+        ),
+        gt_pred=_restore(_renumber(gt_pred, p_order), g_order),
+        pred_classes=pred_classes,
+        gt_classes=gt_classes,
+    )
@@ -0,0 +1,273 @@
+"""
+On-disk cache of raw YOLO predictions.
+
+Detections (image stem, float32 x1, y1, x2, y2 pixels, score, class) are
+stored as Parquet under <prediction_cache_dir>/<weights stem>-<key>/,
+where the key hashes the weights file contents, imgsz, NMS IoU, max_det
+and the raw confidence threshold. The raw threshold is low
+(Config.prediction_conf) so any display threshold can be applied when
+reading: NMS never lets a lower score suppress a higher one, so
+filtering on read gives the detections a higher conf would have.
+
+Every flush writes one new part file whose metadata lists the images it
+covers, those without detections included, so appending images never
+rewrites earlier parts; parts are merged once there are more than
+MAX_PARTS. A merged part also lists the files it replaces, which are
+skipped on read, so a merge cut short before they are deleted never
+duplicates detections.
+"""
+
+import hashlib
+import os
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from autonomous_vision.config import Config
+from autonomous_vision.data_parser.manifest import file_digest
+from autonomous_vision.utils import json_codec
+
+SCHEMA = pa.schema(
+    [
+        ("image", pa.string()),
+        ("x1", pa.float32()),
+        ("y1", pa.float32()),
+        ("x2", pa.float32()),
+        ("y2", pa.float32()),
+        ("score", pa.float32()),
+        ("cls", pa.int16()),
+    ]
+)
+
+# Part files kept before they are merged into one
+MAX_PARTS = 64
+
+# Buffered images written per part file
+FLUSH_IMAGES = 1024
+
+# Detections of one image: (N, 4) xyxy boxes, classes, scores
+Detections = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+
+def result_columns(results) -> List[Detections]:
+    """Boxes, classes and scores of each ultralytics Results."""
+    return [
+        (
+            r.boxes.xyxy.cpu().numpy().reshape(-1, 4),
+            r.boxes.cls.cpu().numpy(),
+            r.boxes.conf.cpu().numpy(),
+        )
+        for r in results
+    ]
+
+
+def by_image(frame: pd.DataFrame) -> Dict[str, Detections]:
+    """Split a load() frame into each image's detections."""
+    return {
+        stem: (
+            group[["x1", "y1", "x2", "y2"]].to_numpy(),
+            group["cls"].to_numpy(),
+            group["score"].to_numpy(),
+        )
+        for stem, group in frame.groupby("image", sort=False)
+    }
+
+
+class PredictionCache:
+    """Raw predictions of one model and inference setting.
+
+    Args:
+        model_path: Weights file; its content hash is part of the key
+        imgsz, iou, max_det, conf: Inference parameters (default:
+            Config.imgsz and Config.prediction_*)
+        root: Cache directory (default: Config.prediction_cache_dir)
+    """
+
+    def __init__(
+        self,
+        model_path: Path,
+        imgsz: Optional[int] = None,
+        iou: Optional[float] = None,
+        max_det: Optional[int] = None,
+        conf: Optional[float] = None,
+        root: Optional[Path] = None,
+    ):
+        self.model_path = Path(model_path)
+        self.params = {
+            "weights": file_digest(self.model_path),
+            "imgsz": Config.imgsz if imgsz is None else imgsz,
+            "conf": Config.prediction_conf if conf is None else conf,
+            "iou": Config.prediction_iou if iou is None else iou,
+            "max_det": (
+                Config.prediction_max_det if max_det is None else max_det
+            ),
+        }
+        key = hashlib.sha256(
+            json_codec.dumps(self.params, separators=(",", ":")).encode()
+        ).hexdigest()[:16]
+        root = root or Config.prediction_cache_dir
+        self.path = root / f"{self.model_path.stem}-{key}"
+        self._stems: Optional[Set[str]] = None
+        self._pending: Dict[str, Detections] = {}
+        self._model = None
+
+    def _files(self) -> List[Path]:
+        return sorted(self.path.glob("part-*.parquet"))
+
+    def _parts(self) -> List[Path]:
+        """Part files in use: those no merged part replaces."""
+        files = self._files()
+        replaced: Set[str] = set()
+        for part in files:
+            metadata = pq.read_schema(part).metadata
+            if b"replaces" in metadata:
+                replaced.update(json_codec.loads(metadata[b"replaces"]))
+        return [part for part in files if part.name not in replaced]
+
+    def stems(self) -> Set[str]:
+        """Images with cached predictions, buffered ones included."""
+        if self._stems is None:
+            self._stems = set()
+            for part in self._parts():
+                metadata = pq.read_schema(part).metadata
+                self._stems.update(json_codec.loads(metadata[b"images"]))
+        return self._stems | self._pending.keys()
+
+    def __contains__(self, stem: str) -> bool:
+        return stem in self.stems()
+
+    def add(self, stems: Sequence[str], detections: Sequence[Detections]):
+        """Buffer each image's detections; flushed every FLUSH_IMAGES."""
+        self._pending.update(zip(stems, detections))
+        if len(self._pending) >= FLUSH_IMAGES:
+            self.flush()
+
+    def _table(self, detections: Dict[str, Detections]) -> pa.Table:
+        counts = [len(boxes) for boxes, _, _ in detections.values()]
+        boxes = np.concatenate(
+            [np.reshape(d[0], (-1, 4)) for d in detections.values()]
+            or [np.zeros((0, 4))]
+        ).astype(np.float32)
+        classes, scores = (
+            np.concatenate([d[i] for d in detections.values()] or [[]])
+            for i in (1, 2)
+        )
+        columns = {
+            "image": np.repeat(list(detections), counts),
+            "x1": boxes[:, 0],
+            "y1": boxes[:, 1],
+            "x2": boxes[:, 2],
+            "y2": boxes[:, 3],
+            "score": scores.astype(np.float32),
+            "cls": classes.astype(np.int16),
+        }
+        images = json_codec.dumps(list(detections), separators=(",", ":"))
+        return pa.Table.from_pydict(
+            columns, schema=SCHEMA.with_metadata({"images": images})
+        )
+
+    def _write_part(self, table: pa.Table, number: int) -> None:
+        self.path.mkdir(parents=True, exist_ok=True)
+        params_path = self.path / "params.json"
+        if not params_path.exists():
+            params_path.write_text(json_codec.dumps(self.params, indent=2))
+        part = self.path / f"part-{number:05d}.parquet"
+        tmp_path = part.with_name(part.name + ".tmp")
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, part)
+
+    def flush(self) -> None:
+        """Write the buffered images as a new part file."""
+        if not self._pending:
+            return
+        stems = self.stems()
+        parts = self._parts()
+        files = self._files()
+        number = int(files[-1].stem.split("-")[1]) + 1 if files else 0
+        self._write_part(self._table(self._pending), number)
+        self._stems = stems
+        self._pending = {}
+        if len(parts) + 1 > MAX_PARTS:
+            self.compact()
+
+    def compact(self) -> None:
+        """Merge all part files into one."""
+        files = self._files()
+        parts = self._parts()
+        if len(parts) < 2:
+            return
+        images: List[str] = []
+        for part in parts:
+            metadata = pq.read_schema(part).metadata
+            images.extend(json_codec.loads(metadata[b"images"]))
+        table = ds.dataset([str(p) for p in parts], schema=SCHEMA).to_table()
+        # Leftovers of an interrupted merge are replaced as well
+        metadata = {
+            "images": json_codec.dumps(images, separators=(",", ":")),
+            "replaces": json_codec.dumps(
+                [part.name for part in files], separators=(",", ":")
+            ),
+        }
+        number = int(files[-1].stem.split("-")[1]) + 1
+        self._write_part(table.replace_schema_metadata(metadata), number)
+        for part in files:
+            part.unlink()
+
+    def load(
+        self, stems: Optional[Iterable[str]] = None, conf: float = 0.0
+    ) -> pd.DataFrame:
+        """Cached detections with score >= conf, optionally of stems."""
+        self.flush()
+        parts = self._parts()
+        if not parts:
+            return SCHEMA.empty_table().to_pandas()
+        expr = ds.field("score") >= conf
+        if stems is not None:
+            expr &= ds.field("image").isin(list(stems))
+        dataset = ds.dataset([str(p) for p in parts], schema=SCHEMA)
+        return dataset.to_table(filter=expr).to_pandas()
+
+    def model(self):
+        """The YOLO model, loaded on first use."""
+        if self._model is None:
+            from ultralytics import YOLO
+
+            self._model = YOLO(str(self.model_path))
+        return self._model
+
+    def infer(self, images: Sequence) -> List[Detections]:
+        """Run the model with the cache's parameters on paths/arrays."""
+        results = self.model().predict(
+            images,
+            imgsz=self.params["imgsz"],
+            conf=self.params["conf"],
+            iou=self.params["iou"],
+            max_det=self.params["max_det"],
+            verbose=False,
+        )
+        return result_columns(results)
+
+    def predict(
+        self,
+        image_paths: Sequence[Path],
+        conf: float = 0.0,
+        batch_size: Optional[int] = None,
+    ) -> pd.DataFrame:
+        """Detections of image_paths, running inference on misses only."""
+        batch_size = batch_size or Config.overlay_batch_size
+        cached = self.stems()
+        missing = [p for p in image_paths if p.stem not in cached]
+        for i in range(0, len(missing), batch_size):
+            batch = missing[i : i + batch_size]
+            self.add(
+                [p.stem for p in batch],
+                self.infer([str(p) for p in batch]),
+            )
+        if missing:
+            print(f"Predicted {len(missing)} images, rest from cache")
+        return self.load([p.stem for p in image_paths], conf)
@@ -0,0 +1,358 @@
+"""
+Post-training INT8 quantization of the ONNX export for CPU runtimes.
+
+Calibration images are a stratified sample of the val split: every
+(scene, weather, timeofday) group of the parsed val Parquet contributes
+in proportion to its size, and at least one image, so rare conditions
+such as snowy nights still shape the activation ranges. The FP32 ONNX
+model (export_benchmark) is quantized statically with ONNX Runtime to
+QDQ format, INT8 per-channel weights and UINT8 activations. The decode
+part of the Detect head (DFL, sigmoid, box arithmetic, concat) stays in
+float, because boxes in pixels and class scores share one output.
+
+The FP32 and INT8 models are then evaluated on the val images not used
+for calibration (per-class AP through the prediction cache and the
+Evaluator) and timed with the export_benchmark sweep. The report lists
+the AP change of every class next to the latency gain, flagging classes
+that lose more than AP_DROP_TOLERANCE.
+
+Usage:
+    python -m autonomous_vision.object_detection.quantize
+        --model models/yolo11s_bdd.pt [--onnx models/export/x.onnx]
+        [--calibration-images 300] [--batch-sizes 1 8] [--threads 1 4]
+"""
+
+import argparse
+import re
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from autonomous_vision.config import Config
+from autonomous_vision.data_parser.annotation_store import load_index
+from autonomous_vision.data_parser.manifest import file_digest
+from autonomous_vision.object_detection.data_loader import CocoIndex
+from autonomous_vision.object_detection.evaluation import (
+    IMAGE_ATTRIBUTES,
+    Evaluator,
+    cached_predictions,
+    load_metadata,
+)
+from autonomous_vision.object_detection.export_benchmark import (
+    BATCH_SIZES,
+    OnnxRuntime,
+    benchmark,
+    export_onnx,
+    load_inputs,
+    model_input,
+    system_info,
+)
+from autonomous_vision.object_detection.loader_benchmark import default_sweep
+from autonomous_vision.utils import json_codec
+from autonomous_vision.utils.helper import scan_images
+
+# AP loss (absolute, AP@[.5:.95]) above which a class is flagged
+AP_DROP_TOLERANCE = 0.01
+
+# Module prefix of ultralytics ONNX node names ("/model.23/dfl/Conv")
+HEAD_MODULE = re.compile(r"/model\.(\d+)/")
+
+# Per-scale box/class conv branches of the Detect head ("/cv2.0/...")
+HEAD_BRANCH = re.compile(r"cv\d+\.\d+/")
+
+
+def calibration_sample(
+    metadata: pd.DataFrame,
+    n_images: int,
+    strata: Sequence[str] = IMAGE_ATTRIBUTES,
+    seed: int = Config.seed,
+) -> pd.DataFrame:
+    """About n_images images, drawn from every stratum by its size.
+
+    Args:
+        metadata: Parsed val rows with image_name and the strata columns
+        n_images: Target sample size
+        strata: Columns whose value combinations are sampled separately
+        seed: Random seed
+
+    Returns:
+        One row per sampled image (image_name and strata columns)
+    """
+    images = metadata.drop_duplicates("image_name")[["image_name", *strata]]
+    fraction = min(n_images / max(len(images), 1), 1.0)
+    rng = np.random.default_rng(seed)
+    picked = []
+    for _, group in images.groupby(
+        list(strata), dropna=False, sort=True, observed=True
+    ):
+        size = min(max(1, round(len(group) * fraction)), len(group))
+        picked.append(group.iloc[rng.choice(len(group), size, replace=False)])
+    return pd.concat(picked, ignore_index=True)
+
+
+class CalibrationReader:
+    """Feeds calibration images one by one to ONNX Runtime's calibrator."""
+
+    def __init__(self, paths: Sequence[Path], input_name: str, imgsz: int):
+        self.paths = list(paths)
+        self.input_name = input_name
+        self.imgsz = imgsz
+        self._next = 0
+
+    def get_next(self) -> Optional[Dict[str, np.ndarray]]:
+        if self._next >= len(self.paths):
+            return None
+        path = self.paths[self._next]
+        self._next += 1
+        return {self.input_name: model_input([path], self.imgsz)}
+
+    def rewind(self) -> None:
+        self._next = 0
+
+
+def head_decode_nodes(onnx_path: Path) -> List[str]:
+    """Decode nodes of the last (Detect) module of an ultralytics export.
+
+    Everything after the per-scale conv branches: DFL (including its
+    fixed-weight Conv), sigmoid, box arithmetic and concats.
+    """
+    import onnx
+
+    nodes = onnx.load(str(onnx_path), load_external_data=False).graph.node
+    modules = [HEAD_MODULE.match(node.name) for node in nodes]
+    indices = [int(m.group(1)) for m in modules if m]
+    if not indices:
+        return []
+    head = f"/model.{max(indices)}/"
+    return [
+        node.name
+        for node in nodes
+        if node.name.startswith(head)
+        and not HEAD_BRANCH.match(node.name, len(head))
+    ]
+
+
+def quantize_onnx(
+    onnx_path: Path,
+    calibration_paths: Sequence[Path],
+    imgsz: int,
+    output_path: Optional[Path] = None,
+) -> Path:
+    """Static INT8 (QDQ) quantization calibrated on calibration_paths."""
+    import onnxruntime
+    from onnxruntime.quantization import (
+        CalibrationMethod,
+        QuantFormat,
+        QuantType,
+        quantize_static,
+    )
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    output_path = output_path or onnx_path.with_name(
+        f"{onnx_path.stem}_int8.onnx"
+    )
+    prepared = onnx_path.with_name(f"{onnx_path.stem}_prep.onnx")
+    quant_pre_process(str(onnx_path), str(prepared))
+    session = onnxruntime.InferenceSession(
+        str(prepared), providers=["CPUExecutionProvider"]
+    )
+    reader = CalibrationReader(
+        calibration_paths, session.get_inputs()[0].name, imgsz
+    )
+    methods = {
+        "minmax": CalibrationMethod.MinMax,
+        "entropy": CalibrationMethod.Entropy,
+        "percentile": CalibrationMethod.Percentile,
+    }
+    quantize_static(
+        str(prepared),
+        str(output_path),
+        reader,
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        weight_type=QuantType.QInt8,
+        activation_type=QuantType.QUInt8,
+        calibrate_method=methods[Config.quant_calibrate_method],
+        nodes_to_exclude=head_decode_nodes(prepared),
+    )
+    prepared.unlink()
+    return output_path
+
+
+def model_class_ap(
+    model_path: Path,
+    images_dir: Path,
+    index: CocoIndex,
+    exclude: np.ndarray,
+    imgsz: int,
+) -> pd.DataFrame:
+    """Per-class AP of a model on the images not in exclude."""
+    image, boxes, classes, scores, images = cached_predictions(
+        model_path, images_dir, index, imgsz=imgsz
+    )
+    kept = ~np.isin(image, exclude)
+    evaluator = Evaluator(index)
+    evaluator.add(
+        image[kept],
+        boxes[kept],
+        classes[kept],
+        scores[kept],
+        images=images[~np.isin(images, exclude)],
+    )
+    return evaluator.class_ap()
+
+
+def ap_change(fp32: pd.DataFrame, int8: pd.DataFrame) -> pd.DataFrame:
+    """AP and AP50 of both models per class, with INT8 - FP32 deltas."""
+    table = pd.DataFrame(
+        {
+            "AP_fp32": fp32["AP"],
+            "AP_int8": int8["AP"],
+            "AP50_fp32": fp32["AP50"],
+            "AP50_int8": int8["AP50"],
+            "gt": fp32["gt"],
+        }
+    )
+    table["dAP"] = table["AP_int8"] - table["AP_fp32"]
+    table["dAP50"] = table["AP50_int8"] - table["AP50_fp32"]
+    table["degraded"] = table["dAP"] < -AP_DROP_TOLERANCE
+    return table
+
+
+def speedups(results: Sequence[Dict[str, object]]) -> pd.DataFrame:
+    """INT8 over FP32 throughput and p50 latency per sweep point."""
+    frame = pd.DataFrame(results).pivot_table(
+        index=["threads", "batch"],
+        columns="runtime",
+        values=["images_per_sec", "p50_ms"],
+    )
+    return pd.DataFrame(
+        {
+            "fp32_img_s": frame["images_per_sec"]["onnx"],
+            "int8_img_s": frame["images_per_sec"]["onnx-int8"],
+            "throughput_x": frame["images_per_sec"]["onnx-int8"]
+            / frame["images_per_sec"]["onnx"],
+            "p50_x": frame["p50_ms"]["onnx"] / frame["p50_ms"]["onnx-int8"],
+        }
+    ).reset_index()
+
+
+def records(frame: pd.DataFrame) -> List[Dict[str, object]]:
+    """JSON-ready rows of a frame (NaN as null)."""
+    return json_codec.loads(frame.to_json(orient="records"))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--model", type=Path, required=True)
+    parser.add_argument(
+        "--onnx", type=Path, help="Quantize this FP32 export instead"
+    )
+    parser.add_argument("--images", type=Path, default=Config.val_images)
+    parser.add_argument("--coco", type=Path, default=Config.val_json)
+    parser.add_argument("--parquet", type=Path)
+    parser.add_argument(
+        "--store", type=Path, help="Annotation store instead of COCO/Parquet"
+    )
+    parser.add_argument("--imgsz", type=int, default=Config.imgsz)
+    parser.add_argument(
+        "--calibration-images",
+        type=int,
+        default=Config.quant_calibration_images,
+    )
+    parser.add_argument(
+        "--batch-sizes", type=int, nargs="+", default=BATCH_SIZES
+    )
+    parser.add_argument("--threads", type=int, nargs="+")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--report", type=Path, help="JSON report path")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    onnx_path = args.onnx or export_onnx(
+        args.model, args.imgsz, Config.export_dir
+    )
+
+    # Stratified calibration set from the val images on disk
+    on_disk = scan_images(args.images)
+    metadata = load_metadata(args.parquet, IMAGE_ATTRIBUTES, args.store)
+    metadata = metadata[metadata["image_name"].isin(list(on_disk))]
+    sample = calibration_sample(metadata, args.calibration_images)
+    strata = sample.groupby(
+        list(IMAGE_ATTRIBUTES), dropna=False, observed=True
+    ).size()
+    paths = [on_disk[name] for name in sample["image_name"]]
+    print(
+        f"Calibrating on {len(paths)} images from {len(strata)} "
+        "scene/weather/timeofday groups"
+    )
+    int8_path = quantize_onnx(onnx_path, paths, args.imgsz)
+    print(f"INT8 model: {int8_path}")
+
+    index = load_index(args.coco, args.store)
+    position = {stem: pos for pos, stem in enumerate(index.stems)}
+    calibration = np.array(
+        [position[p.stem] for p in paths if p.stem in position],
+        dtype=np.int64,
+    )
+    changes = ap_change(
+        *(
+            model_class_ap(path, args.images, index, calibration, args.imgsz)
+            for path in (onnx_path, int8_path)
+        )
+    )
+
+    inputs = load_inputs(
+        args.images, max(Config.export_parity_images, 1), args.imgsz
+    )
+    runtimes = [OnnxRuntime(onnx_path), OnnxRuntime(int8_path, "onnx-int8")]
+    threads = args.threads or default_sweep()[1:]
+    results = benchmark(
+        runtimes, inputs, args.batch_sizes, threads, args.iterations
+    )
+    gains = speedups(results)
+
+    pd.set_option("display.width", 120)
+    print("\nPer-class AP (val images outside the calibration set):")
+    print(changes.round(4).to_string())
+    print(
+        f"mAP {changes['AP_fp32'].mean():.4f} -> "
+        f"{changes['AP_int8'].mean():.4f}"
+    )
+    print("\nINT8 speed-up over FP32 ONNX:")
+    print(gains.round(2).to_string(index=False))
+    degraded = changes.index[changes["degraded"]].tolist()
+    if degraded:
+        print(f"AP drop above {AP_DROP_TOLERANCE}: " + ", ".join(degraded))
+
+    report = {
+        **system_info(),
+        "model": str(args.model),
+        "weights": file_digest(args.model),
+        "onnx": str(onnx_path),
+        "int8": str(int8_path),
+        "imgsz": args.imgsz,
+        "calibrate_method": Config.quant_calibrate_method,
+        "calibration_images": sample["image_name"].tolist(),
+        "calibration_strata": {
+            "/".join(map(str, key)): int(size) for key, size in strata.items()
+        },
+        "map_fp32": float(changes["AP_fp32"].mean()),
+        "map_int8": float(changes["AP_int8"].mean()),
+        "per_class": records(changes.reset_index()),
+        "degraded": degraded,
+        "latency": results,
+        "speedup": records(gains),
+    }
+    path = args.report or int8_path.with_name(f"{int8_path.stem}_report.json")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json_codec.dumps(report, indent=1))
+    print(f"Report -> {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""
+Post-hoc confidence and NMS threshold sweep on cached candidate boxes.
+
+The model runs once over the val images with NMS disabled (IoU 1.0), a
+minimal confidence (Config.prediction_conf) and up to
+Config.sweep_max_candidates boxes per image, and the candidates are kept
+in the prediction cache. Every NMS setting of the grid (class-aware or
+agnostic at a shared IoU, class-aware with per-class IoUs) is then
+re-applied to all images at once with NumPy. Each confidence threshold
+is a score cut of an NMS result: neither NMS nor matching lets a lower
+score change the outcome for a higher one. Results equal re-running
+inference up to the clipping of boxes at the image border, which
+ultralytics applies after NMS.
+
+Usage:
+    python -m autonomous_vision.object_detection.threshold_sweep
+        --model models/yolo11s_bdd.pt [--ious 0.45 0.6 0.7]
+        [--confs 0.001 0.25 0.5] [--per-class-iou "traffic light=0.3"]
+        [--output sweep.csv]
+"""
+
+import argparse
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from autonomous_vision.config import Config
+from autonomous_vision.data_parser.annotation_store import load_index
+from autonomous_vision.object_detection.data_loader import CocoIndex
+from autonomous_vision.object_detection.evaluation import (
+    Evaluator,
+    cached_predictions,
+)
+from autonomous_vision.object_detection.matching import (
+    MAX_PAIRS,
+    image_chunks,
+    pair_iou,
+)
+
+IOUS = (0.45, 0.5, 0.6, 0.7)
+CONFS = (0.001, 0.05, 0.1, 0.25, 0.4, 0.5)
+
+# Boxes kept per image after NMS, as in ultralytics
+MAX_DET = 300
+
+# (name, IoU threshold or one per class, class agnostic)
+NmsSetting = Tuple[str, Union[float, np.ndarray], bool]
+
+
+class SuppressionGraph:
+    """Overlapping candidate pairs of many images, for repeated NMS.
+
+    Candidates are sorted by image, best score first (ties keep input
+    order); each same-image pair (higher, lower) whose IoU exceeds
+    min_iou is an edge that some NMS setting may use. Only pairs whose
+    x ranges overlap are measured, found by a sweep along x1.
+    """
+
+    def __init__(
+        self,
+        image: np.ndarray,
+        boxes: np.ndarray,
+        classes: np.ndarray,
+        scores: np.ndarray,
+        min_iou: float,
+    ):
+        self.order = np.lexsort((-scores, image))
+        self.image = image[self.order]
+        self.classes = classes[self.order]
+        boxes = boxes[self.order]
+        n_images = int(image.max(initial=-1)) + 1
+        self.offsets = np.zeros(n_images + 1, dtype=np.int64)
+        np.cumsum(
+            np.bincount(self.image, minlength=n_images),
+            out=self.offsets[1:],
+        )
+
+        # Boxes by image, then x1; a box overlaps in x with the ones
+        # after it whose x1 is below its x2
+        x0 = boxes[:, 0].min(initial=0)
+        span = boxes[:, 2].max(initial=0) - x0 + 1
+        by_x = np.lexsort((boxes[:, 0], self.image))
+        key = self.image[by_x] * span + (boxes[by_x, 0] - x0)
+        end = np.searchsorted(
+            key, self.image[by_x] * span + (boxes[by_x, 2] - x0)
+        )
+        later = np.clip(end - np.arange(len(by_x)) - 1, 0, None)
+
+        src, dst, ious = [], [], []
+        per_image = np.bincount(self.image, weights=later, minlength=n_images)
+        for lo, hi in image_chunks(per_image.astype(np.int64), MAX_PAIRS):
+            rows = np.arange(self.offsets[lo], self.offsets[hi])
+            total = int(later[rows].sum())
+            if total == 0:
+                continue
+            pair_a = np.repeat(rows, later[rows])
+            first = np.cumsum(later[rows]) - later[rows]
+            pair_b = pair_a + 1 + np.arange(total)
+            pair_b -= np.repeat(first, later[rows])
+            # Back to score order: the higher scored box suppresses
+            pair_a, pair_b = by_x[pair_a], by_x[pair_b]
+            iou = pair_iou(boxes[pair_a], boxes[pair_b])
+            hit = iou > min_iou
+            src.append(np.minimum(pair_a, pair_b)[hit])
+            dst.append(np.maximum(pair_a, pair_b)[hit])
+            ious.append(iou[hit])
+        self.src = np.concatenate(src or [np.zeros(0, dtype=np.int64)])
+        self.dst = np.concatenate(dst or [np.zeros(0, dtype=np.int64)])
+        self.iou = np.concatenate(ious or [np.zeros(0)])
+
+    def nms(
+        self,
+        iou: Union[float, np.ndarray],
+        agnostic: bool = False,
+        max_det: int = MAX_DET,
+    ) -> np.ndarray:
+        """Input rows kept by greedy NMS, by image, best first.
+
+        A box is suppressed by a kept higher scored box (of its class
+        unless agnostic) with IoU > iou; iou may hold one threshold per
+        class, applied by the higher scored box's class.
+        """
+        thresholds = np.asarray(iou, dtype=np.float64)
+        if thresholds.ndim:
+            active = self.iou > thresholds[self.classes[self.src]]
+        else:
+            active = self.iou > thresholds
+        if not agnostic:
+            active &= self.classes[self.src] == self.classes[self.dst]
+        src, dst = self.src[active], self.dst[active]
+
+        # Edges run from higher to lower scores, so the greedy result is
+        # the only fixed point of "kept unless a kept box suppresses it";
+        # iterating from all kept reaches it after the longest chain
+        keep = np.ones(len(self.order), dtype=bool)
+        while True:
+            suppressed = np.zeros(len(keep), dtype=bool)
+            suppressed[dst[keep[src]]] = True
+            if np.array_equal(keep, ~suppressed):
+                break
+            keep = ~suppressed
+
+        # The max_det best kept boxes of each image
+        kept_before = np.r_[0, np.cumsum(keep)]
+        rank = kept_before[1:] - kept_before[self.offsets[self.image]]
+        keep &= rank <= max_det
+        return self.order[keep]
+
+
+def nms_settings(
+    ious: Sequence[float] = IOUS, per_class_iou: Optional[np.ndarray] = None
+) -> List[NmsSetting]:
+    """Class-aware and agnostic NMS at every IoU, plus per-class IoUs."""
+    settings: List[NmsSetting] = [
+        (name, iou, name == "agnostic")
+        for name in ("class", "agnostic")
+        for iou in ious
+    ]
+    if per_class_iou is not None:
+        settings.append(("per-class", np.asarray(per_class_iou), False))
+    return settings
+
+
+def run_sweep(
+    index: CocoIndex,
+    image: np.ndarray,
+    boxes: np.ndarray,
+    classes: np.ndarray,
+    scores: np.ndarray,
+    images: np.ndarray,
+    settings: Sequence[NmsSetting],
+    confs: Sequence[float] = CONFS,
+) -> pd.DataFrame:
+    """Metrics of every NMS setting and confidence threshold.
+
+    Args:
+        index: Ground truth
+        image, boxes, classes, scores: Candidate boxes (xyxy pixels)
+            with the CocoIndex position of their image
+        images: Positions of all images the candidates cover
+        settings: NMS settings (see nms_settings)
+        confs: Confidence thresholds
+
+    Returns:
+        One row per (nms, iou, conf) with AP, AP50, P50, R50, F1 and the
+        number of detections
+    """
+    min_iou = min(float(np.min(iou)) for _, iou, _ in settings)
+    graph = SuppressionGraph(image, boxes, classes, scores, min_iou)
+    rows = []
+    for name, iou, agnostic in settings:
+        kept = graph.nms(iou, agnostic)
+        evaluator = Evaluator(index)
+        evaluator.add(
+            image[kept], boxes[kept], classes[kept], scores[kept], images
+        )
+        for conf in confs:
+            metrics = evaluator.summary(conf, slices=["all"]).iloc[0]
+            p, r = metrics["P50"], metrics["R50"]
+            rows.append(
+                {
+                    "nms": name,
+                    "iou": iou if np.ndim(iou) == 0 else np.nan,
+                    "conf": conf,
+                    "AP": metrics["AP"],
+                    "AP50": metrics["AP50"],
+                    "P50": p,
+                    "R50": r,
+                    "F1": 2 * p * r / (p + r) if p + r > 0 else 0.0,
+                    "detections": int((scores[kept] >= conf).sum()),
+                }
+            )
+    return pd.DataFrame(rows)
+
+
+def parse_per_class_iou(
+    entries: Sequence[str], names: Sequence[str]
+) -> np.ndarray:
+    """'name=iou' entries over Config.prediction_iou for other classes."""
+    ious = np.full(len(names), Config.prediction_iou)
+    for entry in entries:
+        name, _, value = entry.rpartition("=")
+        ious[list(names).index(name)] = float(value)
+    return ious
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--model", type=Path, required=True)
+    parser.add_argument("--images", type=Path, default=Config.val_images)
+    parser.add_argument("--coco", type=Path, default=Config.val_json)
+    parser.add_argument(
+        "--store", type=Path, help="Annotation store instead of --coco"
+    )
+    parser.add_argument("--ious", type=float, nargs="+", default=IOUS)
+    parser.add_argument("--confs", type=float, nargs="+", default=CONFS)
+    parser.add_argument(
+        "--per-class-iou", nargs="+", metavar="NAME=IOU", default=None
+    )
+    parser.add_argument("--output", type=Path, help="CSV report")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    index = load_index(args.coco, args.store)
+    # One inference pass without NMS; cached for later sweeps
+    *columns, images = cached_predictions(
+        args.model,
+        args.images,
+        index,
+        iou=1.0,
+        max_det=Config.sweep_max_candidates,
+    )
+    per_class = None
+    if args.per_class_iou:
+        per_class = parse_per_class_iou(args.per_class_iou, index.names)
+    report = run_sweep(
+        index,
+        *columns,
+        images,
+        nms_settings(args.ious, per_class),
+        args.confs,
+    )
+
+    pd.set_option("display.width", 120)
+    print(report.round(4).to_string(index=False))
+    for metric in ("AP", "F1"):
+        best = report.loc[report[metric].idxmax()]
+        print(
+            f"Best {metric}: nms={best['nms']} iou={best['iou']} "
+            f"conf={best['conf']} ({best[metric]:.4f})"
+        )
+    if args.output:
+        report.to_csv(args.output, index=False)
+        print(f"Report -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
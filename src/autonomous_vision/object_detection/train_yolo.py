@@ -7,20 +7,50 @@ from pathlib import Path
 from ultralytics import YOLO
 
 from autonomous_vision.config import Config as C
-from autonomous_vision.object_detection.data_loader import load_coco
+from autonomous_vision.data_parser.bdd_to_yolo import create_yolo_labels
+from autonomous_vision.object_detection.image_cache import build_image_cache
 from autonomous_vision.object_detection.label_utils import (
     create_empty_labels_for_unlabeled_images,
     make_yolo_yaml,
-    write_yolo_labels,
+    unlabeled_stems,
 )
+from autonomous_vision.object_detection.loader_benchmark import train_workers
+from autonomous_vision.utils.image_index import open_index
+
+# Training hyperparameters; loader_benchmark builds the training
+# dataloader with the same ones
+TRAIN_ARGS = {
+    "cos_lr": True,
+    "lr0": 0.0025,
+    "lrf": 0.01,
+    "optimizer": "AdamW",
+    "amp": True,
+    "weight_decay": 0.01,
+    "close_mosaic": 4,
+    "patience": 4,
+    "label_smoothing": 0.01,
+    "overlap_mask": False,
+}
 
 
 def sanity_check_paths():
     """Check if all required paths exist."""
-    paths = [C.train_images, C.val_images, C.train_json, C.val_json]
+    paths = [C.train_images, C.val_images, C.train_labels, C.val_labels]
     for path in paths:
         if not Path(path).exists():
             raise FileNotFoundError(f"Path not found: {path}")
+    # Served from the persistent image index after the first run
+    for images_dir in (C.train_images, C.val_images):
+        if not open_index(Path(images_dir)):
+            raise FileNotFoundError(f"No images found in {images_dir}")
+
+
+def report(stats: dict, labels_dir: Path) -> None:
+    """Print label sync counts."""
+    print(
+        f"   {stats['written']} written, {stats['skipped']} unchanged, "
+        f"{stats['deleted']} stale deleted -> {labels_dir}"
+    )
 
 
 def main():
@@ -34,32 +64,45 @@ def main():
     train_labels_dir = train_images_dir.parent.parent / "labels" / "train"
     val_labels_dir = val_images_dir.parent.parent / "labels" / "val"
 
-    print("==> Converting COCO JSON to YOLO TXT labels (train)...")
-    tr_images, tr_anns_by_img, names = load_coco(Path(C.train_json))
-    n_tr = write_yolo_labels(tr_images, tr_anns_by_img, train_labels_dir)
-    print(f"   Wrote {n_tr} label files -> {train_labels_dir}")
+    # Empty labels of unlabeled train images must survive stale pruning
+    unlabeled_list_path = Path(C.unlabeled_train_list)
+    unlabeled = unlabeled_stems(unlabeled_list_path)
+
+    # Labels come straight from the raw BDD100K JSON; the class order is
+    # that of the COCO categories
+    names = list(C.detection_classes)
 
-    print("==> Converting COCO JSON to YOLO TXT labels (val)...")
-    va_images, va_anns_by_img, names_val = load_coco(Path(C.val_json))
-    if names_val != names:
-        raise RuntimeError("Train/Val category lists differ")
-    n_va = write_yolo_labels(va_images, va_anns_by_img, val_labels_dir)
-    print(f"   Wrote {n_va} label files -> {val_labels_dir}")
+    print("==> Converting BDD100K JSON to YOLO TXT labels (train)...")
+    stats = create_yolo_labels(
+        Path(C.train_labels), train_labels_dir, keep=unlabeled
+    )
+    report(stats, train_labels_dir)
+
+    print("==> Converting BDD100K JSON to YOLO TXT labels (val)...")
+    stats = create_yolo_labels(Path(C.val_labels), val_labels_dir)
+    report(stats, val_labels_dir)
 
     # Create empty labels for unlabeled images to prevent background issue
     print("==> Creating empty labels for unlabeled images...")
-    unlabeled_list_path = Path("data/lists/unlabeled_train.txt")
-    if unlabeled_list_path.exists():
-        n_empty = create_empty_labels_for_unlabeled_images(
+    if unlabeled:
+        stats = create_empty_labels_for_unlabeled_images(
             unlabeled_list_path, train_labels_dir
         )
         print(
-            f"Created {n_empty} empty label files to prevent "
-            f"background issue"
+            f"Created {stats['written']} empty label files to prevent "
+            f"background issue ({stats['skipped']} already present)"
         )
     else:
         print("No unlabeled list found, skipping empty label creation")
 
+    if C.use_image_cache:
+        # Val stays on the originals: metrics and predictions.json must
+        # be in the pixel frame of the val COCO file
+        print(f"==> Caching train images resized for imgsz={C.imgsz}...")
+        train_images_dir = build_image_cache(
+            train_images_dir, train_labels_dir, "train"
+        )
+
     tmp_yaml = make_yolo_yaml(
         train_images_dir,
         val_images_dir,
@@ -68,7 +111,8 @@ def main():
     )
     print(f"==> Dataset YAML: {tmp_yaml}")
 
-    print("==> Starting training ...")
+    workers = train_workers()
+    print(f"==> Starting training ({workers} dataloader workers) ...")
     model = YOLO(C.model_name)
 
     model.train(
@@ -78,18 +122,9 @@ def main():
         epochs=C.epochs,
         batch=C.batch,
         device=C.device,
-        workers=8,
+        workers=workers,
         rect=C.rect,
-        cos_lr=True,
-        lr0=0.0025,
-        lrf=0.01,
-        optimizer="AdamW",
-        amp=True,
-        weight_decay=0.01,
-        close_mosaic=4,
-        patience=4,
-        label_smoothing=0.01,
-        overlap_mask=False,
+        **TRAIN_ARGS,
         plots=True,
         save=True,
         project=C.project,
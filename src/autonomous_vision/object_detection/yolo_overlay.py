@@ -1,23 +1,49 @@
+"""
+Ground truth (red) and YOLO prediction (green) overlays for val images.
+
+A thread pool reads and resizes images ahead of the model, predictions
+run in batches of Config.overlay_batch_size, and a second pool draws and
+encodes the overlays while the next batch is inferred. Predictions come
+from the prediction cache when present; only missing images are run
+through the model, and their detections are added to the cache.
+
+Usage:
+    python -m autonomous_vision.object_detection.yolo_overlay
+        [--n-images 10] [--conf 0.25] [--iou 0.45] [--output-dir DIR]
+"""
+
+import argparse
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
+from typing import Callable, Deque, Iterable, Iterator, Optional
 
 import cv2
-from ultralytics import YOLO
+import numpy as np
 
 from autonomous_vision.config import Config
+from autonomous_vision.object_detection.label_utils import LabelArchive
+from autonomous_vision.object_detection.prediction_cache import (
+    PredictionCache,
+    by_image,
+)
+from autonomous_vision.utils.helper import scan_images
 
 MODEL_PATH = "./models/yolo11s_bdd.pt"
 VAL_IMAGES_DIR = Config.val_images
 VAL_LABELS_DIR = Config.val_labels_yolo
+VAL_LABELS_ARCHIVE = Config.val_labels_archive
 OUTPUT_DIR = "./outputs/viz_yolo11_today"
 IMG_SIZE = (1280, 720)  # Original image size
 N_IMAGES = 10
-
-model = YOLO(MODEL_PATH)
-class_names = model.names
+NO_DETECTIONS = (np.zeros((0, 4)), np.zeros(0), np.zeros(0))
 
 
-def draw_boxes(image, boxes, color, labels=None, scores=None):
+def draw_boxes(
+    image, boxes, color, labels=None, scores=None, class_names=None
+):
     """Draw bounding boxes on image with optional labels and scores."""
+    class_names = class_names or {}
     for i, box in enumerate(boxes):
         box_x1, box_y1, box_x2, box_y2 = map(int, box)
         cv2.rectangle(image, (box_x1, box_y1), (box_x2, box_y2), color, 2)
@@ -41,47 +67,200 @@ def draw_boxes(image, boxes, color, labels=None, scores=None):
     return image
 
 
-output_dir_path = Path(OUTPUT_DIR)
-output_dir_path.mkdir(parents=True, exist_ok=True)
-image_paths = sorted(Path(VAL_IMAGES_DIR).glob("*.jpg"))[:N_IMAGES]
+def load_ground_truth(stem, archive=None, labels_dir=VAL_LABELS_DIR):
+    """Classes and normalized cx, cy, w, h rows of one image's labels."""
+    if archive is not None:
+        if stem not in archive:
+            return [], []
+        classes, values = archive.labels(stem)
+        return classes.tolist(), values.tolist()
 
-print("Starting YOLO overlay generation...")
-print(f"Model: {MODEL_PATH}")
-print(f"Processing {N_IMAGES} images...")
-
-for img_path in image_paths:
-    img = cv2.imread(str(img_path))
-    img = cv2.resize(img, IMG_SIZE)
-
-    # Load ground truth
-    label_file = Path(VAL_LABELS_DIR) / (img_path.stem + ".txt")
-    gt_boxes, gt_classes = [], []
+    classes, values = [], []
+    label_file = Path(labels_dir) / (stem + ".txt")
     if label_file.exists():
         with open(label_file, "r", encoding="utf-8") as f:
             for line in f:
                 cls, x, y, bw, bh = map(float, line.strip().split())
-                gt_x1 = int((x - bw / 2) * IMG_SIZE[0])
-                gt_y1 = int((y - bh / 2) * IMG_SIZE[1])
-                gt_x2 = int((x + bw / 2) * IMG_SIZE[0])
-                gt_y2 = int((y + bh / 2) * IMG_SIZE[1])
-                gt_boxes.append([gt_x1, gt_y1, gt_x2, gt_y2])
-                gt_classes.append(int(cls))
-
-    # Run YOLO prediction
-    results = model.predict(
-        str(img_path), imgsz=IMG_SIZE[0], conf=0.25, iou=0.45, verbose=True
+                classes.append(int(cls))
+                values.append([x, y, bw, bh])
+    return classes, values
+
+
+def gt_pixel_boxes(values) -> np.ndarray:
+    """Normalized cx, cy, w, h rows to x1, y1, x2, y2 pixels of IMG_SIZE."""
+    cxcywh = np.asarray(values, dtype=np.float64).reshape(-1, 4)
+    half = cxcywh[:, 2:] / 2
+    scale = np.tile(IMG_SIZE, 2)
+    corners = np.hstack([cxcywh[:, :2] - half, cxcywh[:, :2] + half])
+    return (corners * scale).astype(int)
+
+
+def _prefetch(
+    pool: ThreadPoolExecutor, fn: Callable, items: Iterable, depth: int
+) -> Iterator:
+    """fn over items in order, keeping up to depth calls in flight."""
+    pending: Deque[Future] = deque()
+    for item in items:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= depth:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def _read_image(img_path: Path):
+    img = cv2.imread(str(img_path))
+    if img is not None:
+        img = cv2.resize(img, IMG_SIZE)
+    return img_path, img
+
+
+def _batches(iterable: Iterable, size: int) -> Iterator[list]:
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def render_overlays(
+    n_images: Optional[int] = N_IMAGES,
+    conf: float = 0.25,
+    iou: float = 0.45,
+    output_dir: Path = Path(OUTPUT_DIR),
+    model_path: str = MODEL_PATH,
+    images_dir: Path = Path(VAL_IMAGES_DIR),
+    batch_size: Optional[int] = None,
+    workers: Optional[int] = None,
+) -> int:
+    """Write overlays of the first n_images val images (None = all).
+
+    Returns:
+        Number of overlays written
+    """
+    batch_size = batch_size or Config.overlay_batch_size
+    workers = workers or Config.overlay_workers
+    cache = PredictionCache(
+        Path(model_path),
+        imgsz=IMG_SIZE[0],
+        iou=iou,
+        conf=min(conf, Config.prediction_conf),
+    )
+    # Class order of the dataset YAML the model was trained on
+    class_names = dict(enumerate(Config.detection_classes))
+
+    # The packed archive answers each lookup without a file open
+    label_archive = None
+    if Path(VAL_LABELS_ARCHIVE).exists():
+        label_archive = LabelArchive(Path(VAL_LABELS_ARCHIVE))
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    image_paths = sorted(
+        path
+        for path in scan_images(images_dir).values()
+        if path.suffix == ".jpg"
+    )[:n_images]
+
+    print("Starting YOLO overlay generation...")
+    print(f"Model: {model_path}")
+    print(f"Processing {len(image_paths)} images...")
+
+    stems = [path.stem for path in image_paths]
+    hits = cache.stems().intersection(stems)
+    detections = by_image(cache.load(hits, conf))
+    print(f"Cached predictions for {len(hits)} images")
+
+    def write_overlay(img_path, img, found):
+        gt_classes, gt_values = load_ground_truth(img_path.stem, label_archive)
+        pred_boxes, pred_classes, pred_scores = found
+
+        img = draw_boxes(  # RED = GT
+            img,
+            gt_pixel_boxes(gt_values),
+            (0, 0, 255),
+            gt_classes,
+            class_names=class_names,
+        )
+        img = draw_boxes(  # GREEN = Pred
+            img,
+            pred_boxes,
+            (0, 255, 0),
+            pred_classes,
+            pred_scores,
+            class_names=class_names,
+        )
+        out_path = output_dir / f"{img_path.stem}_viz.jpg"
+        return cv2.imwrite(str(out_path), img)
+
+    written = 0
+    with (
+        ThreadPoolExecutor(max_workers=workers) as readers,
+        ThreadPoolExecutor(max_workers=workers) as writers,
+    ):
+        pending: Deque[Future] = deque()
+        decoded = _prefetch(readers, _read_image, image_paths, 2 * batch_size)
+        for batch in _batches(decoded, batch_size):
+            for img_path, img in batch:
+                if img is None:
+                    print(f"Could not read {img_path}")
+            batch = [(path, img) for path, img in batch if img is not None]
+            misses = [(p, img) for p, img in batch if p.stem not in hits]
+            if misses:
+                found = cache.infer([img for _, img in misses])
+                cache.add([path.stem for path, _ in misses], found)
+                for (path, _), (boxes, classes, scores) in zip(misses, found):
+                    keep = scores >= conf
+                    detections[path.stem] = (
+                        boxes[keep],
+                        classes[keep],
+                        scores[keep],
+                    )
+            for img_path, img in batch:
+                found = detections.get(img_path.stem, NO_DETECTIONS)
+                pending.append(
+                    writers.submit(write_overlay, img_path, img, found)
+                )
+            # Drawing lags inference by at most two batches
+            while len(pending) > 2 * batch_size:
+                written += pending.popleft().result()
+        while pending:
+            written += pending.popleft().result()
+    cache.flush()
+
+    print(f"Saved {written} overlays to: {output_dir}")
+    return written
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--n-images",
+        type=int,
+        default=N_IMAGES,
+        help="Images to render (0 = the whole split)",
     )
-    for r in results:
-        pred_boxes = r.boxes.xyxy.cpu().numpy()
-        pred_classes = r.boxes.cls.cpu().numpy()
-        pred_scores = r.boxes.conf.cpu().numpy()
+    parser.add_argument("--conf", type=float, default=0.25)
+    parser.add_argument("--iou", type=float, default=0.45)
+    parser.add_argument("--output-dir", type=Path, default=Path(OUTPUT_DIR))
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--batch-size", type=int)
+    return parser.parse_args()
 
-    img = draw_boxes(img, gt_boxes, (0, 0, 255), gt_classes)  # RED = GT
-    img = draw_boxes(
-        img, pred_boxes, (0, 255, 0), pred_classes, pred_scores
-    )  # GREEN = Pred
 
-    out_path = output_dir_path / f"{img_path.stem}_viz.jpg"
-    cv2.imwrite(str(out_path), img)
+def main():
+    args = parse_args()
+    render_overlays(
+        n_images=args.n_images or None,
+        conf=args.conf,
+        iou=args.iou,
+        output_dir=args.output_dir,
+        model_path=args.model,
+        batch_size=args.batch_size,
+    )
+
 
-print(f"Saved overlays to: {output_dir_path}")
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,21 @@
-import json
+import gzip
 from pathlib import Path
-from typing import Dict, Iterable
+from typing import (
+    BinaryIO,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
 import pandas as pd
+import pyarrow.compute as pc
+
+from autonomous_vision.utils import json_codec
+from autonomous_vision.utils.image_index import open_index
 
 
 def ensure_dir(path: Path) -> None:
@@ -13,33 +26,59 @@ def ensure_dir(path: Path) -> None:
 def scan_images(images_dir: Path) -> Dict[str, Path]:
     """Build a filename to path mapping for images.
 
+    Served from the persistent image index, which only re-lists
+    directories that changed since the last call.
+
     Returns:
         Dictionary mapping filename to full path
     """
-    idx: Dict[str, Path] = {}
-    for path in images_dir.rglob("*"):
-        if path.suffix.lower() in {".jpg", ".jpeg", ".png"}:
-            idx[path.name] = path
-    return idx
+    return open_index(images_dir).paths()
+
+
+def open_binary(path: Path) -> BinaryIO:
+    """Open a file for binary reading, decompressing .gz files."""
+    if path.suffix.lower() == ".gz":
+        return gzip.open(path, "rb")
+    return path.open("rb")
 
 
-def load_json_records(path: Path) -> Iterable[dict]:
+def _first_char(f: BinaryIO) -> bytes:
+    """Return the first non-whitespace byte and rewind the file."""
+    char = b""
+    while not char:
+        chunk = f.read(4096)
+        if not chunk:
+            break
+        char = chunk.lstrip()[:1]
+    f.seek(0)
+    return char
+
+
+def load_json_records(path: Path, stream: bool = True) -> Iterable[dict]:
     """Load JSON records from file.
 
-    Supports:
-        - .json files
-    Outputs dicts (one per image record).
+    Supports (optionally gzip-compressed, e.g. .json.gz):
+        - .jsonl files (one record per line)
+        - .json files holding a list of records, decoded incrementally
+          when ``stream`` is set
+        - .json files holding a dict with an "images" list
+    Outputs dicts (one per image record). Decoding goes through
+    json_codec.
     """
-    if path.suffix.lower() == ".jsonl":
-        with path.open("r", encoding="utf-8") as f:
+    suffix = Path(path.stem).suffix if path.suffix == ".gz" else path.suffix
+    if suffix.lower() == ".jsonl":
+        with open_binary(path) as f:
             for line in f:
                 line = line.strip()
                 if line:
-                    yield json.loads(line)
+                    yield json_codec.loads(line)
         return
 
-    with path.open("r", encoding="utf-8") as f:
-        data = json.load(f)
+    with open_binary(path) as f:
+        if stream and _first_char(f) == b"[":
+            yield from json_codec.iter_array(f)
+            return
+        data = json_codec.load(f)
 
     if isinstance(data, list):
         yield from data
@@ -68,18 +107,84 @@ def coco_bbox_to_yolo_norm(x, y, width, height, img_width, img_height):
     )
 
 
-def load_val_parquet(parquet_path: Path) -> pd.DataFrame:
+# Row filters: a pyarrow expression or DNF tuples such as
+# [("timeofday", "==", "night"), ("weather", "in", ["rainy", "snowy"])]
+ParquetFilters = Union[pc.Expression, List[Tuple], List[List[Tuple]]]
+
+
+def _with_split(filters: Optional[ParquetFilters], split: str):
+    """Add split == <split> to a filter in either supported form."""
+    if filters is None:
+        return [("split", "==", split)]
+    if isinstance(filters, pc.Expression):
+        return filters & (pc.field("split") == split)
+    if filters and isinstance(filters[0], list):
+        return [[*conj, ("split", "==", split)] for conj in filters]
+    return [*filters, ("split", "==", split)]
+
+
+def load_split_parquet(
+    parquet_path: Path,
+    split: str,
+    columns: Optional[Sequence[str]] = None,
+    filters: Optional[ParquetFilters] = None,
+) -> pd.DataFrame:
     """
-    Load BDD100K validation metadata parquet file.
+    Load parsed BDD100K metadata for one split.
+
+    The column projection and row filters are handed to the Parquet
+    reader, which skips unused columns, row groups whose statistics
+    rule out the filter and, for the hive-partitioned dataset, whole
+    split/timeofday/weather/scene directories.
 
     Args:
-        parquet_path (Path): Path to val_data.parquet
+        parquet_path (Path): A split's Parquet file (e.g. val_data.parquet)
+            or the partitioned dataset directory (Config.parquet_dataset)
+        split (str): Split to keep when reading the partitioned dataset
+        columns (Sequence[str], optional): Columns to read (default: all)
+        filters (optional): pyarrow expression or DNF filter tuples
 
     Returns:
-        pd.DataFrame: Data with columns like scene, weather, time, etc.
+        pd.DataFrame: Matching rows of the requested columns
     """
     if not parquet_path.exists():
         raise FileNotFoundError(f"{parquet_path} does not exist.")
 
-    df = pd.read_parquet(parquet_path)
-    return df
+    if parquet_path.is_dir():
+        filters = _with_split(filters, split)
+
+    return pd.read_parquet(
+        parquet_path,
+        columns=list(columns) if columns is not None else None,
+        filters=filters,
+    )
+
+
+def load_train_parquet(
+    parquet_path: Path,
+    columns: Optional[Sequence[str]] = None,
+    filters: Optional[ParquetFilters] = None,
+) -> pd.DataFrame:
+    """Load BDD100K training metadata (see load_split_parquet)."""
+    return load_split_parquet(parquet_path, "train", columns, filters)
+
+
+def load_val_parquet(
+    parquet_path: Path,
+    columns: Optional[Sequence[str]] = None,
+    filters: Optional[ParquetFilters] = None,
+) -> pd.DataFrame:
+    """
+    Load BDD100K validation metadata parquet file.
+
+    Args:
+        parquet_path (Path): Path to val_data.parquet or the partitioned
+            dataset directory
+        columns (Sequence[str], optional): Columns to read (default: all)
+        filters (optional): pyarrow expression or DNF filter tuples,
+            pushed down to the reader
+
+    Returns:
+        pd.DataFrame: Data with columns like scene, weather, time, etc.
+    """
+    return load_split_parquet(parquet_path, "val", columns, filters)
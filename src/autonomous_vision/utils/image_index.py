@@ -0,0 +1,159 @@
+"""
+Persistent index of the images under a directory tree.
+
+One JSON file per image root records, for every directory, its mtime,
+subdirectories and image files (name -> size, mtime). A refresh stats
+each directory once and only lists the ones whose mtime changed, since
+adding, removing or renaming an entry updates the parent's mtime. The
+directories of one tree level are visited in parallel with os.scandir.
+Files rewritten in place keep their old size/mtime until a full refresh.
+"""
+
+import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from autonomous_vision.config import Config
+from autonomous_vision.utils import json_codec
+
+INDEX_VERSION = 1
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png"}
+
+# A directory modified this recently may change again within the same
+# mtime tick after it was listed, so it is listed again next time
+_RACY_WINDOW_NS = 2_000_000_000
+
+
+def index_path(root: Path) -> Path:
+    """Index file for an image root under Config.image_index_dir."""
+    key = hashlib.sha256(str(root.resolve()).encode()).hexdigest()[:16]
+    return Config.image_index_dir / f"{root.name}-{key}.json"
+
+
+def _scan_dir(path: str, previous: Optional[dict]) -> Optional[dict]:
+    """Directory record, reusing previous if the mtime is unchanged."""
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    if previous is not None and previous["mtime_ns"] == mtime_ns:
+        return previous
+
+    subdirs: List[str] = []
+    files: Dict[str, List[int]] = {}
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.name)
+            elif (
+                os.path.splitext(entry.name)[1].lower() in IMAGE_SUFFIXES
+                and entry.is_file()
+            ):
+                stat = entry.stat()
+                files[entry.name] = [stat.st_size, stat.st_mtime_ns]
+    if time.time_ns() - mtime_ns < _RACY_WINDOW_NS:
+        mtime_ns = -1
+    return {"mtime_ns": mtime_ns, "subdirs": sorted(subdirs), "files": files}
+
+
+class ImageIndex:
+    """Image file name to path/size/mtime lookups for one image root."""
+
+    def __init__(self, root: Path, path: Optional[Path] = None):
+        self.root = root
+        self.path = path or index_path(root)
+        self.dirs: Dict[str, dict] = {}
+        if self.path.exists():
+            data = json_codec.loads(self.path.read_bytes())
+            recorded = (data.get("version"), data.get("root"))
+            if recorded == (INDEX_VERSION, str(root)):
+                self.dirs = data["dirs"]
+        self._names: Optional[Dict[str, str]] = None
+
+    def refresh(
+        self, full: bool = False, workers: Optional[int] = None
+    ) -> Dict[str, int]:
+        """Bring the index up to date with the directory tree.
+
+        Returns:
+            Counts of directories visited and of those re-listed
+        """
+        previous = {} if full else self.dirs
+        dirs: Dict[str, dict] = {}
+        listed = 0
+        frontier = [""]
+        workers = workers or Config.image_index_workers
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while frontier:
+                records = pool.map(
+                    lambda rel: _scan_dir(
+                        os.path.join(self.root, rel), previous.get(rel)
+                    ),
+                    frontier,
+                )
+                level, frontier = frontier, []
+                for rel, record in zip(level, records):
+                    if record is None:
+                        continue
+                    listed += record is not previous.get(rel)
+                    dirs[rel] = record
+                    frontier.extend(
+                        os.path.join(rel, name) for name in record["subdirs"]
+                    )
+
+        if listed or dirs.keys() != self.dirs.keys():
+            self.dirs = dirs
+            self._names = None
+            self.save()
+        return {"dirs": len(dirs), "listed": listed}
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        data = {"version": INDEX_VERSION, "root": str(self.root)}
+        data["dirs"] = self.dirs
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        tmp_path.write_text(json_codec.dumps(data, separators=(",", ":")))
+        os.replace(tmp_path, self.path)
+
+    def _by_name(self) -> Dict[str, str]:
+        if self._names is None:
+            # Directories in walk order; a repeated name keeps the last
+            self._names = {
+                name: rel
+                for rel, record in self.dirs.items()
+                for name in record["files"]
+            }
+        return self._names
+
+    def __len__(self) -> int:
+        return len(self._by_name())
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._by_name()
+
+    def lookup(self, name: str) -> Path:
+        """Full path of an image file name, e.g. "b1c66a42-6f7d68ca.jpg"."""
+        return self.root / self._by_name()[name] / name
+
+    def stat(self, name: str) -> Tuple[int, int]:
+        """Recorded (size, mtime_ns) of an image."""
+        size, mtime_ns = self.dirs[self._by_name()[name]]["files"][name]
+        return size, mtime_ns
+
+    def paths(self) -> Dict[str, Path]:
+        """File name to full path for every indexed image."""
+        return {
+            name: self.root / rel / name
+            for name, rel in self._by_name().items()
+        }
+
+
+def open_index(root: Path) -> ImageIndex:
+    """Load the persistent index for root and refresh it."""
+    index = ImageIndex(root)
+    index.refresh()
+    return index
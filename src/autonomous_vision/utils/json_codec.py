@@ -0,0 +1,149 @@
+"""
+JSON codec shared by the loaders and writers.
+
+Whole documents are decoded with orjson when it is installed (the
+"fast-json" extra) and Config.json_backend allows it; input orjson
+rejects (NaN, lone surrogates, out-of-range floats, ...) is handed to
+the stdlib json module, which accepts or rejects it as before. orjson
+reads integers beyond 64 bits as floats, which none of the pipeline's
+files hold. Encoding and the incremental array reader always use the
+stdlib, so written files are byte-identical whichever backend is active.
+"""
+
+import io
+import json
+import re
+from typing import IO, BinaryIO, Iterator, Optional, Tuple, Union
+
+from autonomous_vision.config import Config
+
+try:
+    import orjson
+except ImportError:  # optional speedup
+    orjson = None
+
+BACKENDS = ("orjson", "stdlib")
+
+# Read size for the incremental JSON array reader
+JSON_CHUNK_SIZE = 1 << 20
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+def _select(name: str) -> str:
+    if name == "auto":
+        return "orjson" if orjson is not None else "stdlib"
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown JSON backend: {name}")
+    if name == "orjson" and orjson is None:
+        raise ImportError("json_backend is 'orjson' but it is not installed")
+    return name
+
+
+_backend = _select(Config.json_backend)
+
+
+def backend() -> str:
+    """Name of the active decoding backend."""
+    return _backend
+
+
+def set_backend(name: str) -> None:
+    """Switch backend ("auto", "orjson" or "stdlib")."""
+    global _backend
+    _backend = _select(name)
+
+
+def loads(data: Union[str, bytes]):
+    """Decode a JSON document."""
+    if _backend == "orjson":
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass  # let the stdlib accept or reject it
+    return json.loads(data)
+
+
+def load(f: IO):
+    """Decode a JSON document from a text or binary file."""
+    return loads(f.read())
+
+
+def dumps(
+    obj,
+    indent: Optional[int] = None,
+    separators: Optional[Tuple[str, str]] = None,
+) -> str:
+    """Encode obj with json.dumps(obj, indent, separators)."""
+    return json.dumps(obj, indent=indent, separators=separators)
+
+
+def _iter_array(f: IO[str], chunk_size: int) -> Iterator:
+    """Decode the elements of a top-level JSON array one at a time.
+
+    Only the current element plus one read buffer is held in memory, so
+    peak usage no longer scales with the size of the file.
+    """
+    decoder = json.JSONDecoder()
+    buf, pos = "", 0
+    while pos == len(buf):
+        buf = f.read(chunk_size)
+        if not buf:
+            break
+        pos = _WHITESPACE.match(buf).end()
+    if buf[pos : pos + 1] != "[":
+        raise ValueError("Expected a top-level JSON array")
+    pos += 1
+    eof = False
+    first = True
+    expect_value = True
+
+    while True:
+        pos = _WHITESPACE.match(buf, pos).end()
+
+        # Refill when the buffer runs dry, dropping what was consumed
+        if pos == len(buf):
+            if eof:
+                raise ValueError("Unterminated JSON array")
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buf, pos = chunk, 0
+            continue
+
+        char = buf[pos]
+        if char == "]" and (first or not expect_value):
+            return
+        if not expect_value:
+            if char != ",":
+                raise ValueError(f"Expected ',' or ']', got {char!r}")
+            pos += 1
+            expect_value = True
+            continue
+
+        try:
+            obj, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            end = len(buf)
+
+        # An element may be cut short by the end of the buffer, also when
+        # only its prefix decodes ("2." of "2.5"): unless a separator
+        # follows in the buffer, grow it geometrically (so oversized
+        # elements stay linear to decode) and decode again
+        after = _WHITESPACE.match(buf, end).end()
+        if not eof and (after >= len(buf) or buf[after] not in ",]"):
+            chunk = f.read(max(chunk_size, len(buf) - pos))
+            eof = not chunk
+            buf, pos = buf[pos:] + chunk, 0
+            continue
+
+        yield obj
+        pos = end
+        first = False
+        expect_value = False
+
+
+def iter_array(f: BinaryIO, chunk_size: int = JSON_CHUNK_SIZE) -> Iterator:
+    """Stream the elements of a top-level JSON array from a binary file."""
+    return _iter_array(io.TextIOWrapper(f, encoding="utf-8"), chunk_size)
@@ -1,14 +1,23 @@
-from typing import List, Optional
+from typing import List, Literal, Optional, Sequence
 
-from pydantic import BaseModel, Field, field_validator
+import numpy as np
+from pydantic import (
+    BaseModel,
+    Field,
+    TypeAdapter,
+    ValidationError,
+    field_validator,
+)
 
 
-class BBox(BaseModel):
+class BBoxFields(BaseModel):
     x1: float
     y1: float
     x2: float
     y2: float
 
+
+class BBox(BBoxFields):
     @field_validator("x2")
     @classmethod
     def x2_gt_x1(cls, v, info):
@@ -26,20 +35,88 @@ class BBox(BaseModel):
         return v
 
 
-class ObjectAttributes(BaseModel):
+class ObjectFields(BaseModel):
     id: int
     category: str
-    box2d: Optional[BBox] = None
+    box2d: Optional[BBoxFields] = None
     attributes: Optional[dict] = None
 
 
+class ObjectAttributes(ObjectFields):
+    box2d: Optional[BBox] = None
+
+
 class ImageAttributes(BaseModel):
     scene: Optional[str] = None
     timeofday: Optional[str] = None
     weather: Optional[str] = None
 
 
-class ImageAnnotation(BaseModel):
+class ImageAnnotationFields(BaseModel):
     name: str
     attributes: Optional[ImageAttributes] = None
+    labels: List[ObjectFields] = Field(default_factory=list)
+
+
+class ImageAnnotation(ImageAnnotationFields):
     labels: List[ObjectAttributes] = Field(default_factory=list)
+
+
+# Structure-only validation of a whole chunk in one compiled call
+_BULK_ADAPTER = TypeAdapter(List[ImageAnnotationFields])
+
+ValidationMode = Literal["strict", "bulk"]
+
+
+def _first_bad_box(records: List[ImageAnnotationFields]) -> Optional[int]:
+    """Index of the first record with a misordered box, if any."""
+    counts = []
+    coords = []
+    for record in records:
+        boxes = [obj.box2d for obj in record.labels if obj.box2d]
+        counts.append(len(boxes))
+        coords.extend((b.x1, b.y1, b.x2, b.y2) for b in boxes)
+
+    if not coords:
+        return None
+
+    xyxy = np.asarray(coords, dtype=np.float64)
+    bad = (xyxy[:, 2] <= xyxy[:, 0]) | (xyxy[:, 3] <= xyxy[:, 1])
+    if not bad.any():
+        return None
+
+    record_idx = np.repeat(np.arange(len(records)), counts)
+    return int(record_idx[bad.argmax()])
+
+
+def validate_records(
+    raws: Sequence[dict], mode: ValidationMode = "strict"
+) -> List[ImageAnnotationFields]:
+    """Validate a chunk of raw image records.
+
+    strict: ImageAnnotation.model_validate per record.
+    bulk: structure through one compiled adapter call, box ordering
+    (x2 > x1, y2 > y1) as array comparisons over the chunk. A chunk
+    with a bad record is re-validated strictly from that record, so the
+    accept/reject decision and the ValidationError are the same in both
+    modes.
+    """
+    if mode == "strict":
+        return [ImageAnnotation.model_validate(raw) for raw in raws]
+
+    try:
+        records = _BULK_ADAPTER.validate_python(raws)
+        first_bad = len(raws)
+    except ValidationError as e:
+        first_bad = min(err["loc"][0] for err in e.errors())
+        records = _BULK_ADAPTER.validate_python(raws[:first_bad])
+
+    bad_box = _first_bad_box(records)
+    if bad_box is not None:
+        first_bad = bad_box
+
+    if first_bad < len(raws):
+        # Raises the same error as the strict path
+        ImageAnnotation.model_validate(raws[first_bad])
+
+    return records
@@ -0,0 +1,158 @@
+"""Parity of the annotation store exporters with the JSON converters."""
+
+import json
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from autonomous_vision.config import Config
+from autonomous_vision.data_parser.annotation_store import (
+    AnnotationStore,
+    build_store,
+    export_coco,
+    export_parquet,
+    export_yolo,
+)
+from autonomous_vision.data_parser.bdd_to_coco import create_coco_dataset
+from autonomous_vision.data_parser.bdd_to_yolo import create_yolo_labels
+from autonomous_vision.data_parser.parser_core import write_split
+from autonomous_vision.object_detection.data_loader import load_coco_index
+
+CATEGORIES = list(Config.detection_classes) + ["lane", "drivable area"]
+
+
+def _record(rng: random.Random, i: int) -> dict:
+    labels = []
+    for j in range(rng.randint(0, 12)):
+        category = rng.choice(CATEGORIES)
+        label = {
+            "category": category,
+            "id": i * 100 + j,
+            "attributes": {
+                "occluded": rng.random() < 0.5,
+                "truncated": rng.random() < 0.2,
+                "trafficLightColor": rng.choice(["none", "green", "red"]),
+            },
+        }
+        if j % 7 == 6:
+            label["attributes"] = {}
+        if category in ("lane", "drivable area"):
+            label["poly2d"] = [
+                {"vertices": [[1.5, 2.0], [3.0, 4.0]], "closed": False}
+            ]
+        else:
+            x1, y1 = rng.uniform(-2, 1270), rng.uniform(-2, 710)
+            label["box2d"] = {
+                "x1": x1,
+                "y1": y1,
+                "x2": x1 + rng.uniform(0.01, 300),
+                "y2": y1 + rng.uniform(0.01, 200),
+            }
+        labels.append(label)
+    return {
+        "name": f"img{i:04d}.jpg",
+        "attributes": {
+            "weather": rng.choice(["clear", "rainy"]),
+            "scene": rng.choice(["city street", "highway"]),
+            "timeofday": rng.choice(["daytime", "night"]),
+        },
+        "timestamp": 10000,
+        "labels": labels,
+    }
+
+
+@pytest.fixture
+def labels_path(tmp_path):
+    rng = random.Random(0)
+    path = tmp_path / "labels.json"
+    path.write_text(json.dumps([_record(rng, i) for i in range(300)]))
+    return path
+
+
+@pytest.fixture
+def store(labels_path, tmp_path):
+    build_store(labels_path, tmp_path / "store")
+    return AnnotationStore(tmp_path / "store")
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_export_coco_matches_converter(store, labels_path, tmp_path, compact):
+    expected, actual = tmp_path / "expected.json", tmp_path / "actual.json"
+    create_coco_dataset(labels_path, expected, "val", compact=compact)
+    export_coco(store, actual, "val", compact=compact)
+    assert actual.read_bytes() == expected.read_bytes()
+
+
+def test_integer_coordinates_only_change_formatting(tmp_path):
+    record = {
+        "name": "a.jpg",
+        "labels": [
+            {
+                "category": "car",
+                "id": 1,
+                "box2d": {"x1": 100, "y1": 20, "x2": 300.5, "y2": 80},
+            }
+        ],
+    }
+    labels_path = tmp_path / "labels.json"
+    labels_path.write_text(json.dumps([record]))
+    build_store(labels_path, tmp_path / "store")
+    expected, actual = tmp_path / "expected.json", tmp_path / "actual.json"
+    create_coco_dataset(labels_path, expected, "val")
+    export_coco(AnnotationStore(tmp_path / "store"), actual, "val")
+
+    assert b'"bbox": [\n    100.0,' in actual.read_bytes()
+    assert json.loads(actual.read_text()) == json.loads(expected.read_text())
+
+
+def test_export_yolo_matches_converter(store, labels_path, tmp_path):
+    expected, actual = tmp_path / "expected", tmp_path / "actual"
+    create_yolo_labels(labels_path, expected)
+    export_yolo(store, actual)
+
+    files = sorted(p.name for p in expected.iterdir())
+    assert files == sorted(p.name for p in actual.iterdir())
+    for name in files:
+        assert (actual / name).read_bytes() == (expected / name).read_bytes()
+
+
+def test_export_parquet_matches_parser(
+    store, labels_path, tmp_path, monkeypatch
+):
+    monkeypatch.setattr(Config, "parsed_data", tmp_path / "expected")
+    write_split(labels_path, "val")
+    expected = pd.read_parquet(tmp_path / "expected" / "val_data.parquet")
+
+    monkeypatch.setattr(Config, "parsed_data", tmp_path / "actual")
+    export_parquet(store, "val")
+    actual = pd.read_parquet(tmp_path / "actual" / "val_data.parquet")
+    pd.testing.assert_frame_equal(actual, expected)
+    assert (tmp_path / "actual" / "val_data.csv").read_bytes() == (
+        tmp_path / "expected" / "val_data.csv"
+    ).read_bytes()
+
+
+def test_coco_index_matches_loaded_export(store, tmp_path):
+    export_coco(store, tmp_path / "coco.json", "val")
+    expected = load_coco_index(tmp_path / "coco.json")
+    actual = store.coco_index()
+
+    assert actual.names == expected.names
+    for name in (
+        "image_ids",
+        "file_names",
+        "widths",
+        "heights",
+        "offsets",
+        "ann_ids",
+        "category_ids",
+        "classes",
+        "areas",
+        "boxes",
+    ):
+        expected_values = getattr(expected, name)
+        actual_values = getattr(actual, name)
+        assert actual_values.dtype == expected_values.dtype, name
+        np.testing.assert_array_equal(actual_values, expected_values, name)
@@ -0,0 +1,46 @@
+"""Staleness checks of the resized training image cache."""
+
+import os
+
+import numpy as np
+import pytest
+
+from autonomous_vision.config import Config
+
+cv2 = pytest.importorskip("cv2")
+image_cache = pytest.importorskip(
+    "autonomous_vision.object_detection.image_cache"
+)
+
+
+def _write_image(path, value: int) -> None:
+    cv2.imwrite(str(path), np.full((72, 128, 3), value, dtype=np.uint8))
+
+
+def test_source_rewritten_in_place_is_recached(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "image_cache_dir", tmp_path / "cache")
+    monkeypatch.setattr(Config, "image_index_dir", tmp_path / "index")
+    images, labels = tmp_path / "images", tmp_path / "labels"
+    images.mkdir()
+    labels.mkdir()
+    for name in ("a.jpg", "b.jpg"):
+        _write_image(images / name, 0)
+    # Old enough that the image index trusts the directory mtime
+    hour_ago = (images.stat().st_mtime_ns - 3600 * 10**9,) * 2
+    os.utime(images, ns=hour_ago)
+
+    out_dir = image_cache.build_image_cache(images, labels, "train", 64, 1)
+    assert cv2.imread(str(out_dir / "a.jpg")).mean() < 8
+
+    # Rewritten in place: the directory entries and mtime stay the same
+    source_stat = (images / "a.jpg").stat()
+    _write_image(images / "a.jpg", 255)
+    os.utime(
+        images / "a.jpg",
+        ns=(source_stat.st_atime_ns, source_stat.st_mtime_ns + 10**9),
+    )
+    os.utime(images, ns=hour_ago)
+
+    image_cache.build_image_cache(images, labels, "train", 64, 1)
+    assert cv2.imread(str(out_dir / "a.jpg")).mean() > 247
+    assert cv2.imread(str(out_dir / "b.jpg")).mean() < 8
@@ -0,0 +1,46 @@
+"""Staleness checks of the build manifest."""
+
+import os
+
+import pytest
+
+from autonomous_vision.data_parser.manifest import Manifest
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    """A hive-partitioned output directory recorded as fresh."""
+    root = tmp_path / "split=val"
+    for partition in ("timeofday=night", "timeofday=daytime"):
+        (root / partition).mkdir(parents=True)
+        (root / partition / "part-0.parquet").write_bytes(b"rows")
+    labels = tmp_path / "labels.json"
+    labels.write_text("[]")
+
+    manifest = Manifest(tmp_path / "manifest.json")
+    manifest.record("parser:val", [labels], {}, [root])
+    manifest.save()
+    return manifest, labels, root
+
+
+def _is_fresh(manifest: Manifest, labels, root) -> bool:
+    return Manifest(manifest.path).is_fresh("parser:val", [labels], {}, [root])
+
+
+def test_unchanged_dataset_is_fresh(dataset):
+    assert _is_fresh(*dataset)
+
+
+def test_deleted_nested_partition_file_is_stale(dataset):
+    manifest, labels, root = dataset
+    (root / "timeofday=night" / "part-0.parquet").unlink()
+    assert not _is_fresh(manifest, labels, root)
+
+
+def test_modified_nested_partition_file_is_stale(dataset):
+    manifest, labels, root = dataset
+    part = root / "timeofday=daytime" / "part-0.parquet"
+    stat = part.stat()
+    part.write_bytes(b"ROWS")
+    os.utime(part, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert not _is_fresh(manifest, labels, root)
@@ -0,0 +1,43 @@
+"""Tie handling of the greedy detection matching."""
+
+import numpy as np
+
+from autonomous_vision.object_detection.matching import (
+    DUPLICATE,
+    MISSED,
+    TP,
+    match_detections,
+)
+
+
+def test_iou_ties_go_to_the_last_box():
+    box = [10.0, 10.0, 50.0, 40.0]
+    result = match_detections(
+        pred_image=[0, 0],
+        pred_boxes=[box, box],
+        pred_classes=[0, 0],
+        pred_scores=[0.9, 0.8],
+        gt_image=[0, 0, 0],
+        gt_boxes=[[0.0, 0.0, 5.0, 5.0], box, box],
+        gt_classes=[0, 0, 0],
+    )
+    # As pycocotools: the best prediction takes the last of the tied
+    # boxes, the next one the remaining tied box
+    np.testing.assert_array_equal(result.pred_gt, [2, 1])
+    np.testing.assert_array_equal(result.pred_label, [TP, TP])
+    np.testing.assert_array_equal(result.gt_label, [MISSED, TP, TP])
+
+
+def test_duplicate_points_at_the_last_tied_box():
+    box = [10.0, 10.0, 50.0, 40.0]
+    result = match_detections(
+        pred_image=[0, 0, 0],
+        pred_boxes=[box, box, box],
+        pred_classes=[0, 0, 0],
+        pred_scores=[0.9, 0.8, 0.7],
+        gt_image=[0, 0],
+        gt_boxes=[box, box],
+        gt_classes=[0, 0],
+    )
+    np.testing.assert_array_equal(result.pred_label, [TP, TP, DUPLICATE])
+    np.testing.assert_array_equal(result.pred_gt, [1, 0, 1])